@@ -0,0 +1,120 @@
+# Description: A full-page cache for the front page and public galleries, which most visitors see logged out and which are the same for every logged-out visitor.
+# A page is cached under its path and querystring and the variants which logged-out visitors can choose between: night mode, the mobile play button, and the
+# image types their browsers accept. A fresh page is served straight from the cache. A page which is older than settings.ANONYMOUS_PAGE_CACHE['FRESH_SECONDS'],
+# or which was rendered before the latest upload was saved or deleted, is stale: the first request for it renders it again, and the requests which arrive while
+# it's being rendered are given the stale page instead of rendering it too. A page which isn't cached at all is rendered by the first request. The requests
+# which arrive meanwhile wait a fraction of a second, COLD_WAIT_SECONDS, in case it's almost done, and then render it themselves, so that a burst of requests
+# after the cache is emptied doesn't hold every worker thread while one renders. The CSRF tokens of the page's forms are removed before it's stored and each visitor's own token is
+# put in when it's served. The view's hit count is still incremented for cached pages, after the response has been sent. Logged-in users, and logged-out users
+# with a saved search on the front page, always get the view's own response.
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from functools import wraps
+import hashlib
+import re
+import time
+from Meowseum.models import VersionStamp
+from Meowseum.common_view_functions import DeferredHitCount
+from Meowseum.context_processors import get_night_mode_status, get_mobile_play_button_status, get_accepted_image_types
+
+# The response headers which aren't stored, because they're different for each visitor. The ETag is set again by the condition() decorator, and the length
+# changes when the CSRF tokens are put in.
+UNCACHED_HEADERS = ('set-cookie', 'etag', 'content-length')
+# The value of each {% csrf_token %} field, and what it's replaced with in the cache.
+CSRF_TOKEN_FIELD = re.compile(br'''(name=['"]csrfmiddlewaretoken['"] value=['"])[A-Za-z0-9]+''')
+CSRF_TOKEN_PLACEHOLDER = b'CSRF_TOKEN_PLACEHOLDER'
+# How often a request waiting for another worker to render an uncached page checks the cache.
+COLD_WAIT_INTERVAL = 0.05
+
+# 0. Decorator for a view. hit_count_name is the name the view passes to increment_hit_count(), and the view's keyword arguments are passed as its arguments.
+def anonymous_page_cache(hit_count_name):
+    def decorator(view):
+        @wraps(view)
+        def wrapped_view(request, *args, **kwargs):
+            if not page_can_be_cached(request):
+                return view(request, *args, **kwargs)
+            cache = caches[settings.ANONYMOUS_PAGE_CACHE['CACHE']]
+            key = get_cache_key(request)
+            generation = get_generation()
+            entry = cache.get(key)
+            has_lock = False
+            if entry == None:
+                # The worker which adds the lock renders and caches the page. The others wait briefly for it, and then render it without caching it.
+                has_lock = cache.add(key + ':lock', True, settings.ANONYMOUS_PAGE_CACHE['REGENERATION_LOCK_SECONDS'])
+                if not has_lock:
+                    entry = wait_for_cache_entry(cache, key)
+                    if entry != None:
+                        return get_cached_response(request, entry, hit_count_name, list(kwargs.values()) or None)
+            else:
+                is_fresh = entry['generation'] == generation and time.time() - entry['created'] < settings.ANONYMOUS_PAGE_CACHE['FRESH_SECONDS']
+                if not is_fresh:
+                    # Only the worker which adds the lock renders the page again.
+                    has_lock = cache.add(key + ':lock', True, settings.ANONYMOUS_PAGE_CACHE['REGENERATION_LOCK_SECONDS'])
+                if is_fresh or not has_lock:
+                    return get_cached_response(request, entry, hit_count_name, list(kwargs.values()) or None)
+            try:
+                response = view(request, *args, **kwargs)
+                if has_lock and response.status_code == 200 and not response.streaming:
+                    cache.set(key, get_cache_entry(request, response, generation),
+                              settings.ANONYMOUS_PAGE_CACHE['FRESH_SECONDS'] + settings.ANONYMOUS_PAGE_CACHE['STALE_SECONDS'])
+            finally:
+                if has_lock:
+                    cache.delete(key + ':lock')
+            return response
+        return wrapped_view
+    return decorator
+
+# 0.1. Wait for another worker to cache a page. Input: cache, key. Output: The cache entry, or None if the page wasn't cached within COLD_WAIT_SECONDS.
+def wait_for_cache_entry(cache, key):
+    deadline = time.time() + settings.ANONYMOUS_PAGE_CACHE['COLD_WAIT_SECONDS']
+    while time.time() < deadline:
+        time.sleep(COLD_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry != None:
+            return entry
+    return None
+
+# 1. Return True if the request is for a page which is the same for every logged-out visitor.
+def page_can_be_cached(request):
+    return settings.ANONYMOUS_PAGE_CACHE['ENABLED'] and request.method in ('GET', 'HEAD') and not request.user.is_authenticated \
+           and 'saved_search' not in request.session
+
+# 2. Return the cache key for the page and its variant.
+def get_cache_key(request):
+    parts = [request.get_full_path(),
+             str(get_night_mode_status(request)),
+             str(get_mobile_play_button_status(request)),
+             ','.join(get_accepted_image_types(request))]
+    return 'anonymous_page:' + hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+# 3. Return the number of times an upload has been saved or deleted, which signals.py counts in the 'uploads' version stamp. A page rendered under an earlier
+# number is stale.
+def get_generation():
+    return VersionStamp.objects.filter(name='uploads').values_list('version', flat=True).first() or 0
+
+# 4. Store the parts of the response which are the same for every visitor, along with the gallery which the view stored in the session for the slide page's
+# arrows, so that a visitor who is given the cached page can navigate it the same way. The CSRF tokens belong to the visitor whose request rendered the page.
+def get_cache_entry(request, response, generation):
+    return {'content': CSRF_TOKEN_FIELD.sub(br'\1' + CSRF_TOKEN_PLACEHOLDER, response.content),
+            'status': response.status_code,
+            'headers': [(header, value) for header, value in response.items() if header.lower() not in UNCACHED_HEADERS],
+            'current_gallery': request.session.get('current_gallery'),
+            'generation': generation,
+            'created': time.time()}
+
+# 5. Build a response from a cache entry, with the visitor's own CSRF token in its forms. The page's AJAX requests send the token from the forms, and get_token()
+# also makes sure the visitor has the CSRF cookie it's checked against, which rendering the page would have set.
+def get_cached_response(request, entry, hit_count_name, hit_count_args):
+    response = HttpResponse(entry['content'].replace(CSRF_TOKEN_PLACEHOLDER, get_token(request).encode('ascii')), status=entry['status'])
+    for header, value in entry['headers']:
+        response[header] = value
+    if request.session.get('current_gallery') != entry['current_gallery']:
+        request.session['current_gallery'] = entry['current_gallery']
+    if 'random' in request.session:
+        del request.session['random']
+    # Count the hit after the response has been sent, so the hit count's queries don't delay the page.
+    response._closable_objects.append(DeferredHitCount(request, hit_count_name, hit_count_args))
+    return response
@@ -8,17 +8,24 @@ from django.core.urlresolvers import reverse, NoReverseMatch
 from urllib.parse import urlencode as original_urlencode
 from urllib.parse import quote
 from django.http import HttpResponse, HttpResponseRedirect, HttpResponsePermanentRedirect
+from django.core.exceptions import PermissionDenied
 import json
 from django.http.request import QueryDict
 from collections import OrderedDict
 from django.utils.datastructures import MultiValueDict
 from hitcount.models import HitCount
 from hitcount.views import HitCountMixin
-from Meowseum.models import Upload, Page, Like, hosting_limits_for_Upload
+from Meowseum.models import Upload, Page, Like, VersionStamp, hosting_limits_for_Upload
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 import datetime
-from django.db.models import Count
+from django.db.models import Count, F
+import hashlib
+from Meowseum.context_processors import get_night_mode_status, get_mobile_play_button_status, get_accepted_image_types
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+from django.views.decorators.cache import cache_control
 from django.utils import timezone
+from functools import wraps
 
 # Section 1. Utility functions for general Python programming.
 
@@ -151,6 +158,16 @@ def increment_hit_count(request, name, args=None):
     hit_count_response = HitCountMixin.hit_count(request, hit_count)
     return
 
+# An object which increments a page's hit count when it's closed. Django closes the objects in a response's _closable_objects after the response has been sent,
+# so appending one there counts a hit without running the view or delaying the response.
+class DeferredHitCount(object):
+    def __init__(self, request, name, args):
+        self.request = request
+        self.name = name
+        self.args = args
+    def close(self):
+        increment_hit_count(self.request, self.name, self.args)
+
 # Input: request. records, a collection of records such as a queryset or list. records_per_page, an optional integer which defaults to 25.
 # Output: paginated_records, a paginated collection of records.
 def paginate_records(request, records, records_per_page=25):
@@ -167,6 +184,19 @@ def paginate_records(request, records, records_per_page=25):
 # Section 3. Site functions. The sorting functions are used by gallery pages which specifically use the sorting order, and they're included here because in the
 # future they'll be an option in the advanced search menu.
 
+# This function returns the upload that a category page like adoption_upload is adding information to. This is the logged-in user's most recent upload, unless the
+# querystring names one of the user's uploads with 'upload', its relative URL. The links after a batch upload use this to list each file for adoption.
+# Input: request. Output: upload. Raises PermissionDenied if the user hasn't submitted a file yet or the upload isn't the user's.
+def get_upload_being_submitted(request):
+    upload_queryset = Upload.objects.filter(uploader=request.user)
+    relative_url = request.GET.get('upload', '')
+    if relative_url != '':
+        upload_queryset = upload_queryset.filter(relative_url=relative_url)
+    upload = upload_queryset.order_by('-id').first()
+    if upload == None:
+        raise PermissionDenied
+    return upload
+
 # This function filters out private uploads and uploads from muted users. This function is used by any view which displays a gallery, including the search page.
 # Input: logged_in_user (request.user). Output: upload_queryset.
 def get_public_unmuted_uploads(logged_in_user):
@@ -204,7 +234,11 @@ def render_upload_gallery(request, uploads, context):
     context['upload_directory'] = Upload.UPLOAD_TO
     context['thumbnail_directory'] = hosting_limits_for_Upload['thumbnail'][2]
     context['poster_directory'] = hosting_limits_for_Upload['poster_directory']
-    return render(request, 'en/public/gallery.html', context)
+    context['hover_preview_directory'] = hosting_limits_for_Upload['hover_preview'][2]
+    response = render(request, 'en/public/gallery.html', context)
+    # The format of the video posters depends on the image types listed in the browser's Accept header.
+    patch_vary_headers(response, ('Accept',))
+    return response
 
 # 1. For the gallery currently being viewed, store a list of unique upload relative URLs into session storage. This will allow the user to be able to navigate between
 # uploads after visiting another page. The function also switches off a "random browsing" flag in session storage enabled by the random upload page.
@@ -219,3 +253,64 @@ def store_gallery_upload_relative_urls(request, uploads):
     if 'random' in request.session:
         # Delete a session storage variable that is used by the slide page to indicate that the user came from the "Random upload" page.
         del request.session['random']
+
+# Section 4. Conditional GET. The slide page and galleries send an ETag made from version stamps, so that when the browser asks whether its copy is still current,
+# with If-None-Match, the page can be answered with 304 Not Modified from one query instead of being rendered again. Use these functions with Django's
+# condition() decorator, as in @condition(etag_func=get_gallery_etag). Last-Modified isn't sent, because a date can't tell apart the versions of a page which
+# differ by session settings, like night mode, so a browser which only sent If-Modified-Since could be given the wrong one.
+
+# 0. Increment the version stamps with the given names. signals.py calls this whenever a record shown by the pages changes.
+# Input: names, a list of version stamp names. Output: None.
+def bump_version_stamps(names):
+    for name in names:
+        if VersionStamp.objects.filter(name=name).update(version=F('version') + 1) == 0:
+            VersionStamp.objects.get_or_create(name=name, defaults={'version': 1})
+
+# 1. Return the ETag of a slide page. Input: request, relative_url. Output: A string.
+def get_slide_page_etag(request, relative_url):
+    return get_etag(request, ['upload:' + relative_url])
+
+# 2. Return the ETag of a gallery. Every gallery shares a version stamp, because almost any change to an upload, like, or tag can change the order or content of
+# one. Input: request, and the view's arguments. Output: A string.
+def get_gallery_etag(request, *args, **kwargs):
+    return get_etag(request, ['galleries'])
+
+# 2.1. Decorate a gallery view so that it answers a matching If-None-Match header with 304 Not Modified. Galleries differ for each viewer, so only the browser
+# may keep a copy, and it has to check the ETag before using it. hit_count_name is the name the view passes to increment_hit_count().
+def gallery_conditional_get(hit_count_name):
+    def decorator(view):
+        return count_hit_when_not_modified(hit_count_name)(cache_control(private=True, no_cache=True)(condition(etag_func=get_gallery_etag)(view)))
+    return decorator
+
+# 2.2. Decorate a view wrapped with condition(), so that a 304 Not Modified response, which doesn't run the view, is still counted as a hit of the page. The view's
+# keyword arguments are passed to increment_hit_count() as its arguments.
+def count_hit_when_not_modified(hit_count_name):
+    def decorator(view):
+        @wraps(view)
+        def wrapped_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if response.status_code == 304:
+                response._closable_objects.append(DeferredHitCount(request, hit_count_name, list(kwargs.values()) or None))
+            return response
+        return wrapped_view
+    return decorator
+
+# 3. Combine the version stamps with the state of the viewer which the page depends on. This includes the settings from context_processors.settings_variables,
+# the session's gallery and saved search, which decide the slide page's arrows and the front page, and the CSRF cookie, which the page's forms are signed with.
+# The hour is included so that relative times like "46 minutes ago" and the week of likes counted by trending galleries are never more than an hour out of date.
+# Input: request, names, a list of version stamp names. Output: The ETag, a string.
+def get_etag(request, names):
+    if request.user.is_authenticated:
+        names = names + ['user:' + str(request.user.id)]
+    versions = dict(VersionStamp.objects.filter(name__in=names).values_list('name', 'version'))
+    parts = [name + '=' + str(versions.get(name, 0)) for name in names]
+    parts = parts + [str(request.user.id),
+                     str(get_night_mode_status(request)),
+                     str(get_mobile_play_button_status(request)),
+                     ','.join(get_accepted_image_types(request)),
+                     repr(request.session.get('current_gallery')),
+                     repr(request.session.get('random')),
+                     repr(request.session.get('saved_search')),
+                     request.META.get('CSRF_COOKIE', ''),
+                     timezone.now().strftime('%Y-%m-%d %H')]
+    return hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
@@ -1,6 +1,8 @@
 # Description: This file is for setting custom sitewide template variables. These variables will be available in every template without first having to define them in a view.
 # The top-level functions are referenced by settings.py.
 
+from django.conf import settings
+
 # Define variables that will always be the same throughout the site.
 def constant_variables(request):
     # The app_name variable will save a lot of work if the developer decides to rename the app, because it appears in page titles, the footer, etc.
@@ -10,7 +12,8 @@ def constant_variables(request):
 
 # 0. Define variables related to site settings.
 def settings_variables(request):
-    return {'night_mode':get_night_mode_status(request),  'mobile_GIFs_are_playing': get_mobile_play_button_status(request)}
+    return {'night_mode':get_night_mode_status(request),  'mobile_GIFs_are_playing': get_mobile_play_button_status(request),
+            'accepted_image_types': get_accepted_image_types(request)}
 
 # 1. Detect whether night mode is on.
 # Input: request. Output: night_mode, a Boolean value for whether night mode is on.
@@ -27,3 +30,10 @@ def get_mobile_play_button_status(request):
         return False
     else:
         return True
+
+# 3. Determine which of the rendition formats, such as WebP, the browser accepts. Browsers which support these formats list them in the Accept header when requesting a page.
+# Images use <picture> so that the browser can choose for itself, but a <video> poster can only have one URL, so the template uses this list to choose the poster's format.
+# Input: request. Output: accepted_image_types, a list of MIME types.
+def get_accepted_image_types(request):
+    accept_header = request.META.get('HTTP_ACCEPT', '')
+    return [mime_type for mime_type in settings.RENDITION_TYPES_AND_PREFERRED_EXTENSIONS if mime_type in accept_header]
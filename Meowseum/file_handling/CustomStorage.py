@@ -10,12 +10,17 @@
 # use UNIX command line. For example, if a program used the command "cat <filename>" without putting the file name in quotes, then it could interpret
 # the parts after the first space as being related to commands. Second, ALLOW_NON_UNICODE_ALPHANUMERIC=False by default. This setting allows accented characters, CJK characters,
 # and dashes and dots. Setting ALLOW_NON_UNICODE_ALPHANUMERIC=True will also let @, #, etc. through, but not anything disallowed by common file systems.
+#
+# When CONTENT_ADDRESSED_STORAGE=True, uploads are stored under the SHA-256 hash of the processed file instead of a name based on the title, and the human-readable
+# name is only kept in Upload.relative_url. Changing the title then only updates the database, identical files are stored once, and the hash's first two pairs of
+# digits are used as subdirectories, so that the upload directories don't grow into single directories with hundreds of thousands of files.
 
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
 import re
 import os
 from django.utils.encoding import force_text
+from Meowseum.file_handling.perceptual_hash import get_file_hash
 
 class CustomStorage(FileSystemStorage):
     def __init__(self, *args, **kwargs):
@@ -59,3 +64,14 @@ def get_valid_file_name(full_file_name):
     else:
         return name+extension
 
+
+# Return the content-addressed name of a file, excluding the extension, in the form 3f/a2/3fa2...e1. The name includes the subdirectories, so it can be
+# used in place of a title-based file name in the paths to the file, its thumbnail, its posters, and its HLS directory.
+# Input: file_path. Output: string
+def get_content_addressed_file_name(file_path):
+    digest = get_file_hash(file_path)
+    return digest[0:2] + '/' + digest[2:4] + '/' + digest
+
+# Return True if a file name, excluding the extension, is content-addressed. Uploads from before CONTENT_ADDRESSED_STORAGE was enabled keep their title-based names.
+def is_content_addressed_file_name(file_name):
+    return re.match(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}$', file_name) != None
@@ -0,0 +1,41 @@
+# Description: Find an existing upload which an uploaded file duplicates, before the file is processed. Exact duplicates are found by the indexed content_hash column.
+# Near duplicates are found by searching a BK-tree of the perceptual hashes of existing uploads. Each process builds the tree once, then only adds the Metadata
+# records created since its last search, so a search takes milliseconds instead of comparing the hash to every upload. Records from deleted uploads may remain
+# in the tree, so the matches are looked up in the database before one is returned.
+
+from django.db.models import Q
+from Meowseum.models import Metadata
+from Meowseum.file_handling.perceptual_hash import BKTree, to_unsigned_64
+
+perceptual_hash_index = BKTree()
+# The ID of the last Metadata record added to the tree.
+last_indexed_id = 0
+
+# 0. Main function. Return the existing upload which is the closest match for the new file, and whether it's an exact duplicate. Only a content hash match is
+# exact. A perceptual hash match is a near duplicate even at distance 0, because a re-encoded or resized copy can have the same perceptual hash as the original
+# while its bytes differ. If there isn't a match, then return (None, False). Only uploads that the user can see are matched, so that the user isn't sent a
+# link to someone else's unlisted upload.
+# Input: metadata dictionary with 'content_hash' and 'perceptual_hash' keys. max_distance, an int. user, the uploader.
+def find_duplicate_upload(metadata, max_distance, user):
+    visible_metadata_records = Metadata.objects.filter(Q(upload__is_publicly_listed=True) | Q(upload__uploader=user)).select_related('upload')
+    if metadata.get('content_hash', '') != '':
+        exact_duplicate = visible_metadata_records.filter(content_hash=metadata['content_hash']).order_by('id').first()
+        if exact_duplicate != None:
+            return exact_duplicate.upload, True
+    if metadata.get('perceptual_hash') != None:
+        matches = get_perceptual_hash_index().search(to_unsigned_64(metadata['perceptual_hash']), max_distance)
+        if len(matches) > 0:
+            metadata_records = visible_metadata_records.in_bulk([metadata_id for distance, metadata_id in matches])
+            for distance, metadata_id in matches:
+                if metadata_id in metadata_records:
+                    return metadata_records[metadata_id].upload, False
+    return None, False
+
+# 1. Return the BK-tree, after adding the perceptual hashes of any Metadata records created since it was last used.
+def get_perceptual_hash_index():
+    global last_indexed_id
+    new_records = Metadata.objects.filter(id__gt=last_indexed_id, perceptual_hash__isnull=False).order_by('id').values_list('id', 'perceptual_hash')
+    for metadata_id, perceptual_hash in new_records:
+        perceptual_hash_index.add(to_unsigned_64(perceptual_hash), metadata_id)
+        last_indexed_id = metadata_id
+    return perceptual_hash_index
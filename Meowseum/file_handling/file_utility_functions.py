@@ -1,24 +1,61 @@
-# Description: These are functions related to processing files that are used in more than one location throughout the site.
+# Description: These are functions related to processing files that are used in more than one location throughout the site. The functions for moving and removing
+# files work with names in media storage, like 'uploads/posters/cat.jpg', so that they work with any media storage backend.
 
 import os
 import string
 import random
+from django.conf import settings
 from Meowseum.models import Upload, Metadata
+from Meowseum.file_handling.media_storage import get_media_storage
 
-# A. Try to rename or move the file if it exists at the specified location. Do nothing if the file is not there. This is easier than testing for the conditions
-# that would lead to a file existing at the source path, such as testing the dimensions of a file for whether it has a thumbnail.
-def move_file(source_path, destination_path):
-    try:
-        os.rename(source_path, destination_path)
-    except FileNotFoundError:
-        pass
+# A. Try to move a file made during processing from the local stage 2 directory into media storage, if it exists at the specified location. Do nothing if the file
+# is not there. This is easier than testing for the conditions that would lead to a file existing at the source path, such as testing the dimensions of a file for
+# whether it has a thumbnail. With content-addressed storage, a file that already exists at the destination has the same contents, so it is replaced.
+def move_file(source_path, destination_name):
+    if os.path.exists(source_path):
+        get_media_storage().save_file(source_path, destination_name)
 
-# B. Try to remove the file if it exists at the specified location.
-def remove_file(path):
-    try:
-        os.remove(path)
-    except FileNotFoundError:
-        pass
+# A.1. Move the renditions saved alongside a file, such as the WebP copy of an image, so that they follow the file into media storage.
+# Input: The local path to the file from which the renditions were made, and its name in media storage. The extensions are ignored.
+def move_renditions(source_path, destination_name):
+    extless_source_path = os.path.splitext(source_path)[0]
+    extless_destination_name = os.path.splitext(destination_name)[0]
+    for extension in settings.RENDITION_TYPES_AND_PREFERRED_EXTENSIONS.values():
+        move_file(extless_source_path + extension, extless_destination_name + extension)
+
+# A.2. Move a local directory and the files within it, such as a video's HLS ladder, into media storage if the directory exists.
+def move_directory(source_path, destination_name):
+    if os.path.isdir(source_path):
+        get_media_storage().save_directory(source_path, destination_name)
+
+# A.3. Rename a file in media storage, if it exists.
+def rename_stored_file(old_name, new_name):
+    get_media_storage().move(old_name, new_name)
+
+# A.4. Rename the renditions saved alongside a file in media storage.
+def rename_stored_renditions(old_name, new_name):
+    extless_old_name = os.path.splitext(old_name)[0]
+    extless_new_name = os.path.splitext(new_name)[0]
+    for extension in settings.RENDITION_TYPES_AND_PREFERRED_EXTENSIONS.values():
+        rename_stored_file(extless_old_name + extension, extless_new_name + extension)
+
+# A.5. Rename a directory in media storage, if it exists.
+def rename_stored_directory(old_name, new_name):
+    get_media_storage().move_directory(old_name, new_name)
+
+# B. Try to remove the file from media storage if it exists.
+def remove_file(name):
+    get_media_storage().delete(name)
+
+# B.1. Remove any renditions saved alongside a file.
+def remove_renditions(name):
+    extless_name = os.path.splitext(name)[0]
+    for extension in settings.RENDITION_TYPES_AND_PREFERRED_EXTENSIONS.values():
+        remove_file(extless_name + extension)
+
+# B.2. Remove a directory and all the files within it from media storage, if it exists.
+def remove_directory(name):
+    get_media_storage().delete_directory(name)
 
 # C.0. This is a higher order function which accepts a string and a Boolean function object. The function object will test whether the string is
 # unique for a field in the database. If it is unique, the funcion returns the string, and if it isn't, the function returns the string with an
@@ -3,6 +3,7 @@
 from django.conf import settings
 import os
 from Meowseum.file_handling.get_metadata import get_metadata
+from Meowseum.file_handling.perceptual_hash import get_file_hash, get_perceptual_hash
 # These two import statements are for saving a temporary file.
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
@@ -60,6 +61,10 @@ def validate_file(uploaded_file, validation_specifications):
         if 'max_size' in validation_specifications:
             validate_size(temporary_file_path, metadata, validation_specifications['max_size'])
         if 'width' in metadata and 'height' in metadata:
+            if 'max_pixels' in validation_specifications and metadata['width'] * metadata['height'] > validation_specifications['max_pixels']:
+                default_storage.delete(temporary_file_path)
+                raise ValidationError("Error: The "+metadata['motion_type']+" has more than our processing limit of "+\
+                                      str(validation_specifications['max_pixels'] // 1000000)+" megapixels.")
             if 'exact_width' in validation_specifications and 'exact_height' in validation_specifications:
                 if metadata['width'] != validation_specifications['exact_width'] or metadata['height'] != validation_specifications['exact_height']:
                     default_storage.delete(temporary_file_path)
@@ -89,6 +94,10 @@ def validate_file(uploaded_file, validation_specifications):
         if 'fps' in metadata and 'max_fps' in validation_specifications and metadata['fps'] > validation_specifications['max_fps']:
             default_storage.delete(temporary_file_path)
             raise ValidationError('Error: The file has a frame rate higher than the maximum of' + validation_specifications['max_fps'] + '.')
+        if 'duplicate_distance' in validation_specifications:
+            # Hash the valid file while the temporary copy exists, so that duplicates can be found before the file is processed.
+            metadata['content_hash'] = get_file_hash(temporary_file_path)
+            metadata['perceptual_hash'] = get_perceptual_hash(temporary_file_path, metadata)
     # Delete the temporary copy used during validation.
     default_storage.delete(temporary_file_path)
     return metadata
@@ -109,7 +118,18 @@ def temporarily_save_file(uploaded_file):
     # Renaming the temporary file is the simplest solution, and other than this situation, the file names fully support Unicode. 
     temp_path = str(temp_path.encode('ascii','ignore')) # For the given example file name, this returns "b'Koka_v_krmtku_2.jpg'".
     temp_path = temp_path[2:len(temp_path)-1]
-    default_storage.save(temp_path, ContentFile(uploaded_file.file.read()))
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        # Large files and resumable uploads are already on disk. Link to the file instead of reading all of it into memory to copy it. A link can't cross
+        # file systems, such as from the system's temporary directory, so in that case the file is copied.
+        temp_path = default_storage.get_available_name(temp_path)
+        full_temp_path = os.path.join(settings.MEDIA_PATH, temp_path)
+        os.makedirs(os.path.dirname(full_temp_path), exist_ok=True)
+        try:
+            os.link(uploaded_file.temporary_file_path(), full_temp_path)
+            return full_temp_path
+        except OSError:
+            pass
+    temp_path = default_storage.save(temp_path, ContentFile(uploaded_file.file.read()))
     full_temp_path = os.path.join(settings.MEDIA_PATH, temp_path)
     return full_temp_path
 
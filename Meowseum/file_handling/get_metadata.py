@@ -47,16 +47,19 @@ def get_metadata(uploaded_file, temporary_file_path):
 
 # 1. Return the MIME type for the file.
 def get_mime_type(temporary_file_path):
-    if os.name == 'nt':
-        python_magic = magic.Magic(magic_file=settings.WINDOWS_MAGIC_PATH, mime=True)
-    else:
-        # On UNIX, the python_magic module is able to find the location of the data library automatically.
-        python_magic = magic.Magic(mime=True)
-    mime_type = python_magic.from_file(temporary_file_path)
+    mime_type = get_python_magic().from_file(temporary_file_path)
     if mime_type == 'application/ogg' or mime_type=='application/octet-stream':
         mime_type = doubleCheckValidityWithMediaInfo(temporary_file_path, mime_type)
     return mime_type
 
+# 1.0.1. Return a python-magic object which detects MIME types.
+def get_python_magic():
+    if os.name == 'nt':
+        return magic.Magic(magic_file=settings.WINDOWS_MAGIC_PATH, mime=True)
+    else:
+        # On UNIX, the python_magic module is able to find the location of the data library automatically.
+        return magic.Magic(mime=True)
+
 # 1.1. Use the pymediainfo (MediaInfo) module to double-check the validity of the file. Sometimes python-magic returned the MIME type for unknown
 # file types, 'application/octet-stream', despite having used a valid test file. This included .webm and .ogv files downloaded from Wikimedia Commons.
 # It returned a MIME type for unknown file types, 'application/octet-stream'. python-magic also sometimes detected their files as application/ogg, for
@@ -94,6 +97,8 @@ def get_image_metadata(temporary_file_path, metadata):
     image = Image.open(temporary_file_path)
     if metadata['mime_type'] == 'image/jpeg' and 'exif' in image.info:
         exif_data, metadata = get_exif_data(image.info['exif'], metadata)
+        # Keep the EXIF data in the database, because stage 2 processing removes it from the file for privacy.
+        metadata['exif_data'] = get_serializable_exif_data(exif_data)
     else:
         exif_data = None
     metadata = get_image_dimensions_and_orientation(image.size[0], image.size[1], metadata, exif_data)
@@ -101,8 +106,8 @@ def get_image_metadata(temporary_file_path, metadata):
     return metadata, number_of_frames
 
 # 2.1. Given the raw EXIF data from the image, translate everything possible into human-readable form. Pillow is unable to translate the values from
-# some tags, such as MakerNote or UserComment, which will still contain binary data. In addition to validation, I'll also use this function at some
-# point after I store each JPEG's raw EXIF data in a separate file, when I extend EXIF querying functionality. Input: data, the EXIF data as a byte
+# some tags, such as MakerNote or UserComment, which will still contain binary data. In addition to validation, the import_exif_data command uses this
+# function to read the raw EXIF data which older versions of the site stored in a separate file. Input: data, the EXIF data as a byte
 # sequence. metadata dictionary. Output: A dictionary of EXIF data.
 def get_exif_data(data, metadata):
     exif_data = {}
@@ -190,10 +195,48 @@ def decode_exif_value(tag_name, value):
             value = int(value)
     return value
 
+# 2.1.3. Convert the EXIF data into values which can be stored in a JSONField. Pillow represents EXIF fractions, like ExposureTime or the GPS coordinates,
+# as IFDRational objects or (numerator, denominator) tuples, and these are converted to floats. Byte strings that decode_exif_value() left as raw binary,
+# like MakerNote, are dropped, because they are specific to the camera manufacturer and can't be queried.
+# Input: exif_data dictionary. Output: dictionary
+def get_serializable_exif_data(exif_data):
+    serializable_exif_data = {}
+    for tag_name, value in exif_data.items():
+        value = get_serializable_exif_value(value)
+        if value is not None:
+            serializable_exif_data[tag_name] = value
+    return serializable_exif_data
+
+# 2.1.3.1. Input: An EXIF value. Output: The value as a JSON type, or None if it can't be represented.
+def get_serializable_exif_value(value):
+    if isinstance(value, dict):
+        return get_serializable_exif_data(value)
+    if isinstance(value, (bytes, bytearray)):
+        return None
+    if isinstance(value, str):
+        # Text fields from some cameras are padded with null characters, which PostgreSQL doesn't allow in JSON.
+        return value.replace('\x00', '').rstrip()
+    if isinstance(value, int):
+        return value
+    if hasattr(value, 'numerator') and hasattr(value, 'denominator'):
+        # IFDRational. A denominator of 0 means the value is unknown.
+        if value.denominator == 0:
+            return None
+        return float(value.numerator) / float(value.denominator)
+    if isinstance(value, float):
+        return value if value == value else None
+    if isinstance(value, tuple) and len(value) == 2 and all(isinstance(part, int) for part in value):
+        # Older versions of Pillow store rationals as (numerator, denominator) tuples.
+        return float(value[0]) / value[1] if value[1] != 0 else None
+    if isinstance(value, (tuple, list)):
+        values = [get_serializable_exif_value(part) for part in value]
+        return [part for part in values if part is not None]
+    return None
+
 # 2.2. Some cameras take photographs such that width is always the longest dimension, while storing the orientation of the camera. If necessary, this
-# file handling package will losslessly rotate the image and reset the EXIF orientation to 1, because web browsers ignore the EXIF orientation. So,
-# this function stores into 'original_exif_orientation' a number for the EXIF orientation, and it stores into 'width' and 'height' the value that will be used
-# after losslessly rotating the image later.
+# file handling package will rotate the image and remove the EXIF data, because web browsers ignore the EXIF orientation. So, this function stores
+# into 'original_exif_orientation' a number for the EXIF orientation, and it stores into 'width' and 'height' the value that will be used after
+# rotating the image later.
 # Input: file_width, file_height, exif_data dictionary, metadata dictionary
 # Output: metadata dictionary with width, height, and possibly 'original_exif_orientation' keys added
 def get_image_dimensions_and_orientation(file_width, file_height, metadata, exif_data=None):
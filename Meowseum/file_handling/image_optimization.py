@@ -0,0 +1,119 @@
+# Description: Save still images with the fewest bytes that still look the same. A fixed JPEG quality of 95 is far more than most photos need, and PNGs which are
+# kept as PNGs were saved with Pillow's default settings. Instead, each candidate encoding is decoded again and compared to the image with SSIM, the structural
+# similarity index, which scores how alike two images look from 0 to 1:
+# 1. A JPEG is saved at the lowest quality between 'min_jpeg_quality' and 'jpeg_quality' whose SSIM is at least 'target_ssim', found by binary search. It is
+# saved as a progressive JPEG with optimized Huffman tables, which are lossless and usually save a few percent more.
+# 2. A PNG is quantized to a palette of 256 colors, and the palette copy is used if its SSIM is at least 'target_ssim', which is always the case for a drawing
+# with 256 colors or fewer. Either way, the PNG is compressed at the highest zlib level.
+# SSIM is computed on the luminance, and on the alpha channel of images with transparency, because the eye is much less sensitive to errors in color.
+
+import numpy
+from io import BytesIO
+from PIL import Image
+
+# The constants used by SSIM to keep the ratios stable in flat areas, for 8-bit samples.
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+# SSIM is computed over blocks of this size, the same as a JPEG's DCT blocks.
+SSIM_BLOCK_SIZE = 8
+
+# 0. Main function. Save an image as a JPEG or PNG with the optimized encoding.
+# Input: image, path, image_format 'JPEG' or 'PNG', hosting_limits dictionary. max_file_size, an optional number of bytes, such as the size of the original file,
+# which the encoding must be smaller than to be saved.
+# Output: A dictionary with 'unoptimized_file_size', the size of the image saved the way it was before optimization, and 'jpeg_quality', the quality which was
+# chosen or None for a PNG. If the encoding wasn't smaller than max_file_size, the file isn't written and the output is None.
+def save_optimized_image(image, path, image_format, hosting_limits, max_file_size=None):
+    if image_format == 'JPEG':
+        data, jpeg_quality = encode_optimized_jpeg(image, hosting_limits)
+        unoptimized_file_size = len(encode_image(image, 'JPEG', quality=hosting_limits.get('jpeg_quality', 75)))
+    else:
+        data, jpeg_quality = encode_optimized_png(image, hosting_limits), None
+        unoptimized_file_size = len(encode_image(image, 'PNG'))
+    if max_file_size != None:
+        if len(data) >= max_file_size:
+            return None
+        unoptimized_file_size = max_file_size
+    with open(path, 'wb') as outfile:
+        outfile.write(data)
+    return {'unoptimized_file_size': unoptimized_file_size, 'jpeg_quality': jpeg_quality}
+
+# 1. Binary search for the lowest JPEG quality whose SSIM meets the target. SSIM increases with the quality, so each step halves the range. If even the highest
+# quality misses the target, which happens with noisy images, the highest quality is used.
+# Input: image in mode RGB, hosting_limits. Output: The encoded JPEG as bytes, and the quality.
+def encode_optimized_jpeg(image, hosting_limits):
+    low_quality = hosting_limits.get('min_jpeg_quality', 60)
+    high_quality = hosting_limits.get('jpeg_quality', 95)
+    reference = get_luminance(image)
+    best_data, best_quality = None, high_quality
+    while low_quality <= high_quality:
+        quality = (low_quality + high_quality) // 2
+        data = encode_image(image, 'JPEG', quality=quality, optimize=True, progressive=True)
+        if get_ssim(reference, get_luminance(Image.open(BytesIO(data)))) >= hosting_limits['target_ssim']:
+            best_data, best_quality = data, quality
+            high_quality = quality - 1
+        else:
+            low_quality = quality + 1
+    if best_data == None:
+        best_data = encode_image(image, 'JPEG', quality=best_quality, optimize=True, progressive=True)
+    return best_data, best_quality
+
+# 2. Try a palette copy of the image, and keep it if its SSIM meets the target and it is smaller than the full color PNG. Pillow can only quantize images with
+# transparency using the fast octree method. The highest zlib level is occasionally a few bytes larger than the default, so the smallest encoding is kept.
+# Input: image, hosting_limits. Output: The encoded PNG as bytes.
+def encode_optimized_png(image, hosting_limits):
+    best_data = min(encode_image(image, 'PNG'), encode_image(image, 'PNG', optimize=True), key=len)
+    if image.mode in ('RGB', 'RGBA'):
+        if image.mode == 'RGBA':
+            palette_image = image.quantize(256, method=2)
+        else:
+            palette_image = image.quantize(256)
+        if get_png_ssim(image, palette_image.convert(image.mode)) >= hosting_limits['target_ssim']:
+            data = encode_image(palette_image, 'PNG', optimize=True)
+            if len(data) < len(best_data):
+                best_data = data
+    return best_data
+
+# 2.1. Return the SSIM of a copy of an image, the lower of the luminance's and the alpha channel's.
+def get_png_ssim(image, image_copy):
+    ssim = get_ssim(get_luminance(image), get_luminance(image_copy))
+    if image.mode == 'RGBA':
+        ssim = min(ssim, get_ssim(numpy.asarray(image.split()[3], dtype=numpy.float32), numpy.asarray(image_copy.split()[3], dtype=numpy.float32)))
+    return ssim
+
+# 3. Compute the mean SSIM of two grayscale images of the same size. Each block's SSIM compares its mean, contrast, and structure. The blocks are measured twice,
+# aligned with a JPEG's blocks and offset by half a block, so that the edges between JPEG blocks, where blocking artifacts appear, are inside windows as well.
+# Input: Two 2D numpy arrays. Output: float from -1 to 1, where 1 means the images are identical.
+def get_ssim(reference, candidate):
+    half_block = SSIM_BLOCK_SIZE // 2
+    if min(reference.shape) < SSIM_BLOCK_SIZE + half_block:
+        # The image is too small for the offset blocks, so compare it as one window.
+        return float(get_window_ssim(reference, candidate, (0, 1)))
+    aligned_ssim = get_block_ssim(reference, candidate)
+    offset_ssim = get_block_ssim(reference[half_block:, half_block:], candidate[half_block:, half_block:])
+    return float((aligned_ssim.mean() + offset_ssim.mean()) / 2)
+
+# 3.1. Compute the SSIM of each block, by reshaping the image so that each block's pixels are on their own axes. Only whole blocks are measured.
+# Input: Two 2D numpy arrays. Output: A 2D numpy array with the SSIM of each block.
+def get_block_ssim(reference, candidate):
+    height = reference.shape[0] // SSIM_BLOCK_SIZE * SSIM_BLOCK_SIZE
+    width = reference.shape[1] // SSIM_BLOCK_SIZE * SSIM_BLOCK_SIZE
+    shape = (height // SSIM_BLOCK_SIZE, SSIM_BLOCK_SIZE, width // SSIM_BLOCK_SIZE, SSIM_BLOCK_SIZE)
+    return get_window_ssim(reference[:height, :width].reshape(shape), candidate[:height, :width].reshape(shape), (1, 3))
+
+# 3.2. Compute SSIM over windows, from the statistics of the pixels along the given axes.
+def get_window_ssim(x, y, axes):
+    mean_x, mean_y = x.mean(axis=axes), y.mean(axis=axes)
+    variance_x = (x * x).mean(axis=axes) - mean_x * mean_x
+    variance_y = (y * y).mean(axis=axes) - mean_y * mean_y
+    covariance = (x * y).mean(axis=axes) - mean_x * mean_y
+    return ((2 * mean_x * mean_y + SSIM_C1) * (2 * covariance + SSIM_C2)) / ((mean_x * mean_x + mean_y * mean_y + SSIM_C1) * (variance_x + variance_y + SSIM_C2))
+
+# 4. Return an image's luminance as a 2D numpy array. 32-bit floats take half the memory of 64-bit ones, which is plenty of precision for 8x8 blocks.
+def get_luminance(image):
+    return numpy.asarray(image.convert('L'), dtype=numpy.float32)
+
+# 5. Encode an image into bytes with Pillow's save options.
+def encode_image(image, image_format, **options):
+    output = BytesIO()
+    image.save(output, image_format, **options)
+    return output.getvalue()
@@ -0,0 +1,214 @@
+# Description: Open still images within a memory budget. A 10 MB file can decode into hundreds of megabytes of pixels, such as a 50 megapixel PNG of a drawing,
+# because Pillow stores most modes with 4 bytes per pixel. Every image that large is shrunk to max_dimensions anyway, so it doesn't need to be decoded at full size:
+# 1. The decoded size is estimated from the header, which Image.open() reads without decoding the pixels. An image within the budget is opened as before.
+# 2. A JPEG is downsampled during decoding with Image.draft(), which has libjpeg decode the DCT coefficients at 1/2, 1/4, or 1/8 scale.
+# 3. A non-interlaced, 8-bit PNG is decoded in horizontal strips. Each strip's scanlines are wrapped in a small PNG of their own, so that Pillow's C decoder still
+# does the unfiltering, then the strip is shrunk and pasted into the output, and only one strip is held at full resolution at a time.
+# 4. Any other image over the budget raises MemoryBudgetError without allocating the bitmap.
+# Decompression bombs, files with a huge number of pixels for their size, are rejected during validation by the 'max_pixels' key, before any of this happens.
+# The benchmark_image_processing command measures the peak memory of these paths.
+
+from PIL import Image
+from io import BytesIO
+import struct
+import zlib
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# The number of channels for each PNG color type: grayscale, RGB, palette, grayscale with alpha, and RGBA.
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# The chunks that have to be copied into each strip for it to decode with the same colors.
+PNG_COLOR_CHUNKS = (b'PLTE', b'tRNS', b'gAMA', b'sBIT')
+# The strips are shrunk to at most twice the requested size with a box filter, which only averages the pixels within each strip, so that there aren't seams
+# between strips. The caller shrinks the result the rest of the way with a higher quality filter.
+INTERMEDIATE_SCALE = 2
+
+# This exception is raised when an image can't be decoded within the memory budget.
+class MemoryBudgetError(IOError):
+    pass
+
+# 0. Main function. Open an image for shrinking to a size. If it would decode larger than the budget, return it already shrunk to between one and two times the size,
+# or a JPEG prepared to decode at a reduced scale.
+# Input: file_path, size, a (width, height) tuple in the image's stored orientation. memory_budget, a number of bytes.
+# Output: An Image object. Its size may be anywhere from the requested size to the full size.
+def open_image_within_memory_budget(file_path, size, memory_budget):
+    image = Image.open(file_path)
+    original_size = image.size
+    # The resized copy is made while the decoded image is still in memory, so allow for both.
+    if get_decoded_size(image) + get_decoded_size(image, size) <= memory_budget:
+        return image
+    if image.format == 'JPEG':
+        image.draft(image.mode, size)
+        decoded_size = get_decoded_size(image)
+        if 'progression' in image.info or 'progressive' in image.info:
+            # libjpeg keeps the coefficients of the whole image in memory to decode a progressive JPEG, which is 2 bytes for each sample at full size.
+            decoded_size += original_size[0] * original_size[1] * len(image.getbands()) * 2
+        if decoded_size <= memory_budget:
+            return image
+    elif image.format == 'PNG':
+        png_header = read_png_header(file_path)
+        if png_header != None:
+            return shrink_png_in_strips(file_path, png_header, size, memory_budget)
+    raise MemoryBudgetError("The " + str(original_size[0]) + "x" + str(original_size[1]) + " image can't be decoded within the memory budget of " +
+                            str(memory_budget // 1048576) + " MB.")
+
+# 1. Estimate the memory of an image's bitmap from its mode. Pillow stores 1-bit, grayscale, and palette images with 1 byte per pixel, 16-bit grayscale images with 2,
+# and all other modes with 4, including RGB.
+# Input: image, an Image object, which doesn't need to be loaded. size, an optional (width, height) tuple to estimate for instead of the image's size. Output: int
+def get_decoded_size(image, size=None):
+    if size == None:
+        size = image.size
+    if image.mode in ('1', 'L', 'P'):
+        bytes_per_pixel = 1
+    elif image.mode.startswith('I;16'):
+        bytes_per_pixel = 2
+    else:
+        bytes_per_pixel = 4
+    return size[0] * size[1] * bytes_per_pixel
+
+# 2. Read the header of a PNG, along with the chunks that affect its colors. Return None if the PNG can't be decoded in strips: interlaced PNGs store their rows
+# out of order, and PNGs with 1, 2, 4, or 16 bits per channel don't have one byte per sample for the previous row to be copied from.
+# Output: A dictionary with 'width', 'height', 'color_type', 'channels', 'color_chunks', and 'data_offset', the position of the first IDAT chunk, or None.
+def read_png_header(file_path):
+    with open(file_path, 'rb') as infile:
+        if infile.read(8) != PNG_SIGNATURE:
+            return None
+        png_header = {'color_chunks': []}
+        while True:
+            chunk_start = infile.tell()
+            chunk_header = infile.read(8)
+            if len(chunk_header) < 8:
+                return None
+            length, chunk_type = struct.unpack('>I4s', chunk_header)
+            if chunk_type == b'IDAT':
+                png_header['data_offset'] = chunk_start
+                break
+            data = infile.read(length)
+            infile.read(4) # CRC
+            if chunk_type == b'IHDR':
+                width, height, bit_depth, color_type, compression, filter_method, interlace = struct.unpack('>IIBBBBB', data)
+                if bit_depth != 8 or interlace != 0 or color_type not in PNG_CHANNELS:
+                    return None
+                png_header.update({'width': width, 'height': height, 'color_type': color_type, 'channels': PNG_CHANNELS[color_type]})
+            elif chunk_type in PNG_COLOR_CHUNKS:
+                png_header['color_chunks'] = png_header['color_chunks'] + [(chunk_type, data)]
+    if 'width' not in png_header:
+        return None
+    return png_header
+
+# 3. Decode a PNG in horizontal strips and shrink each one into the output image, which is at most INTERMEDIATE_SCALE times the requested size.
+# The compressed data is inflated incrementally, so neither the file's data nor the inflated scanlines are held in memory all at once.
+# Input: file_path, png_header dictionary, size, memory_budget. Output: An Image object in mode L, RGB, or RGBA.
+def shrink_png_in_strips(file_path, png_header, size, memory_budget):
+    strip_shrinker = StripShrinker(png_header, size, memory_budget)
+    decompressor = zlib.decompressobj()
+    for data in read_png_image_data(file_path, png_header['data_offset']):
+        while True:
+            # Limit how much is inflated at a time, so that a small, highly compressed chunk can't inflate into more than one strip.
+            scanlines = decompressor.decompress(data, strip_shrinker.strip_length)
+            data = decompressor.unconsumed_tail
+            strip_shrinker.add_scanlines(scanlines)
+            if len(data) == 0 and len(scanlines) == 0:
+                break
+    strip_shrinker.add_scanlines(decompressor.flush())
+    if strip_shrinker.row_number < png_header['height']:
+        raise MemoryBudgetError("The PNG's image data ended after " + str(strip_shrinker.row_number) + " of its " + str(png_header['height']) + " rows.")
+    return strip_shrinker.output_image
+
+# 3.1. Yield the data of each IDAT chunk, starting from the first one.
+def read_png_image_data(file_path, data_offset):
+    with open(file_path, 'rb') as infile:
+        infile.seek(data_offset)
+        while True:
+            chunk_header = infile.read(8)
+            if len(chunk_header) < 8:
+                return
+            length, chunk_type = struct.unpack('>I4s', chunk_header)
+            if chunk_type != b'IDAT':
+                return
+            # Read large chunks in pieces, since some encoders write all of the image data as one chunk.
+            remaining_length = length
+            while remaining_length > 0:
+                data = infile.read(min(remaining_length, 1048576))
+                if len(data) == 0:
+                    return
+                remaining_length -= len(data)
+                yield data
+            infile.read(4) # CRC
+
+# 3.2. The state of decoding a PNG in strips: the inflated scanlines which haven't been decoded yet, the last row of the previous strip, and the output image.
+class StripShrinker(object):
+    def __init__(self, png_header, size, memory_budget):
+        self.png_header = png_header
+        self.width, self.height = png_header['width'], png_header['height']
+        self.output_size = (min(self.width, size[0] * INTERMEDIATE_SCALE), min(self.height, size[1] * INTERMEDIATE_SCALE))
+        # Each row is a filter type byte followed by the samples.
+        self.row_length = 1 + self.width * png_header['channels']
+        # The output image is allocated for the whole decode. Each row of a strip is held as inflated scanlines, up to two strips' worth while the next strip is
+        # being inflated, then as the small PNG, and as a 4 byte per pixel bitmap before and after cropping or conversion. The extra scanline and bitmap per row
+        # are an allowance for the decoder's and allocator's overhead. Each strip needs at least enough rows to make one row of the output.
+        output_length = self.output_size[0] * self.output_size[1] * 4
+        memory_per_row = 4 * self.row_length + 3 * self.width * 4
+        self.rows_per_strip = max((memory_budget - output_length) // memory_per_row, -(-self.height // self.output_size[1]), 1)
+        self.strip_length = self.rows_per_strip * self.row_length
+        self.scanlines = bytearray()
+        self.previous_row = None
+        self.row_number = 0
+        self.output_image = None
+    # Add inflated scanlines, then decode and shrink every complete strip. The last strip is complete when it has all of the remaining rows.
+    def add_scanlines(self, scanlines):
+        self.scanlines += scanlines
+        while self.row_number < self.height:
+            number_of_rows = min(self.rows_per_strip, self.height - self.row_number)
+            if len(self.scanlines) < number_of_rows * self.row_length:
+                break
+            strip_scanlines = memoryview(self.scanlines)[:number_of_rows * self.row_length]
+            strip = self.decode_strip(strip_scanlines, number_of_rows)
+            # The view has to be released before the bytearray can be resized.
+            strip_scanlines.release()
+            del self.scanlines[:number_of_rows * self.row_length]
+            self.paste_shrunk_strip(strip, number_of_rows)
+            self.row_number += number_of_rows
+    # Decode one strip by wrapping its scanlines in a PNG of their own. The Up, Average, and Paeth filters refer to the row above, so the last row of the
+    # previous strip is put first, unfiltered, and cropped off afterward.
+    def decode_strip(self, scanlines, number_of_rows):
+        has_previous_row = self.previous_row != None
+        if has_previous_row:
+            number_of_rows += 1
+        strip_png = BytesIO()
+        strip_png.write(PNG_SIGNATURE)
+        write_png_chunk(strip_png, b'IHDR', struct.pack('>IIBBBBB', self.width, number_of_rows, 8, self.png_header['color_type'], 0, 0, 0))
+        for chunk_type, data in self.png_header['color_chunks']:
+            write_png_chunk(strip_png, chunk_type, data)
+        # Level 0 stores the scanlines without compressing them again, which is much faster than the decoder is. The scanlines are compressed a piece at a time
+        # into consecutive IDAT chunks, so that the only full copy of them is the PNG itself.
+        compressor = zlib.compressobj(0)
+        if has_previous_row:
+            write_png_chunk(strip_png, b'IDAT', compressor.compress(b'\x00' + self.previous_row))
+        for start in range(0, len(scanlines), 1048576):
+            write_png_chunk(strip_png, b'IDAT', compressor.compress(scanlines[start:start + 1048576]))
+        write_png_chunk(strip_png, b'IDAT', compressor.flush())
+        write_png_chunk(strip_png, b'IEND', b'')
+        strip_png.seek(0)
+        strip = Image.open(strip_png)
+        strip.load()
+        self.previous_row = strip.crop((0, number_of_rows - 1, self.width, number_of_rows)).tobytes()
+        if has_previous_row:
+            strip = strip.crop((0, 1, self.width, number_of_rows))
+        return strip
+    # Shrink a strip and paste it into the output image at the rows that it covers. The rows are rounded so that consecutive strips meet exactly. Palette and
+    # grayscale with alpha images are converted first, because Pillow only resizes palette images with the nearest neighbor filter.
+    def paste_shrunk_strip(self, strip, number_of_rows):
+        if strip.mode in ('P', 'LA') or 'transparency' in strip.info:
+            if strip.mode in ('LA', 'RGBA') or 'transparency' in strip.info:
+                strip = strip.convert('RGBA')
+            else:
+                strip = strip.convert('RGB')
+        if self.output_image == None:
+            self.output_image = Image.new(strip.mode, self.output_size)
+        top = round(self.row_number * self.output_size[1] / self.height)
+        bottom = round((self.row_number + number_of_rows) * self.output_size[1] / self.height)
+        if bottom > top:
+            self.output_image.paste(strip.resize((self.output_size[0], bottom - top), Image.BOX), (0, top))
+
+def write_png_chunk(outfile, chunk_type, data):
+    outfile.write(struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
@@ -0,0 +1,20 @@
+# Description: Set limits on memory and CPU time, then replace this process with a command, which keeps the limits. stage2_processing.py starts ffmpeg through
+# this script when the prlimit program isn't installed. It's run as a separate program instead of setting the limits with subprocess's preexec_fn, because
+# preexec_fn runs Python code between fork and exec, which can deadlock when the web server process has other threads. It only uses the standard library, so
+# that it starts quickly.
+# Usage: python limited_exec.py max_memory max_cpu_time command [argument ...]
+# max_memory is the limit on the address space in bytes, and max_cpu_time is in seconds.
+
+import os
+import resource
+import sys
+
+# 0. Main function.
+def main(arguments):
+    max_memory, max_cpu_time, command = int(arguments[0]), int(arguments[1]), arguments[2:]
+    resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    resource.setrlimit(resource.RLIMIT_CPU, (max_cpu_time, max_cpu_time))
+    os.execvp(command[0], command)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,211 @@
+# Description: Long-term storage for uploads and their associated files, like thumbnails, posters, renditions, and HLS ladders. All reads, writes, moves, and deletes
+# of these files go through the backend returned by get_media_storage(), which is chosen by the MEDIA_STORAGE setting. The 'local' backend keeps the files in
+# MEDIA_ROOT. The 's3' backend keeps them in a bucket on Amazon S3 or an S3-compatible server, like MinIO, so that several web servers can share the same media.
+#
+# Files are identified by names relative to the media directory which always use forward slashes, like 'uploads/posters/cat.jpg', so that the same name works
+# as a URL path, an S3 key, and a path on Windows or UNIX. Validation and stage 2 processing still work on local files in the stage2_processing directory,
+# because Pillow and ffmpeg need file paths. After processing, the results are moved into media storage with save_file() and save_directory().
+# The check_media_storage command tests a backend, such as the 's3' backend against a local MinIO or moto server.
+
+from django.conf import settings
+import os
+import errno
+import shutil
+import mimetypes
+from urllib.parse import quote
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.client import Config
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+# The backend is created the first time it is needed, so that each process, including the worker processes of management commands, creates its own S3 client.
+media_storage = None
+
+# 0. Return the media storage backend for this process.
+def get_media_storage():
+    global media_storage
+    if media_storage == None:
+        media_storage = create_media_storage(settings.MEDIA_STORAGE)
+    return media_storage
+
+# 0.1. Input: options, a dictionary in the format of the MEDIA_STORAGE setting. Output: A LocalMediaStorage or S3MediaStorage object.
+def create_media_storage(options):
+    if options['BACKEND'] == 'local':
+        return LocalMediaStorage(settings.MEDIA_PATH, settings.MEDIA_URL)
+    elif options['BACKEND'] == 's3':
+        if boto3 == None:
+            raise ImportError("The 's3' media storage backend requires the boto3 module.")
+        return S3MediaStorage(options)
+    else:
+        raise ValueError("Unknown media storage backend: " + str(options['BACKEND']))
+
+# A. Media storage in a directory on the web server's own disk.
+class LocalMediaStorage(object):
+    def __init__(self, root, base_url):
+        self.root = root
+        self.base_url = base_url
+    # Return the absolute path for a name.
+    def path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+    # Move a local file, such as one made during processing, into storage. A file already at the name is replaced atomically, so that a web server never
+    # serves a half-written file. When the local file is on another filesystem, like a temporary directory, it is first copied next to the destination.
+    def save_file(self, local_path, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(local_path, path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            partial_path = path + '.partial'
+            shutil.copyfile(local_path, partial_path)
+            os.replace(partial_path, path)
+            os.remove(local_path)
+    # Move a local directory and the files within it into storage. If a directory already exists at the name, then it has the same content-addressed files,
+    # so the local directory is discarded.
+    def save_directory(self, local_path, name):
+        path = self.path(name)
+        if os.path.isdir(path):
+            shutil.rmtree(local_path, ignore_errors=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.move(local_path, path)
+    # Rename a stored file, if it exists.
+    def move(self, old_name, new_name):
+        old_path = self.path(old_name)
+        if os.path.exists(old_path):
+            new_path = self.path(new_name)
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(old_path, new_path)
+    # Rename a stored directory, if it exists.
+    def move_directory(self, old_name, new_name):
+        old_path = self.path(old_name)
+        if os.path.isdir(old_path):
+            self.save_directory(old_path, new_name)
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+    def delete_directory(self, name):
+        shutil.rmtree(self.path(name), ignore_errors=True)
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+    # Return the names of the files directly within a stored directory.
+    def list_directory(self, name):
+        path = self.path(name)
+        if not os.path.isdir(path):
+            return []
+        return [name + '/' + file_name for file_name in os.listdir(path) if os.path.isfile(os.path.join(path, file_name))]
+    # Return a (name, size in bytes, modification time) tuple for each file within a stored directory and its subdirectories. The time is a UNIX timestamp.
+    def list_files(self, name):
+        files = []
+        for directory_path, directory_names, file_names in os.walk(self.path(name)):
+            relative_directory = os.path.relpath(directory_path, self.root).replace(os.sep, '/')
+            for file_name in file_names:
+                file_stat = os.stat(os.path.join(directory_path, file_name))
+                files = files + [(relative_directory + '/' + file_name, file_stat.st_size, file_stat.st_mtime)]
+        return files
+    def delete_files(self, names):
+        for name in names:
+            self.delete(name)
+    def read(self, name):
+        with open(self.path(name), 'rb') as infile:
+            return infile.read()
+    # Copy a stored file to a local path, such as for reprocessing it.
+    def download(self, name, local_path):
+        shutil.copyfile(self.path(name), local_path)
+    def url(self, name):
+        return self.base_url + quote(name)
+
+# B. Media storage in an S3 bucket. Files larger than MULTIPART_THRESHOLD, like long videos and their HLS segments, are uploaded and copied in parts, several at once.
+# When PRESIGNED_URLS is True, the bucket can be private, and url() returns a link which is signed to expire after URL_EXPIRATION seconds.
+class S3MediaStorage(object):
+    def __init__(self, options):
+        self.bucket_name = options['BUCKET_NAME']
+        self.prefix = options.get('PREFIX', '')
+        self.presigned_urls = options.get('PRESIGNED_URLS', True)
+        self.url_expiration = options.get('URL_EXPIRATION', 3600)
+        self.public_url = options.get('PUBLIC_URL', '')
+        self.cache_control = options.get('CACHE_CONTROL', '')
+        self.client = boto3.client('s3', endpoint_url=options.get('ENDPOINT_URL'), region_name=options.get('REGION_NAME'),
+                                   aws_access_key_id=options.get('ACCESS_KEY_ID'), aws_secret_access_key=options.get('SECRET_ACCESS_KEY'),
+                                   config=Config(signature_version='s3v4'))
+        self.transfer_config = TransferConfig(multipart_threshold=options.get('MULTIPART_THRESHOLD', 8388608),
+                                              multipart_chunksize=options.get('MULTIPART_CHUNKSIZE', 8388608),
+                                              max_concurrency=options.get('MAX_CONCURRENCY', 4))
+    def key(self, name):
+        return self.prefix + name
+    # Upload a local file, then remove the local copy.
+    def save_file(self, local_path, name):
+        extra_args = {'ContentType': mimetypes.guess_type(name)[0] or 'application/octet-stream'}
+        if self.cache_control != '':
+            extra_args['CacheControl'] = self.cache_control
+        self.client.upload_file(local_path, self.bucket_name, self.key(name), ExtraArgs=extra_args, Config=self.transfer_config)
+        os.remove(local_path)
+    # Upload the files within a local directory, then remove the local directory.
+    def save_directory(self, local_path, name):
+        for directory_path, directory_names, file_names in os.walk(local_path):
+            relative_directory = os.path.relpath(directory_path, local_path).replace(os.sep, '/')
+            for file_name in file_names:
+                if relative_directory == '.':
+                    file_name_in_storage = name + '/' + file_name
+                else:
+                    file_name_in_storage = name + '/' + relative_directory + '/' + file_name
+                self.save_file(os.path.join(directory_path, file_name), file_name_in_storage)
+        shutil.rmtree(local_path, ignore_errors=True)
+    # S3 doesn't have a rename operation, so copy the object, then delete the original. The managed copy uses multipart copying for large objects.
+    def move(self, old_name, new_name):
+        if self.exists(old_name):
+            self.client.copy({'Bucket': self.bucket_name, 'Key': self.key(old_name)}, self.bucket_name, self.key(new_name), Config=self.transfer_config)
+            self.delete(old_name)
+    def move_directory(self, old_name, new_name):
+        for key in self.list_keys(old_name + '/'):
+            old_key_name = key[len(self.prefix):]
+            self.move(old_key_name, new_name + old_key_name[len(old_name):])
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket_name, Key=self.key(name))
+    # Delete every object under the name, up to 1000 per request.
+    def delete_directory(self, name):
+        self.delete_keys(self.list_keys(name + '/'))
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket_name, Key=self.key(name))
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+    def list_directory(self, name):
+        return [key[len(self.prefix):] for key in self.list_keys(name + '/') if '/' not in key[len(self.key(name + '/')):]]
+    def list_files(self, name):
+        files = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self.key(name + '/')):
+            files = files + [(item['Key'][len(self.prefix):], item['Size'], item['LastModified'].timestamp()) for item in page.get('Contents', [])]
+        return files
+    def delete_files(self, names):
+        self.delete_keys([self.key(name) for name in names])
+    def read(self, name):
+        return self.client.get_object(Bucket=self.bucket_name, Key=self.key(name))['Body'].read()
+    def download(self, name, local_path):
+        self.client.download_file(self.bucket_name, self.key(name), local_path, Config=self.transfer_config)
+    def url(self, name):
+        if self.presigned_urls:
+            return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket_name, 'Key': self.key(name)}, ExpiresIn=self.url_expiration)
+        else:
+            return self.public_url + quote(self.key(name))
+    # Delete objects by their keys, up to 1000 per request.
+    def delete_keys(self, keys):
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket_name, Delete={'Objects': [{'Key': key} for key in keys[i:i+1000]], 'Quiet': True})
+    # Input: prefix, a string. Output: A list of the keys which begin with the prefix after the storage's own prefix.
+    def list_keys(self, prefix):
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self.key(prefix)):
+            keys = keys + [item['Key'] for item in page.get('Contents', [])]
+        return keys
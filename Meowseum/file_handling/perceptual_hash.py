@@ -0,0 +1,145 @@
+# Description: Hashes for recognizing an upload which duplicates another. The content hash is the SHA-256 hash of a file's bytes, so it only matches exact copies.
+# The perceptual hash is a 64-bit DCT hash, or pHash, of what the image looks like, so copies that were re-encoded, resized, or converted to another format have
+# hashes within a few bits of each other. For videos and animated GIFs, it is the bitwise majority of the hashes of frames sampled from the middle of the video.
+# The BKTree class finds the hashes within a Hamming distance of a hash without comparing it to every upload.
+
+import hashlib
+import subprocess
+import numpy
+from math import pi
+from PIL import Image
+from moviepy.config_defaults import FFMPEG_BINARY
+from Meowseum.file_handling.large_images import open_image_within_memory_budget, MemoryBudgetError
+
+# The perceptual hash is computed from a 32x32 grayscale copy of the image. Its lowest 8x8 frequencies, aside from the average brightness, become the 64 bits.
+HASH_IMAGE_SIZE = 32
+HASH_FREQUENCIES = 8
+# Hashing happens during validation, before the upload has been accepted, so a large still image is opened with a smaller memory budget than processing uses.
+HASH_MEMORY_BUDGET = 33554432
+# The positions within a video from which frames are sampled, as fractions of the duration. The first and last frames are often black or a title card.
+FRAME_POSITIONS = (0.25, 0.5, 0.75)
+# The hashes are stored in signed 64-bit database columns, so they are converted to and from this range.
+HASH_MASK = 0xFFFFFFFFFFFFFFFF
+
+# 1. Return the SHA-256 hash of a file as a hexadecimal string, reading it in 1 MB chunks so that large videos aren't loaded into memory.
+def get_file_hash(file_path):
+    hash_object = hashlib.sha256()
+    with open(file_path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1048576), b''):
+            hash_object.update(chunk)
+    return hash_object.hexdigest()
+
+# 2. Return the perceptual hash of an image or video as a signed 64-bit integer, or None if no frames could be read or the image is too large to decode.
+# Input: file_path, metadata dictionary with 'motion_type' and, for videos and animated GIFs, 'duration'.
+def get_perceptual_hash(file_path, metadata):
+    if metadata['motion_type'] == 'video':
+        frame_hashes = []
+        for position in FRAME_POSITIONS:
+            pixels = get_video_frame_pixels(file_path, metadata['duration'] * position)
+            if pixels is not None:
+                frame_hashes = frame_hashes + [get_dct_hash(pixels)]
+        if len(frame_hashes) == 0:
+            return None
+        perceptual_hash = get_majority_hash(frame_hashes)
+    else:
+        try:
+            image = open_image_within_memory_budget(file_path, (HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), HASH_MEMORY_BUDGET)
+        except MemoryBudgetError:
+            return None
+        # For a still image, only the first frame is used.
+        image = image.convert('L').resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.ANTIALIAS)
+        perceptual_hash = get_dct_hash(numpy.asarray(image, dtype=numpy.float64))
+        del image
+    return to_signed_64(perceptual_hash)
+
+# 2.1. Use ffmpeg to decode one frame at the given time, already scaled down to a 32x32 grayscale image, so that only 1024 bytes pass through the pipe.
+# Input: file_path, time in seconds. Output: A 32x32 numpy array, or None if ffmpeg couldn't read a frame at that time.
+def get_video_frame_pixels(file_path, time):
+    command = [FFMPEG_BINARY, '-nostdin', '-ss', format(time, '.3f'), '-i', file_path, '-frames:v', '1',
+               '-vf', 'scale=' + str(HASH_IMAGE_SIZE) + ':' + str(HASH_IMAGE_SIZE) + ':flags=area,format=gray', '-f', 'rawvideo', '-']
+    try:
+        output = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+    except subprocess.CalledProcessError:
+        return None
+    if len(output) != HASH_IMAGE_SIZE * HASH_IMAGE_SIZE:
+        return None
+    return numpy.frombuffer(output, dtype=numpy.uint8).reshape((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE)).astype(numpy.float64)
+
+# 2.2. Compute the pHash of a 32x32 grayscale image. Each bit is 1 if the frequency is above the median of the 63 frequencies after the average brightness.
+# Input: pixels, a 32x32 numpy array. Output: An unsigned 64-bit integer.
+def get_dct_hash(pixels):
+    frequencies = DCT_MATRIX.dot(pixels).dot(DCT_MATRIX.T)[0:HASH_FREQUENCIES, 0:HASH_FREQUENCIES].flatten()
+    median = numpy.median(frequencies[1:])
+    perceptual_hash = 0
+    for frequency in frequencies:
+        perceptual_hash = (perceptual_hash << 1) | int(frequency > median)
+    return perceptual_hash
+
+# 2.2.1. Return the matrix for a type II discrete cosine transform of size n, so that a 2D transform is two matrix multiplications.
+def get_dct_matrix(n):
+    matrix = numpy.zeros((n, n))
+    for k in range(n):
+        for i in range(n):
+            matrix[k, i] = numpy.cos(pi * (2 * i + 1) * k / (2 * n))
+    return matrix
+
+DCT_MATRIX = get_dct_matrix(HASH_IMAGE_SIZE)
+
+# 2.3. Combine the hashes of several frames. Each bit is 1 if it is 1 in at least half of the hashes.
+def get_majority_hash(hashes):
+    majority_hash = 0
+    for bit in range(HASH_FREQUENCIES * HASH_FREQUENCIES):
+        count = sum((perceptual_hash >> bit) & 1 for perceptual_hash in hashes)
+        if count * 2 >= len(hashes):
+            majority_hash = majority_hash | (1 << bit)
+    return majority_hash
+
+# 3. The number of bits which differ between two hashes.
+def hamming_distance(hash1, hash2):
+    return bin((hash1 ^ hash2) & HASH_MASK).count('1')
+
+def to_signed_64(value):
+    if value >= 1 << 63:
+        return value - (1 << 64)
+    return value
+
+def to_unsigned_64(value):
+    return value & HASH_MASK
+
+# 4. A BK-tree of perceptual hashes. Each child of a node is keyed by its Hamming distance from the node, so by the triangle inequality, a search only needs to visit
+# the children whose key is within max_distance of the searched hash's distance from the node. For small distances, this skips most of the tree.
+# Each node is a [hash, list of items with that hash, dictionary of children] list.
+class BKTree(object):
+    def __init__(self):
+        self.root = None
+    # Input: hash_value, an unsigned 64-bit integer. item, such as the ID of a Metadata record.
+    def add(self, hash_value, item):
+        if self.root == None:
+            self.root = [hash_value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance in node[2]:
+                node = node[2][distance]
+            else:
+                node[2][distance] = [hash_value, [item], {}]
+                return
+    # Output: A list of (distance, item) tuples for the hashes within max_distance, sorted from closest to farthest.
+    def search(self, hash_value, max_distance):
+        results = []
+        if self.root == None:
+            return results
+        nodes = [self.root]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                results = results + [(distance, item) for item in node[1]]
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        return sorted(results)
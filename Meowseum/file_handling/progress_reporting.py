@@ -0,0 +1,65 @@
+# Description: Report how far along the processing of an uploaded file is, so that the upload modal can show a percentage and an estimate of the time remaining.
+# While the from_device view processes a file, the ProcessingProgress record of its TemporaryUpload is the current progress record of the thread. Each stage of
+# stage 2 processing names itself with set_stage(), and run_ffmpeg() asks ffmpeg for its machine-readable progress output. ffmpeg writes a block of key=value lines
+# twice per second, rather than once per frame, and the record is saved at most once per PROGRESS_SAVE_INTERVAL, so reporting costs almost nothing. When there
+# isn't a current record, like in the management commands, nothing is reported and ffmpeg runs as before.
+
+import threading
+import time
+from django.utils import timezone
+
+# The minimum number of seconds between saves of the progress record.
+PROGRESS_SAVE_INTERVAL = 1.0
+# The state of the progress reporting within each thread of the web server.
+local_state = threading.local()
+
+# 1. Make a ProcessingProgress record the current record of this thread, or stop reporting progress by passing None.
+def start_reporting(progress_record):
+    local_state.progress_record = progress_record
+    local_state.duration = None
+    local_state.last_save_time = 0
+
+def get_progress_record():
+    return getattr(local_state, 'progress_record', None)
+
+# 2. Begin a new stage of processing.
+# Input: stage, a description for the user, such as "Resizing the video". duration, the length in seconds of the video that ffmpeg will write during the stage,
+# or None if the stage's progress can't be measured.
+def set_stage(stage, duration=None):
+    progress_record = get_progress_record()
+    if progress_record == None:
+        return
+    local_state.duration = duration
+    progress_record.stage = stage
+    progress_record.fraction = 0
+    progress_record.stage_started = timezone.now()
+    progress_record.save(update_fields=['stage', 'fraction', 'stage_started'])
+    local_state.last_save_time = time.time()
+
+# 3. Record the fraction of the current stage which is complete. The record is only saved if enough time has passed since it was last saved.
+def set_fraction(fraction):
+    progress_record = get_progress_record()
+    progress_record.fraction = min(max(fraction, 0), 1)
+    if time.time() - local_state.last_save_time >= PROGRESS_SAVE_INTERVAL:
+        progress_record.save(update_fields=['fraction'])
+        local_state.last_save_time = time.time()
+
+# 4. Read the output of "ffmpeg -progress pipe:1" until ffmpeg closes it. Only the line ending each block is acted on, using the last out_time_us value before it,
+# which is the timestamp in microseconds that ffmpeg has written up to. Older versions of ffmpeg only write out_time_ms, which is also in microseconds.
+# Input: stream, a text stream of ffmpeg's standard output. Output: None
+def read_ffmpeg_progress(stream):
+    out_time = 0
+    for line in stream:
+        key, separator, value = line.strip().partition('=')
+        if key in ('out_time_us', 'out_time_ms'):
+            try:
+                out_time = int(value) / 1000000
+            except ValueError:
+                # ffmpeg writes "N/A" before it has written the first frame.
+                pass
+        elif key == 'progress' and local_state.duration:
+            set_fraction(out_time / local_state.duration)
+
+# 5. Return True if a progress record is active and the current stage can be measured, so that run_ffmpeg() should ask ffmpeg for its progress.
+def is_measuring_progress():
+    return get_progress_record() != None and bool(getattr(local_state, 'duration', None))
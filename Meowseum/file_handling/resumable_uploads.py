@@ -0,0 +1,111 @@
+# Description: Support for the resumable upload protocol, which is a subset of tus 1.0 (https://tus.io/protocols/resumable-upload.html). A client creates an upload
+# with the file's length, then sends the file in one or more PATCH requests, each starting at the offset the server has received so far. If a connection drops,
+# the client asks for the offset with a HEAD request and continues from there, instead of sending the whole file again. Each chunk is written to a part file,
+# then appended to a staging file, and the type is checked from the first chunk, so that an unsupported file is refused before the rest of it is sent. When
+# the file is complete, the staging file is wrapped in StagedUploadedFile, which validation links to and Django moves into place when the TemporaryUpload is
+# saved, so the file isn't copied again after it's received.
+
+import glob
+import os
+import shutil
+from base64 import b64decode
+from datetime import timedelta
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from Meowseum.models import ResumableUpload
+from Meowseum.file_handling.get_metadata import get_python_magic
+
+TUS_VERSION = '1.0.0'
+# The number of bytes read from the request at a time while writing a chunk.
+CHUNK_READ_SIZE = 65536
+# Each PATCH request writes its chunk to a part file next to the staging file, named after the staging file with a random suffix and this extension.
+PART_FILE_EXTENSION = '.part'
+
+# 1. A complete staging file, in the form of the files which Django's upload handlers create. Because it has temporary_file_path(), FileSystemStorage moves the file
+# into place when a record with a file field is saved, rather than copying it.
+class StagedUploadedFile(UploadedFile):
+    def __init__(self, resumable_upload):
+        self.staging_path = resumable_upload.get_staging_path()
+        super(StagedUploadedFile, self).__init__(open(self.staging_path, 'rb'), resumable_upload.original_name, resumable_upload.mime_type,
+                                                 resumable_upload.length, None)
+    def temporary_file_path(self):
+        return self.staging_path
+
+# 2. Write the body of a PATCH request to a part file of its own, without reading the whole body into memory. The body is read before the upload's record is
+# locked, so that a slow client doesn't hold the lock for the whole transfer. If the connection drops partway, the bytes received so far are kept, so that the
+# client can resume from them.
+# Input: resumable_upload, request, offset, the offset the chunk starts at. Output: The path of the part file, and the number of bytes written to it.
+def receive_chunk_file(resumable_upload, request, offset):
+    part_path = resumable_upload.get_staging_path() + '.' + get_random_string(8) + PART_FILE_EXTENSION
+    bytes_written = 0
+    bytes_remaining = resumable_upload.length - offset
+    with open(part_path, 'wb') as part_file:
+        while bytes_remaining > 0:
+            try:
+                data = request.read(min(CHUNK_READ_SIZE, bytes_remaining))
+            except IOError:
+                break
+            if not data:
+                break
+            part_file.write(data)
+            bytes_written = bytes_written + len(data)
+            bytes_remaining = bytes_remaining - len(data)
+    return part_path, bytes_written
+
+# 2.1. Append a part file to the staging file at the upload's offset, and delete the part file. The caller holds the lock on the record, so that the offset can't
+# change meanwhile. Copying from a local file is quick, unlike reading from the client. Input: resumable_upload, part_path. Output: The number of bytes appended.
+def append_chunk_file(resumable_upload, part_path):
+    staging_path = resumable_upload.get_staging_path()
+    with open(staging_path, 'r+b' if os.path.exists(staging_path) else 'wb') as staging_file:
+        staging_file.seek(resumable_upload.offset)
+        # Discard anything after the offset, which may be left over from a chunk that was interrupted before its offset was saved.
+        staging_file.truncate()
+        with open(part_path, 'rb') as part_file:
+            shutil.copyfileobj(part_file, staging_file, CHUNK_READ_SIZE)
+        bytes_appended = staging_file.tell() - resumable_upload.offset
+    os.remove(part_path)
+    return bytes_appended
+
+# 3. Return the MIME type of a partly received file from its first bytes, or a blank string if it can't be told yet. python-magic only reads the beginning of the
+# file. The types which get_mime_type() double-checks with MediaInfo need the whole file, so they are left for the full validation.
+def get_first_chunk_mime_type(staging_path):
+    mime_type = get_python_magic().from_file(staging_path)
+    if mime_type in ('application/ogg', 'application/octet-stream'):
+        return ''
+    return mime_type
+
+# 4. Parse the Upload-Metadata header, a comma-separated list of keys, each followed by a space and its value in base64.
+# Input: header string. Output: A dictionary of strings.
+def parse_upload_metadata(header):
+    metadata = {}
+    for pair in header.split(','):
+        key, separator, value = pair.strip().partition(' ')
+        if key == '':
+            continue
+        try:
+            metadata[key] = b64decode(value).decode('utf-8')
+        except (ValueError, UnicodeDecodeError):
+            metadata[key] = ''
+    return metadata
+
+# 5. Delete the record, staging file, and any part files of a resumable upload.
+def delete_resumable_upload(resumable_upload):
+    staging_path = resumable_upload.get_staging_path()
+    for path in [staging_path] + glob.glob(glob.escape(staging_path) + '.*' + PART_FILE_EXTENSION):
+        if os.path.exists(path):
+            os.remove(path)
+    resumable_upload.delete()
+
+# 6. Delete the resumable uploads which haven't received a chunk within the expiry.
+# Input: expiry, a number of seconds. Output: The number of uploads deleted, and the number of bytes of staging files deleted.
+def delete_abandoned_uploads(expiry):
+    number_deleted = 0
+    bytes_deleted = 0
+    for resumable_upload in ResumableUpload.objects.filter(last_modified__lt=timezone.now() - timedelta(seconds=expiry)):
+        staging_path = resumable_upload.get_staging_path()
+        if os.path.exists(staging_path):
+            bytes_deleted = bytes_deleted + os.path.getsize(staging_path)
+        delete_resumable_upload(resumable_upload)
+        number_deleted = number_deleted + 1
+    return number_deleted, bytes_deleted
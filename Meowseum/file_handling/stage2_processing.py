@@ -2,15 +2,28 @@
 
 from django.conf import settings
 from Meowseum.models import TemporaryUpload
+from Meowseum.file_handling.progress_reporting import set_stage, is_measuring_progress, read_ffmpeg_progress
+from Meowseum.file_handling.large_images import open_image_within_memory_budget, MemoryBudgetError
+from Meowseum.file_handling.image_optimization import save_optimized_image
 import os
 from PIL import Image
-from moviepy.editor import VideoFileClip
-import moviepy.video.fx.resize
-from moviepy.config_defaults import FFMPEG_BINARY, IMAGEMAGICK_BINARY
+from moviepy.config_defaults import FFMPEG_BINARY
 from math import ceil
 import subprocess
+import tempfile
+import shutil
+import sys
 from qtfaststart.processor import process as qtfaststart
-from Meowseum.file_handling.get_metadata import get_exif_data
+try:
+    # Importing the optional AVIF plugin registers the format with Pillow. Newer Pillow builds support AVIF without it.
+    import pillow_avif
+except ImportError:
+    pass
+
+# This exception is raised when ffmpeg runs out of the memory or CPU time allowed by the 'process_limits' key of hosting_limits. Unlike other processing errors,
+# it is caused by the file being too demanding rather than by a bug, so the view shows the user an error message instead of letting the exception propagate.
+class ProcessingLimitError(IOError):
+    pass
 
 # 0. Convert the file, scale it down, and do other operations to put it within the constraints specified by the arguments supplied by the hosting_limits dictionary.
 # Input: 1. The 'file' argument now uses the class 'django.db.models.fields.files.FieldFile'.
@@ -30,17 +43,22 @@ the possibility that the user chose not to upload anything. If the file is requi
     save_type_list, new_dimensions, gif_dimensions, output_bitrate, needs_bitrate_lowering = determine_output_parameters(file, metadata, hosting_limits)                
     # Begin processing the file. These functions include checking whether any re-encoding actually needs to be done, so the file may be returned unchanged.
     if metadata['motion_type'] == 'image':
+        set_stage("Processing the image")
         file, metadata = process_image(file, metadata, hosting_limits, save_type_list, new_dimensions)
     else:
         if metadata['motion_type'] == 'video':
             file, metadata = process_video(file, metadata, hosting_limits, save_type_list, new_dimensions, gif_dimensions, output_bitrate, needs_bitrate_lowering)
             
-    if 'thumbnail' in hosting_limits:
-        if (hosting_limits['thumbnail'][0] == 'width' and metadata['width'] > hosting_limits['thumbnail'][1]) or (hosting_limits['thumbnail'][0] == 'height' and metadata['height'] > hosting_limits['thumbnail'][1]):
-            if 'image' in metadata['mime_type']:
-                create_image_thumbnail(file, metadata, hosting_limits)
-            else:
-                create_video_thumbnail(file, metadata, hosting_limits)
+    # The thumbnail of a video is made by process_video(), along with its posters.
+    if 'thumbnail' in hosting_limits and 'image' in metadata['mime_type']:
+        if needs_thumbnail(metadata, hosting_limits):
+            set_stage("Creating the thumbnail")
+            create_image_thumbnail(file, metadata, hosting_limits)
+    if 'renditions' in hosting_limits:
+        set_stage("Creating lighter-weight copies of the still images")
+        metadata = create_renditions(file, metadata, hosting_limits)
+    if 'hls_ladder' in hosting_limits and hosting_limits['hls_ladder'][3] and metadata['mime_type'] == 'video/mp4':
+        metadata = create_hls_ladder(file, metadata, hosting_limits)
 
     return file, metadata
 
@@ -251,24 +269,34 @@ def get_output_bitrate(metadata, hosting_limits, new_dimensions):
     new_bitrate = str(ceil(new_bitrate / 1000))+'k'
     return new_bitrate, needs_bitrate_lowering
 
-# 2. Use Pillow to process the image file. Return the updated file and metadata.
+# 2. Use Pillow to process the image file. Return the updated file and metadata. The EXIF data is removed and the orientation is corrected within this process,
+# and the rotation, resizing, and conversion share one encode, so the image is decoded and re-encoded at most once.
 def process_image(file, metadata, hosting_limits, save_type_list, new_dimensions):
-    autorotate_image(file.path, metadata, hosting_limits)
-    separate_exif_data_from_file(file.path, metadata['mime_type'])
+    if metadata['mime_type'] == 'image/jpeg':
+        remove_exif_data_from_file(file.path)
     
-    image = Image.open(file.path)
+    image = open_image_for_processing(file.path, metadata, hosting_limits, new_dimensions)
+    image, needs_saving = autorotate_image(image, metadata)
     if new_dimensions != None:
         # Shrink the image.
         image.thumbnail(new_dimensions)
         metadata['width'] = new_dimensions[0]
         metadata['height'] = new_dimensions[1]
-        if save_type_list == None:
-            # This was the only task.
-            save_image(image, file.path, hosting_limits, metadata['mime_type'])
+        needs_saving = True
+    if save_type_list == None:
+        if needs_saving:
+            # Rotating or resizing was the only task.
+            record_encoding(metadata, save_image(image, file.path, hosting_limits, metadata['mime_type']))
             del image
             image = Image.open(file.path)
             metadata['file_size'] = file.size
-    if save_type_list != None:
+        elif 'target_ssim' in hosting_limits and metadata['mime_type'] in ('image/jpeg', 'image/png'):
+            # The image is already within the limits, but most uploads are encoded with more bytes than they need. The new encoding is only kept if it's smaller.
+            encoding = save_image(image, file.path, hosting_limits, metadata['mime_type'], max_file_size=os.path.getsize(file.path))
+            if encoding != None:
+                record_encoding(metadata, encoding)
+                metadata['file_size'] = file.size
+    else:
         # Obtain the file path without the extension on the end, as well as the current extension.
         extless_file_path, old_ext = os.path.splitext(file.path)
         old_ext = old_ext.lower()
@@ -276,76 +304,113 @@ def process_image(file, metadata, hosting_limits, save_type_list, new_dimensions
         extless_file_rel_path = os.path.splitext(file.name)[0]
         for x in range(len(save_type_list)):
             # Convert the file using each extension in the list. Unless there were changes, skip saving as the original extension.
-            if settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS[save_type_list[x]] != old_ext or new_dimensions != None:
-                save_image(image, extless_file_path + settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS[save_type_list[x]], hosting_limits, metadata['mime_type'])
+            if settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS[save_type_list[x]] != old_ext or needs_saving:
+                encoding = save_image(image, extless_file_path + settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS[save_type_list[x]], hosting_limits, metadata['mime_type'])
+                if x == 0:
+                    # The first type in the list becomes the upload's file.
+                    record_encoding(metadata, encoding)
         del image # Close the original file so that, if it isn't needed, it can be deleted.
         file, metadata = post_conversion_update(file, metadata, save_type_list, extless_file_path, extless_file_rel_path, old_ext)
     return file, metadata
 
-# 2.1. This function checks if the image needs rotating and/or mirroring, based on the image's EXIF orientation data, before web browsers will display
-# it correctly. If it does, the function use the command line tool JHEAD to losslessly adjust the image, then it changes the image's EXIF orientation to 1.
-def autorotate_image(file_path, metadata, hosting_limits):
-    if 'original_exif_orientation' in metadata and metadata['original_exif_orientation'] > 1 and metadata['original_exif_orientation'] < 9:
-        if 'jpeg_quality' in hosting_limits:
-            jpeg_quality = str(hosting_limits['jpeg_quality'])
-        else:
-            jpeg_quality = '75'
-        if os.name == 'nt':
-            command = [IMAGEMAGICK_BINARY, file_path, '-auto-orient', '-quality', jpeg_quality, file_path]
-        else:
-            # The UNIX installation allows using the 'convert' command instead of the path to the executable.
-            command = ['convert', file_path, '-auto-orient', '-quality', jpeg_quality, file_path]
-        try:
-            subprocess.check_output(command, stderr=subprocess.STDOUT, universal_newlines=True)
-        except subprocess.CalledProcessError as e:
-            raise IOError(e.output)
-
-# 2.2. If the file is a JPEG with EXIF data, store the EXIF data. Then, for privacy purposes, remove the EXIF data from the JPEG itself using the JHEAD command line tool.
-def separate_exif_data_from_file(file_path, mime_type):
-    image = Image.open(file_path)
-    if mime_type == 'image/jpeg' and 'exif' in image.info:
-        store_raw_exif_data(file_path, image)
-        remove_exif_data_from_file(file_path)
-    del image
-
-# 2.2.1. Store the EXIF data into a separate file.
-def store_raw_exif_data(file_path, image):
-    raw_exif_data = image.info['exif']
-    full_file_name = os.path.split(file_path)[1]
-    file_name = os.path.splitext(full_file_name)[0]
-    exif_data_file_path = os.path.join(settings.MEDIA_PATH, TemporaryUpload.UPLOAD_TO, 'metadata', file_name + '.dat')
-    outfile = open(exif_data_file_path, 'wb')
-    outfile.write(raw_exif_data)
-    outfile.close()
+# The transpose operations which display an image with each EXIF orientation upright. Orientation 1 is already upright.
+EXIF_ORIENTATION_TRANSPOSES = {2: (Image.FLIP_LEFT_RIGHT,),
+                               3: (Image.ROTATE_180,),
+                               4: (Image.FLIP_TOP_BOTTOM,),
+                               5: (Image.TRANSPOSE,),
+                               6: (Image.ROTATE_270,),
+                               7: (Image.TRANSPOSE, Image.ROTATE_180),
+                               8: (Image.ROTATE_90,)}
 
-# 2.2.2. Remove the EXIF data from the JPEG.
+# 2.1. This function checks if the image needs rotating and/or mirroring, based on the image's EXIF orientation data, before web browsers will display
+# it correctly. If it does, the function transposes the decoded image. The file's EXIF data, including the orientation tag, has already been removed.
+# Input: Image object, metadata dictionary. Output: Image object, and a Boolean for whether the image was changed and needs to be saved.
+def autorotate_image(image, metadata):
+    if 'original_exif_orientation' in metadata and metadata['original_exif_orientation'] in EXIF_ORIENTATION_TRANSPOSES:
+        for method in EXIF_ORIENTATION_TRANSPOSES[metadata['original_exif_orientation']]:
+            image = image.transpose(method)
+        return image, True
+    return image, False
+
+# 2.2. For privacy purposes, remove the EXIF data from a JPEG, which can include the GPS coordinates where the photo was taken. The EXIF data was already
+# stored in the metadata dictionary by get_metadata.py. This function copies the file's marker segments, leaving out the APP1 segments which hold EXIF and
+# XMP data, so the compressed image data is copied byte for byte without re-encoding. The file is left unchanged if its segments can't be parsed.
 def remove_exif_data_from_file(file_path):
-    command = [settings.JHEAD_PATH, '-de', file_path]
-    try:
-        subprocess.check_output(command, stderr=subprocess.STDOUT, universal_newlines=True)
-    except subprocess.CalledProcessError as e:
-        raise IOError(e.output)
+    with open(file_path, 'rb') as infile:
+        data = infile.read()
+    segments = get_jpeg_segments_without_app1(data)
+    if segments == None:
+        return
+    temporary_file_path = file_path + '.tmp'
+    with open(temporary_file_path, 'wb') as outfile:
+        for segment in segments:
+            outfile.write(segment)
+    os.replace(temporary_file_path, file_path)
+
+# 2.2.1. Split a JPEG into its marker segments, up to and including the start of scan segment and the compressed data after it.
+# Input: data, the file as a byte sequence. Output: A list of byte sequences without the APP1 segments, or None if there weren't any APP1 segments to remove
+# or the data isn't a valid JPEG.
+def get_jpeg_segments_without_app1(data):
+    if data[:2] != b'\xff\xd8':
+        return None
+    segments = [data[:2]]
+    removed_segment = False
+    position = 2
+    while position < len(data):
+        if data[position] != 0xFF:
+            return None
+        # Markers may be preceded by any number of 0xFF fill bytes.
+        while position < len(data) and data[position] == 0xFF:
+            position += 1
+        if position >= len(data):
+            return None
+        marker = data[position]
+        position += 1
+        if marker == 0xD9 or marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # EOI, TEM, and RST markers are standalone and don't have a length.
+            segments.append(bytes((0xFF, marker)))
+            if marker == 0xD9:
+                break
+            continue
+        if position + 2 > len(data):
+            return None
+        length = (data[position] << 8) + data[position + 1]
+        if length < 2 or position + length > len(data):
+            return None
+        if marker == 0xE1:
+            removed_segment = True
+        else:
+            segments.append(bytes((0xFF, marker)) + data[position:position + length])
+        position += length
+        if marker == 0xDA:
+            # Everything after the start of scan header is entropy-coded data, which is copied as it is.
+            segments.append(data[position:])
+            break
+    if not removed_segment:
+        return None
+    return segments
 
 # 2.3 Save an image. If the file is a JPEG and the programmer specified a JPEG quality setting, the function uses it.
 # When converting from a PNG with transparent areas to JPG, the background canvas will be a random color.
-def save_image(image, path, hosting_limits, mime_type):
+# If there is a 'target_ssim' key, JPEGs and PNGs are saved with the smallest encoding that meets it, and the function returns a dictionary with the
+# 'unoptimized_file_size' and 'jpeg_quality' to record in the metadata. See image_optimization.py. Otherwise, the function returns None.
+# max_file_size is optional. If the optimized encoding isn't smaller, the file isn't written and the function returns None.
+def save_image(image, path, hosting_limits, mime_type, max_file_size=None):
     if path.endswith(settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS['image/jpeg']):
         if image.mode != "RGB":
             # JPEGs can only hold true color images. Formats with other color modes, like .gif, need to be converted first.
             image = image.convert("RGB")
-        if mime_type == 'image/jpeg' and 'exif' in image.info:
-            # Preserve the EXIF data if the file is a JPEG being saved as a JPEG again. Even if the file is being resized, for now the EXIF dimensions are being left as the original dimensions.
-            if 'jpeg_quality' in hosting_limits:
-                image.save(path, quality = hosting_limits['jpeg_quality'], exif=image.info['exif'])
-            else:
-                image.save(path, exif=image.info.get('exif'))
+        if 'target_ssim' in hosting_limits:
+            return save_optimized_image(image, path, 'JPEG', hosting_limits, max_file_size)
+        if 'jpeg_quality' in hosting_limits:
+            image.save(path, quality = hosting_limits['jpeg_quality'])
         else:
-            if 'jpeg_quality' in hosting_limits:
-                image.save(path, quality = hosting_limits['jpeg_quality'])
-            else:
-                image.save(path)
+            image.save(path)
+    elif path.endswith(settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS['image/png']) and 'target_ssim' in hosting_limits:
+        return save_optimized_image(image, path, 'PNG', hosting_limits, max_file_size)
     else:
         image.save(path)
+    return None
 
 # 2.4 After file conversion, delete the original if necessary and pick the first in the conversion list as the replacement.
 # Update the metadata related to the conversion process.
@@ -370,128 +435,129 @@ def post_conversion_update(file, metadata, save_type_list, extless_file_path, ex
             metadata['sizes'] = metadata['sizes'] + [os.path.getsize(extless_file_path + save_type_list[x])]
     return file, metadata
 
-# 3. Use MoviePy to process the image file. Return the updated file and metadata. The current structure is somewhat flawed in that
-# a video may be re-encoded twice, and some tasks could use ffmpeg directly instead of MoviePy.
+# 2.5. Open the image. If it will be shrunk, it is opened within the memory budget from the 'image_memory_budget' key of hosting_limits, which may shrink it
+# partway while it is decoded. The new dimensions are for the upright image, so they are swapped for the orientations which rotate the image by 90 degrees.
+# Input: file_path, metadata dictionary, hosting_limits dictionary, new_dimensions tuple or None. Output: Image object
+def open_image_for_processing(file_path, metadata, hosting_limits, new_dimensions):
+    if new_dimensions == None or 'image_memory_budget' not in hosting_limits:
+        return Image.open(file_path)
+    if metadata.get('original_exif_orientation') in (5, 6, 7, 8):
+        size = (new_dimensions[1], new_dimensions[0])
+    else:
+        size = new_dimensions
+    try:
+        return open_image_within_memory_budget(file_path, size, hosting_limits['image_memory_budget'])
+    except MemoryBudgetError as e:
+        raise ProcessingLimitError(str(e))
+
+# 2.6. Store the encoding dictionary returned by save_image() in the metadata, so that the savings from optimizing the encoding are recorded in the Metadata record.
+def record_encoding(metadata, encoding):
+    if encoding != None:
+        metadata['unoptimized_file_size'] = encoding['unoptimized_file_size']
+        metadata['jpeg_quality'] = encoding['jpeg_quality']
+
+# 3. Use ffmpeg to process the video file. Return the updated file and metadata. The current structure is somewhat flawed in that a video may be re-encoded twice.
+# Each encoding step runs ffmpeg in its own process with the memory and CPU time limits from the 'process_limits' key, and ffmpeg streams the video from file to
+# file, so memory use doesn't grow with the length of the video. Previously, MoviePy passed every frame through numpy in the web server's process.
 def process_video(file, metadata, hosting_limits, save_type_list, new_dimensions, gif_dimensions, output_bitrate, needs_bitrate_lowering):
     if 'needs_rotating' in metadata and metadata['needs_rotating']:
-        rotate_video(file, output_bitrate)
+        set_stage("Rotating the video", metadata['duration'])
+        rotate_video(file, hosting_limits, output_bitrate)
     else:
         if save_type_list == None and new_dimensions == None and needs_bitrate_lowering:
             # The only task is lowering the bitrate below the cap.
+            set_stage("Compressing the video", metadata['duration'])
             file, metadata = lower_video_bitrate(file, metadata, hosting_limits, output_bitrate)
     if new_dimensions != None:
-        file, metadata = resize_video(file, metadata, hosting_limits, output_bitrate)
+        set_stage("Resizing the video", metadata['duration'])
+        file, metadata = resize_video(file, metadata, hosting_limits, output_bitrate, new_dimensions)
     if save_type_list != None:
+        set_stage("Converting the video", metadata['duration'])
         file, metadata = convert_video(file, metadata, hosting_limits, output_bitrate, save_type_list, gif_dimensions)
-    if 'poster_directory' in hosting_limits:
-        create_video_poster(file.path, hosting_limits['poster_directory'])
     if metadata['mime_type'] == 'video/mp4':
+        set_stage("Preparing the video for playback")
         improve_mp4_data(file, metadata, hosting_limits, save_type_list, new_dimensions, needs_bitrate_lowering)
+    set_stage("Creating the poster and thumbnail", metadata['duration'])
+    metadata = create_video_derivatives(file, metadata, hosting_limits)
     return file, metadata
 
 # 3.1. Android and iOS devices record width as the longer dimension and height as the shorter dimension, so that they can also record the orientation of the device
-# instead of re-encoding. However, for this program, the horizontal dimension must be width and the vertical dimension must be height, or else MoviePy produces a scrambled
-# video during other parts of the program -- lowering the bitrate, making the thumbnail, making the poster. This bug may be due to how it uses numpy, rather than a bug in ffmpeg itself,
-# because I was able rescale a vertical video with ffmpeg from command line.
-def rotate_video(file, output_bitrate):
+# instead of re-encoding. However, for this program, the horizontal dimension must be width and the vertical dimension must be height, or else other parts of the program,
+# like making the thumbnail and the poster, produce a scrambled video. Ffmpeg rotates the video automatically while re-encoding it.
+def rotate_video(file, hosting_limits, output_bitrate):
     name_and_ext = os.path.splitext(file.path)
     original_file_path = file.path
     temporary_file_path = name_and_ext[0] + "_new" + name_and_ext[1]
-    command = [FFMPEG_BINARY,
-               '-i',
-               original_file_path,
-               '-c:a',
-               'copy',
-               '-b:v',
-               output_bitrate,
-               '-bufsize',
-               output_bitrate,
-               temporary_file_path]
-    try:
-        subprocess.check_output(command, stderr=subprocess.STDOUT, universal_newlines=True)
-    except subprocess.CalledProcessError as e:
-        raise IOError(e.output)
+    run_ffmpeg(['-i', original_file_path, '-c:a', 'copy', '-b:v', output_bitrate, '-bufsize', output_bitrate, temporary_file_path], hosting_limits)
     os.remove(file.path)
     os.rename(temporary_file_path, original_file_path)
 
 # 3.2. Save the video file using the original extension and a lower bitrate.
 def lower_video_bitrate(file, metadata, hosting_limits, output_bitrate):
-    video = VideoFileClip(file.path)
     original_file_path = file.path
-    # Temporarily use a different file name, because MoviePy has an error if the input and output path are the same.
+    # Temporarily use a different file name, because ffmpeg can't write to the file it is reading.
     name_and_ext = os.path.splitext(file.path)
     temporary_file_path = name_and_ext[0] + "_new" + name_and_ext[1]
-    write_videofile(video, temporary_file_path, output_bitrate, metadata, hosting_limits)
-
-    del video
-    process_has_ended = False
-    while not process_has_ended:
-        try:
-            os.rename(file.path,file.path+"_")
-            os.rename(file.path+"_",file.path)
-            process_has_ended = True
-        except PermissionError:
-            pass
-    # Delete the original file and give the resized file its name.
+    write_videofile(original_file_path, temporary_file_path, output_bitrate, metadata, hosting_limits)
+    # Delete the original file and give the re-encoded file its name.
     os.remove(original_file_path)
     os.rename(temporary_file_path, original_file_path)
     metadata['file_size'] = file.size
     return file, metadata
 
-# 3.2.1. Write to a video file. MoviePy has two separate functions for writing to .gif and video. By examining the extension at the end of the file,
-# this function combines them. If you specified the preset option for when the program is writing to MP4, then this program will also pass that
-# argument when it detects writing to a .mp4 extension. This function will also, if the hosting limits specified it, convert to .gif with separate
-# dimensions.
-def write_videofile(video, destination_path, output_bitrate, metadata, hosting_limits, gif_dimensions=None):
+# 3.2.1. Write to a video file. By examining the extension at the end of the destination path, this function chooses the ffmpeg options for .gif, .mp4,
+# or another video format. If you specified the preset option for when the program is writing to MP4, then this program will also pass that argument
+# when it detects writing to a .mp4 extension. This function will also, if the hosting limits specified it, convert to .gif with separate dimensions.
+# Input: source_path, destination_path, output_bitrate, metadata, hosting_limits, new_dimensions, gif_dimensions. The last two arguments are optional (width, height) tuples.
+def write_videofile(source_path, destination_path, output_bitrate, metadata, hosting_limits, new_dimensions=None, gif_dimensions=None):
     # Even though .gif and .mp4 are almost the only extensions used with these MIME types, this program checks the dictionary for consistency in syntax
     # with cases where the extension can vary and the dictionary is needed to standardize the extension.
     if destination_path.endswith(settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS['image/gif']):
+        command = ['-i', source_path]
         if gif_dimensions != None:
-            video = video.resize(gif_dimensions)
-        video.write_gif(destination_path, fps=metadata['fps'])
+            command = command + ['-vf', 'scale=' + str(gif_dimensions[0]) + ':' + str(gif_dimensions[1])]
+        run_ffmpeg(command + ['-r', str(metadata['fps']), destination_path], hosting_limits)
     else:
         if destination_path.endswith(settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS['video/mp4']):
-            write_mp4(video, destination_path, output_bitrate, hosting_limits)
+            write_mp4(source_path, destination_path, output_bitrate, hosting_limits, new_dimensions)
         else:
-            video.write_videofile(destination_path, bitrate = output_bitrate)
+            command = ['-i', source_path]
+            if new_dimensions != None:
+                command = command + ['-vf', 'scale=' + str(new_dimensions[0]) + ':' + str(new_dimensions[1])]
+            run_ffmpeg(command + ['-b:v', output_bitrate, destination_path], hosting_limits)
 
-# 3.2.1.1. Write to an .mp4 file. 
-def write_mp4(video, destination_path, output_bitrate, hosting_limits):
+# 3.2.1.1. Write to an .mp4 file.
+def write_mp4(source_path, destination_path, output_bitrate, hosting_limits, new_dimensions=None):
+    run_ffmpeg(['-i', source_path] + get_mp4_output_arguments(output_bitrate, hosting_limits, new_dimensions) + [destination_path], hosting_limits)
+
+# 3.2.1.2. Return the ffmpeg options for writing an .mp4 file, which go between the inputs and the output path.
+def get_mp4_output_arguments(output_bitrate, hosting_limits, new_dimensions=None):
     # By default, ffmpeg doesn't do color subsampling, which takes advantage of human visual acuity for colors being lower than
     # human visual acuity for luminosity during encoding. Doing this means ffmpeg has to encode with High 4:4:4 Predictive Profile (Hi444PP, 244).
     # Most software doesn't support decoding this and won't ever support decoding this. The YUV420p color space is used by most major websites
     # including Netflix. Although the default setting or other color spaces make the converted .gif look better, the -pix_fmt yuv420p setting ensures
     # that nearly all video players will be able to see the video. Before I used this setting, videos converted from .gif were invisible in all
-    # browsers except Chrome. The -vf scale=trunc(iw/2)*2:trunc(ih/2)*2 setting rounds down the dimensions of the video to an even number. Without
-    # this, the -pix_fmt yuv420p setting makes ffmpeg throw an exception.
-    if 'preset' in hosting_limits:
-        video.write_videofile(destination_path, bitrate = output_bitrate, ffmpeg_params=['-pix_fmt', 'yuv420p', '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2'], preset = hosting_limits['preset'])
+    # browsers except Chrome. The scale filter rounds down the dimensions of the video to an even number. Without this, the -pix_fmt yuv420p setting
+    # makes ffmpeg throw an exception.
+    if new_dimensions == None:
+        scale_filter = 'scale=trunc(iw/2)*2:trunc(ih/2)*2'
     else:
-        video.write_videofile(destination_path, bitrate = output_bitrate, ffmpeg_params=['-pix_fmt', 'yuv420p', '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2'])
+        scale_filter = 'scale=' + str(new_dimensions[0] // 2 * 2) + ':' + str(new_dimensions[1] // 2 * 2)
+    arguments = ['-c:v', 'libx264', '-b:v', output_bitrate, '-pix_fmt', 'yuv420p', '-vf', scale_filter, '-c:a', 'aac']
+    if 'preset' in hosting_limits:
+        arguments = arguments + ['-preset', hosting_limits['preset']]
+    return arguments
 
 # 3.3. Save the video file using the original extension and lower dimensions.
-# Even if more work still needs to be done, ImageIO had an error where it produced a scrambled .gif when converting a resized .MP4 to a .gif without saving between.
-# Saving between steps reduces the chance of complex errors within dependencies that only occur during combinations of transformations.
-def resize_video(file, metadata, hosting_limits, output_bitrate):
-    video = VideoFileClip(file.path)
-    video = video.resize(new_dimensions)
+# Even if more work still needs to be done, saving between steps reduces the chance of complex errors within dependencies that only occur during combinations of transformations.
+def resize_video(file, metadata, hosting_limits, output_bitrate, new_dimensions):
     metadata['width'] = new_dimensions[0]
     metadata['height'] = new_dimensions[1]
     original_file_path = file.path
-    # Temporarily use a different file name, because MoviePy has an error if the input and output path are the same.
+    # Temporarily use a different file name, because ffmpeg can't write to the file it is reading.
     name_and_ext = os.path.splitext(file.path)
     temporary_file_path = name_and_ext[0] + "_new" + name_and_ext[1]
-    write_videofile(video, temporary_file_path, output_bitrate, metadata, hosting_limits)
-
-    del video
-    process_has_ended = False
-    while not process_has_ended:
-        try:
-            os.rename(file.path,file.path+"_")
-            os.rename(file.path+"_",file.path)
-            process_has_ended = True
-        except PermissionError:
-            pass
+    write_videofile(original_file_path, temporary_file_path, output_bitrate, metadata, hosting_limits, new_dimensions)
     # Delete the original file and give the resized file its name.
     os.remove(original_file_path)
     os.rename(temporary_file_path, original_file_path)
@@ -500,7 +566,6 @@ def resize_video(file, metadata, hosting_limits, output_bitrate):
 
 # 3.4. Convert the video to all the file types specified by save_type_list. Update the database if a converted file will replace the original.
 def convert_video(file, metadata, hosting_limits, output_bitrate, save_type_list, gif_dimensions):
-    video = VideoFileClip(file.path)
     extless_file_path, old_ext = os.path.splitext(file.path)
     old_ext = old_ext.lower()
     # Obtain the path relative to \media\ without the extension on the end.
@@ -508,49 +573,128 @@ def convert_video(file, metadata, hosting_limits, output_bitrate, save_type_list
     for x in range(len(save_type_list)):
         # Convert the file using each extension in the list. Skip saving as the original extension.
         if settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS[save_type_list[x]] != old_ext:
-            write_videofile(video, extless_file_path + settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS[save_type_list[x]], output_bitrate, metadata, hosting_limits, gif_dimensions)
-
-    # Close the file. There are two factors that make this a complicated action. First, after giving the command to close the file, it may
-    # take a few seconds for the MoviePy process to end, but the interpeter is proceeding with subsequent commands. I suspect this is because
-    # MoviePy uses ffmpeg, which is multithreaded. If the interpeter gets to a command that needs to access the file, like renaming it or
-    # removing it, before the MoviePy process can finish shutting down, on Windows this leads to the exception "PermissionError: [WinError 32]
-    # The process cannot access the file because it is being used by another process." This race condition bug occurred very rarely because
-    # the process usually finishes shutting down first. Second, closing the file must be done from within the same function body in which the
-    # file is opened. When I tried to put closing into a different function, the MoviePy process failed to end until it returned to the parent
-    # function. So, this same block of code (without this comment) appears in lower_video_bitrate() and resize_video.
-    # On UNIX, the problem manifested as the converted .mp4 not being present on the server, despite the database being updated to know it should
-    # look for an .mp4 file. It was found using the same .gif file as the Windows problem.
-    del video
-    process_has_ended = False
-    while not process_has_ended:
-        try:
-            os.rename(file.path,file.path+"_")
-            os.rename(file.path+"_",file.path)
-            process_has_ended = True
-        except PermissionError:
-            pass
-    
+            write_videofile(file.path, extless_file_path + settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS[save_type_list[x]], output_bitrate, metadata, hosting_limits,
+                            gif_dimensions=gif_dimensions)
     file, metadata = post_conversion_update(file, metadata, save_type_list, extless_file_path, extless_file_rel_path, old_ext)
     return file, metadata
 
-# 3.5. Create a .jpg poster for the video, using its first frame.
-# Input: file path, directory. The second parameter for the directory allows this function to be used both for the main file and for any thumbnail videos. Output: None
-def create_video_poster(file_path, directory):
-    video = VideoFileClip(file_path)
-    full_file_name = os.path.split(file_path)[1]
-    file_name = os.path.splitext(full_file_name)[0]
-    destination_path = os.path.join(settings.MEDIA_PATH, TemporaryUpload.UPLOAD_TO, directory, file_name + '.jpg')
-    video.save_frame(destination_path)
-    
-    del video
-    process_has_ended = False
-    while not process_has_ended:
-        try:
-            os.rename(file_path,file_path+"_")
-            os.rename(file_path+"_",file_path)
-            process_has_ended = True
-        except PermissionError:
-            pass
+# 3.5. Create the files derived from the video in one ffmpeg process, so that the video is read once: the .jpg poster, the thumbnail video and its poster, and the
+# hover preview for gallery tiles. Which files are made depends on the 'poster_directory', 'thumbnail', and 'hover_preview' keys. Previously, MoviePy opened the
+# whole clip once for the poster and again for the thumbnail's poster, to save one frame each time.
+# Output: The metadata dictionary with a 'has_hover_preview' key.
+def create_video_derivatives(file, metadata, hosting_limits):
+    processing_directory = os.path.join(settings.MEDIA_PATH, TemporaryUpload.UPLOAD_TO)
+    file_name = os.path.splitext(os.path.split(file.path)[1])[0]
+    paths = {}
+    if 'poster_directory' in hosting_limits:
+        paths['poster'] = os.path.join(processing_directory, hosting_limits['poster_directory'], file_name + '.jpg')
+    if 'thumbnail' in hosting_limits and needs_thumbnail(metadata, hosting_limits):
+        paths['thumbnail'] = get_destination_path(file, hosting_limits['thumbnail'][2])
+        if 'poster_directory' in hosting_limits:
+            # The thumbnail's poster is within a subdirectory of the poster directory, with the same name as the thumbnail directory.
+            paths['poster_thumbnail'] = os.path.join(processing_directory, hosting_limits['poster_directory'], hosting_limits['thumbnail'][2], file_name + '.jpg')
+    if needs_hover_preview(metadata, hosting_limits):
+        paths['hover_preview'] = os.path.join(processing_directory, hosting_limits['hover_preview'][2], file_name + '.mp4')
+        os.makedirs(os.path.dirname(paths['hover_preview']), exist_ok=True)
+    save_video_derivatives(file.path, paths, metadata, hosting_limits)
+    metadata['has_hover_preview'] = 'hover_preview' in paths
+    return metadata
+
+# The posters are chosen from the video's keyframes, which are decoded without decoding the frames between them, so choosing among them is fast. Keyframes that
+# are mostly black or white, like a fade in or a blank title card, are skipped by their average luminance, and ffmpeg's thumbnail filter picks the most
+# representative of the first POSTER_CANDIDATES that remain, the frame whose color histogram is closest to their average.
+POSTER_CANDIDATES = 5
+POSTER_LUMINANCE_RANGE = (24, 232)
+
+# 3.5.1. Use ffmpeg to write each of the derived files whose path is given. This function is also used by the rederive_media management command.
+# Input: source_path, paths, a dictionary which may have 'poster', 'poster_thumbnail', 'thumbnail', and 'hover_preview' keys. metadata, hosting_limits.
+# Output: None
+def save_video_derivatives(source_path, paths, metadata, hosting_limits):
+    thumbnail_dimensions = None
+    if 'thumbnail' in paths or 'poster_thumbnail' in paths:
+        thumbnail_dimensions = get_thumbnail_dimensions(metadata, hosting_limits)
+        # Match the even dimensions of the thumbnail video, which are rounded down for the yuv420p pixel format.
+        thumbnail_dimensions = (thumbnail_dimensions[0] // 2 * 2, thumbnail_dimensions[1] // 2 * 2)
+    if 'thumbnail' in paths and not paths['thumbnail'].endswith(settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS['video/mp4']):
+        # Only .mp4 thumbnails share the process. Other formats are written with the options chosen by write_videofile().
+        save_video_thumbnail(source_path, paths['thumbnail'], metadata, hosting_limits)
+        paths = dict((key, path) for key, path in paths.items() if key != 'thumbnail')
+    inputs, filters, outputs = [], [], []
+    if 'thumbnail' in paths or 'hover_preview' in paths:
+        inputs = inputs + ['-i', source_path]
+    if 'hover_preview' in paths:
+        preview_dimensions = thumbnail_dimensions
+        if preview_dimensions == None:
+            preview_dimensions = (metadata['width'] // 2 * 2, metadata['height'] // 2 * 2)
+        output_bitrate = get_output_bitrate(metadata, hosting_limits, preview_dimensions)[0]
+        filters = filters + ['[0:v]' + get_hover_preview_filter(metadata, hosting_limits, preview_dimensions) + '[hover_preview]']
+        outputs = outputs + ['-map', '[hover_preview]', '-an', '-c:v', 'libx264', '-b:v', output_bitrate, '-pix_fmt', 'yuv420p']
+        if 'ffmpeg_threads' in hosting_limits:
+            # run_ffmpeg() only limits the threads of the last output.
+            outputs = outputs + ['-threads', str(hosting_limits['ffmpeg_threads'])]
+        outputs = outputs + [paths['hover_preview']]
+    if 'poster' in paths or 'poster_thumbnail' in paths:
+        # The keyframes are read from the video opened a second time, because skipping the other frames applies to the whole input.
+        keyframe_input = str(len([argument for argument in inputs if argument == '-i']))
+        inputs = inputs + ['-skip_frame', 'nokey', '-i', source_path]
+        filters = filters + get_poster_filters(keyframe_input, paths, thumbnail_dimensions)
+        for key in ('poster', 'poster_thumbnail'):
+            if key in paths:
+                outputs = outputs + ['-map', '[' + key + ']', '-frames:v', '1', '-q:v', '2', paths[key]]
+    if 'thumbnail' in paths:
+        # The thumbnail video is the last output, so that run_ffmpeg() limits its threads. Its audio is copied if the video has any.
+        output_bitrate = get_output_bitrate(metadata, hosting_limits, thumbnail_dimensions)[0]
+        outputs = outputs + ['-map', '0:v', '-map', '0:a?'] + get_mp4_output_arguments(output_bitrate, hosting_limits, thumbnail_dimensions) + [paths['thumbnail']]
+    if len(outputs) == 0:
+        return
+    command = inputs
+    if len(filters) > 0:
+        command = command + ['-filter_complex', ';'.join(filters)]
+    run_ffmpeg(command + outputs, hosting_limits)
+    # If every keyframe was skipped, like in a video which is black throughout, ffmpeg doesn't write the posters. Use the first frame instead.
+    if 'poster' in paths and not os.path.exists(paths['poster']):
+        save_video_poster(source_path, paths['poster'], hosting_limits)
+    if 'poster_thumbnail' in paths and not os.path.exists(paths['poster_thumbnail']):
+        save_video_poster(source_path, paths['poster_thumbnail'], hosting_limits, thumbnail_dimensions)
+
+# 3.5.1.1. Return the filter chains that choose the poster frame from the keyframe input and label it for the poster and the thumbnail's poster.
+# Input: keyframe_input, the index of the input as a string. paths dictionary. thumbnail_dimensions, a (width, height) tuple or None. Output: list of strings
+def get_poster_filters(keyframe_input, paths, thumbnail_dimensions):
+    chain = '[' + keyframe_input + ':v]signalstats,' + \
+            'metadata=mode=select:key=lavfi.signalstats.YAVG:value=' + str(POSTER_LUMINANCE_RANGE[0]) + ':function=greater,' + \
+            'metadata=mode=select:key=lavfi.signalstats.YAVG:value=' + str(POSTER_LUMINANCE_RANGE[1]) + ':function=less,' + \
+            'thumbnail=' + str(POSTER_CANDIDATES)
+    if thumbnail_dimensions != None:
+        thumbnail_scale_filter = 'scale=' + str(thumbnail_dimensions[0]) + ':' + str(thumbnail_dimensions[1])
+    if 'poster' in paths and 'poster_thumbnail' in paths:
+        return [chain + ',split=2[poster][poster_thumbnail_source]', '[poster_thumbnail_source]' + thumbnail_scale_filter + '[poster_thumbnail]']
+    if 'poster' in paths:
+        return [chain + '[poster]']
+    return [chain + ',' + thumbnail_scale_filter + '[poster_thumbnail]']
+
+# 3.5.1.2. Return the filter chain for the hover preview, a silent video made of short clips sampled evenly across the video, from the 'hover_preview' key. Each clip
+# is taken from the middle of its part of the video, and the timestamps are renumbered so that the clips play one after another.
+# Input: metadata, hosting_limits, new_dimensions tuple. Output: string
+def get_hover_preview_filter(metadata, hosting_limits, new_dimensions):
+    number_of_clips, clip_duration = hosting_limits['hover_preview'][0], hosting_limits['hover_preview'][1]
+    interval = metadata['duration'] / number_of_clips
+    clip_start = (interval - clip_duration) / 2
+    clip_end = clip_start + clip_duration
+    interval, clip_start, clip_end = format(interval, '.3f'), format(clip_start, '.3f'), format(clip_end, '.3f')
+    return "select='gte(mod(t," + interval + ")," + clip_start + ")*lt(mod(t," + interval + ")," + clip_end + ")',setpts=N/FRAME_RATE/TB," + \
+           'scale=' + str(new_dimensions[0]) + ':' + str(new_dimensions[1])
+
+# 3.5.2. Use ffmpeg to save the first frame of a video as a JPEG, optionally scaled to new dimensions.
+# Input: source_path, destination_path, hosting_limits, new_dimensions tuple or None. Output: None
+def save_video_poster(source_path, destination_path, hosting_limits, new_dimensions=None):
+    command = ['-i', source_path, '-frames:v', '1', '-q:v', '2']
+    if new_dimensions != None:
+        command = command + ['-vf', 'scale=' + str(new_dimensions[0]) + ':' + str(new_dimensions[1])]
+    run_ffmpeg(command + [destination_path], hosting_limits)
+
+# 3.5.3. Return True if the 'hover_preview' key is given and the video is more than twice as long as the preview, so that the preview is worth loading instead.
+def needs_hover_preview(metadata, hosting_limits):
+    return 'hover_preview' in hosting_limits and metadata['duration'] > hosting_limits['hover_preview'][0] * hosting_limits['hover_preview'][1] * 2
 
 # 3.6. Handle characteristics that are unique to processing MP4 files.
 # First, if the file is ever re-encoded using the libx264 codec, then its dimensions will have to be rounded down to be even or an exception occurs.
@@ -571,13 +715,61 @@ def improve_mp4_data(file, metadata, hosting_limits, save_type_list, new_dimensi
     os.remove(file.path)
     os.rename(file.path+"_",file.path)
 
+# 3.7. Run ffmpeg with a list of arguments, in a process limited by the 'process_limits' and 'ffmpeg_threads' keys of hosting_limits. The memory limit applies to the
+# address space, because Linux doesn't enforce a limit on resident memory. When ffmpeg exceeds the CPU time limit, the kernel stops it with SIGXCPU, and when it
+# exceeds the memory limit, its allocations fail. Either way, ProcessingLimitError is raised so that the view can tell the user the file couldn't be processed.
+# When the progress of the current stage is being reported to the upload modal, ffmpeg also writes its progress to standard output.
+# Input: arguments, a list of strings ending with the output path. hosting_limits. Output: None
+def run_ffmpeg(arguments, hosting_limits):
+    if 'ffmpeg_threads' in hosting_limits:
+        # Each encoding thread has its own buffers, so limiting the threads keeps memory use predictable. The option has to come before the output path.
+        arguments = arguments[:-1] + ['-threads', str(hosting_limits['ffmpeg_threads'])] + arguments[-1:]
+    command = [FFMPEG_BINARY, '-nostdin', '-y'] + arguments
+    try:
+        if is_measuring_progress():
+            run_ffmpeg_with_progress(command, hosting_limits)
+        else:
+            subprocess.check_output(get_limited_command(command, hosting_limits), stderr=subprocess.STDOUT, universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        # A negative return code means that ffmpeg was stopped by a signal, such as SIGXCPU or SIGKILL.
+        if e.returncode < 0 or 'Cannot allocate memory' in e.output:
+            raise ProcessingLimitError("ffmpeg exceeded the processing limits. " + e.output[-1000:])
+        raise IOError(e.output)
+
+# 3.7.1. Return a command which starts ffmpeg with the resource limits. The limits are set by a separate program, prlimit or limited_exec.py, which then replaces
+# itself with ffmpeg. subprocess's preexec_fn isn't used, because the web server runs requests in threads, and running Python code in the child between fork and
+# exec can deadlock it when the parent has other threads.
+# Input: command, a list of strings. hosting_limits. Output: The command, unchanged if the limits can't be set on this OS or the hosting limits don't include them.
+def get_limited_command(command, hosting_limits):
+    if os.name == 'nt' or 'process_limits' not in hosting_limits:
+        # On a Windows development server, ffmpeg runs without memory and CPU time limits.
+        return command
+    max_memory, max_cpu_time = hosting_limits['process_limits']
+    prlimit_path = shutil.which('prlimit')
+    if prlimit_path != None:
+        return [prlimit_path, '--as=' + str(max_memory), '--cpu=' + str(max_cpu_time)] + command
+    return [sys.executable, LIMITED_EXEC_PATH, str(max_memory), str(max_cpu_time)] + command
+
+LIMITED_EXEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'limited_exec.py')
+
+# 3.7.2. Run ffmpeg while reading its progress. ffmpeg's log goes to a temporary file rather than a pipe, so that a long log can't fill the pipe and stall ffmpeg
+# while the progress is being read from the other pipe.
+# Input: command, a list of strings. hosting_limits. Output: None. If ffmpeg fails, CalledProcessError is raised with the log as its output, like check_output().
+def run_ffmpeg_with_progress(command, hosting_limits):
+    command = command[:1] + ['-progress', 'pipe:1', '-nostats'] + command[1:]
+    with tempfile.TemporaryFile() as log_file:
+        process = subprocess.Popen(get_limited_command(command, hosting_limits), stdout=subprocess.PIPE, stderr=log_file, universal_newlines=True)
+        read_ffmpeg_progress(process.stdout)
+        process.stdout.close()
+        return_code = process.wait()
+        if return_code != 0:
+            log_file.seek(0)
+            raise subprocess.CalledProcessError(return_code, command, output=log_file.read().decode('utf-8', 'replace'))
+
 # 4. Use the 'thumbnail' key within hosting_limits to save a thumbnail image.
 def create_image_thumbnail(file, metadata, hosting_limits):
-    new_dimensions = get_thumbnail_dimensions(metadata, hosting_limits)
     destination_path = get_destination_path(file, hosting_limits['thumbnail'][2])
-    image = Image.open(file.path)
-    image.thumbnail(new_dimensions)
-    save_image(image, destination_path, hosting_limits, metadata['mime_type'])
+    save_image_thumbnail(file.path, destination_path, metadata, hosting_limits)
 
 # 4.1 Input: metadata dictionary, hosting_limits dictionary.
 # Output: (width, height) tuple of the thumbnail
@@ -598,30 +790,145 @@ def get_destination_path(file, directory):
     destination_path = os.path.join(settings.MEDIA_PATH, TemporaryUpload.UPLOAD_TO, directory, full_file_name)
     return destination_path
 
-# 5. Use the 'thumbnail' key within hosting_limits to save a thumbnail video. If there is a 'poster_directory' key, it will also create a thumbnail of the poster
-# within a subdirectory of the poster directory. This subdirectory has the same name as the main thumbnail directory.
-def create_video_thumbnail(file, metadata, hosting_limits):
+# 4.3. Save a thumbnail of an image file. This function is also used by the rederive_media management command.
+# Input: source_path, destination_path, metadata dictionary, hosting_limits dictionary. Output: None
+def save_image_thumbnail(source_path, destination_path, metadata, hosting_limits):
+    new_dimensions = get_thumbnail_dimensions(metadata, hosting_limits)
+    image = Image.open(source_path)
+    image.thumbnail(new_dimensions)
+    save_image(image, destination_path, hosting_limits, metadata['mime_type'])
+
+# 5. Save a thumbnail of a video file, in a format other than .mp4. An .mp4 thumbnail is written by save_video_derivatives().
+# Input: source_path, destination_path, metadata dictionary, hosting_limits dictionary. Output: None
+def save_video_thumbnail(source_path, destination_path, metadata, hosting_limits):
     new_dimensions = get_thumbnail_dimensions(metadata, hosting_limits)
     output_bitrate = get_output_bitrate(metadata, hosting_limits, new_dimensions)[0]
-    
-    destination_path = get_destination_path(file, hosting_limits['thumbnail'][2])
-    video = VideoFileClip(file.path)
-    video = video.resize(new_dimensions)
-    if destination_path.endswith(settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS['video/mp4']):
-        write_mp4(video, destination_path, output_bitrate, hosting_limits)
+    write_videofile(source_path, destination_path, output_bitrate, metadata, hosting_limits, new_dimensions)
+
+# 5.1. Return True if the file is over the thumbnail threshhold in the dimension named by the 'thumbnail' key, so that it needs a thumbnail.
+def needs_thumbnail(metadata, hosting_limits):
+    return (hosting_limits['thumbnail'][0] == 'width' and metadata['width'] > hosting_limits['thumbnail'][1]) or \
+           (hosting_limits['thumbnail'][0] == 'height' and metadata['height'] > hosting_limits['thumbnail'][1])
+
+# 6. Use the 'renditions' key within hosting_limits to save copies of the still images associated with the upload in lighter-weight formats like WebP.
+# For an image, these are the image and its thumbnail. For a video, these are the poster and the poster's thumbnail. Each rendition is saved next to
+# the file it was made from, with the same name and a different extension, so that the files can be moved and deleted together.
+# Output: The metadata dictionary with a 'rendition_types' key listing the MIME types that were saved.
+def create_renditions(file, metadata, hosting_limits):
+    renditions = get_supported_renditions(hosting_limits['renditions'])
+    for source_path in get_rendition_source_paths(file, metadata, hosting_limits):
+        save_renditions(source_path, renditions)
+    metadata['rendition_types'] = [rendition[0] for rendition in renditions]
+    return metadata
+
+# 6.1. Filter the (MIME type, quality) tuples down to the formats that the installed Pillow build is able to encode. WebP support depends on libwebp being
+# present when Pillow was built, and AVIF support requires a recent Pillow or the pillow-avif-plugin package.
+# Input: renditions, the tuple from hosting_limits. Output: list of (MIME type, quality) tuples
+def get_supported_renditions(renditions):
+    # Image.init() loads all of Pillow's format plugins, so that Image.SAVE contains every format which Pillow can write.
+    Image.init()
+    supported_renditions = []
+    for rendition in renditions:
+        extension = settings.RENDITION_TYPES_AND_PREFERRED_EXTENSIONS[rendition[0]]
+        if extension in Image.EXTENSION and Image.EXTENSION[extension] in Image.SAVE:
+            supported_renditions = supported_renditions + [rendition]
+    return supported_renditions
+
+# 6.2. Return the paths to the still images that exist for the upload within the directory for processing validated files.
+def get_rendition_source_paths(file, metadata, hosting_limits):
+    source_paths = []
+    if metadata['motion_type'] == 'image':
+        source_paths = source_paths + [file.path]
+        if 'thumbnail' in hosting_limits:
+            source_paths = source_paths + [get_destination_path(file, hosting_limits['thumbnail'][2])]
     else:
-        video.write_videofile(destination_path, bitrate = output_bitrate)
-
-    del video
-    process_has_ended = False
-    while not process_has_ended:
-        try:
-            os.rename(file.path,file.path+"_")
-            os.rename(file.path+"_",file.path)
-            process_has_ended = True
-        except PermissionError:
-            pass
-        
-    if 'poster_directory' in hosting_limits:
-        poster_thumbnail_directory = os.path.join(hosting_limits['poster_directory'], hosting_limits['thumbnail'][2])
-        create_video_poster(destination_path, poster_thumbnail_directory)
+        if 'poster_directory' in hosting_limits:
+            poster_file_name = os.path.splitext(os.path.split(file.name)[1])[0] + '.jpg'
+            source_paths = source_paths + [os.path.join(settings.MEDIA_PATH, TemporaryUpload.UPLOAD_TO, hosting_limits['poster_directory'], poster_file_name)]
+            if 'thumbnail' in hosting_limits:
+                source_paths = source_paths + [os.path.join(settings.MEDIA_PATH, TemporaryUpload.UPLOAD_TO, hosting_limits['poster_directory'],
+                                                            hosting_limits['thumbnail'][2], poster_file_name)]
+    # A thumbnail is only created for a file over the width threshhold, so leave out any path that doesn't exist.
+    return [source_path for source_path in source_paths if os.path.exists(source_path)]
+
+# 6.3. Save an image in each of the rendition formats. This function is also used by the create_renditions management command for existing uploads.
+# Input: source_path, the path to a JPEG or PNG. renditions, a list of (MIME type, quality) tuples. Output: None
+def save_renditions(source_path, renditions):
+    image = Image.open(source_path)
+    if image.mode not in ('RGB', 'RGBA'):
+        # WebP and AVIF only hold true color images. Keep the alpha channel of a PNG with transparent areas.
+        if image.mode in ('LA', 'PA') or 'transparency' in image.info:
+            image = image.convert('RGBA')
+        else:
+            image = image.convert('RGB')
+    extless_source_path = os.path.splitext(source_path)[0]
+    for mime_type, quality in renditions:
+        image.save(extless_source_path + settings.RENDITION_TYPES_AND_PREFERRED_EXTENSIONS[mime_type], quality=quality)
+    del image
+
+# 7. Use the 'hls_ladder' key within hosting_limits to save an HTTP Live Streaming version of the video. Each rung of the ladder is a copy of the video at a lower
+# height, split into short segments and listed in its own playlist. A master playlist lists every rung, so that the player can switch between them based on the
+# viewer's connection speed. The top rung is the processed video at its own resolution. All of the files are saved to a directory with the same name as the file,
+# within the ladder's directory.
+# Output: The metadata dictionary with an 'hls_rungs' key listing the heights of the rungs from lowest to highest.
+def create_hls_ladder(file, metadata, hosting_limits):
+    file_name = os.path.splitext(os.path.split(file.name)[1])[0]
+    destination_directory = os.path.join(settings.MEDIA_PATH, TemporaryUpload.UPLOAD_TO, hosting_limits['hls_ladder'][2], file_name)
+    return save_hls_ladder(file.path, destination_directory, metadata, hosting_limits)
+
+# 7.1. Use ffmpeg to write the segments and the playlist for one rung of the ladder. Every rung is re-encoded, including the top one, because a player can only
+# switch rungs where all of them have a keyframe. Segmenting the video without re-encoding would cut the top rung at the video's own keyframes instead.
+# Input: file_path, destination_directory, rung_name, metadata, hosting_limits, new_dimensions, output_bitrate (a string such as '53k'). Output: None
+def write_hls_rung(file_path, destination_directory, rung_name, metadata, hosting_limits, new_dimensions, output_bitrate):
+    segment_duration = str(hosting_limits['hls_ladder'][1])
+    command = ['-i', file_path, '-vf', 'scale=' + str(new_dimensions[0]) + ':' + str(new_dimensions[1]),
+               '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-b:v', output_bitrate, '-maxrate', output_bitrate, '-bufsize', output_bitrate,
+               # Begin every segment with a keyframe, so that the player is able to switch rungs at any segment boundary.
+               '-force_key_frames', 'expr:gte(t,n_forced*' + segment_duration + ')']
+    if 'preset' in hosting_limits:
+        command = command + ['-preset', hosting_limits['preset']]
+    if metadata['has_audio']:
+        command = command + ['-c:a', 'aac', '-b:a', '96k']
+    else:
+        command = command + ['-an']
+    command = command + ['-f', 'hls', '-hls_time', segment_duration, '-hls_list_size', '0', '-hls_playlist_type', 'vod',
+                         '-hls_segment_filename', os.path.join(destination_directory, rung_name + '_%03d.ts'),
+                         os.path.join(destination_directory, rung_name + '.m3u8')]
+    run_ffmpeg(command, hosting_limits)
+
+# 7.2. Write the master playlist, which lists the playlist of each rung along with its bandwidth and resolution.
+# Input: destination_directory, playlist_entries, a list of (playlist file name, bandwidth, (width, height)) tuples. Output: None
+def write_master_playlist(destination_directory, playlist_entries):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for playlist_file_name, bandwidth, dimensions in playlist_entries:
+        lines = lines + ['#EXT-X-STREAM-INF:BANDWIDTH=' + str(bandwidth) + ',RESOLUTION=' + str(dimensions[0]) + 'x' + str(dimensions[1]), playlist_file_name]
+    outfile = open(os.path.join(destination_directory, 'master.m3u8'), 'w')
+    outfile.write('\n'.join(lines) + '\n')
+    outfile.close()
+
+# 7.3. Write the ladder of a video file to a directory. This function is also used by the rederive_media management command.
+# Input: source_path, destination_directory, metadata dictionary, hosting_limits dictionary. Output: The metadata dictionary with an 'hls_rungs' key.
+def save_hls_ladder(source_path, destination_directory, metadata, hosting_limits):
+    os.makedirs(destination_directory, exist_ok=True)
+    # Each entry in this list is a (playlist file name, bandwidth in bits/second, (width, height)) tuple for the master playlist.
+    playlist_entries = []
+    metadata['hls_rungs'] = []
+    # Each entry in this list is a (rung name, stage description, (width, height), output bitrate) tuple. The yuv420p color space requires even dimensions.
+    rungs = []
+    for height in hosting_limits['hls_ladder'][0]:
+        if height < metadata['height']:
+            new_dimensions = (round(metadata['width'] * height / metadata['height'] / 2) * 2, height)
+            rungs = rungs + [(str(height) + 'p', "Creating the " + str(height) + "p streaming version", new_dimensions,
+                              get_output_bitrate(metadata, hosting_limits, new_dimensions)[0])]
+    rungs = rungs + [('original', "Creating the full-resolution streaming version", (metadata['width'] // 2 * 2, metadata['height'] // 2 * 2),
+                      get_output_bitrate(metadata, hosting_limits, None)[0])]
+    for rung_name, stage_description, new_dimensions, output_bitrate in rungs:
+        set_stage(stage_description, metadata['duration'])
+        write_hls_rung(source_path, destination_directory, rung_name, metadata, hosting_limits, new_dimensions, output_bitrate)
+        bandwidth = int(output_bitrate[:-1]) * 1000
+        if metadata['has_audio']:
+            bandwidth += 96000
+        playlist_entries = playlist_entries + [(rung_name + '.m3u8', bandwidth, new_dimensions)]
+        metadata['hls_rungs'] = metadata['hls_rungs'] + [new_dimensions[1]]
+    write_master_playlist(destination_directory, playlist_entries)
+    return metadata
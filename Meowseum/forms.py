@@ -13,10 +13,6 @@ from django.shortcuts import render
 from django.core.validators import RegexValidator
 from Meowseum.common_view_functions import merge_two_dicts
 
-# Variables used by multiple forms
-
-popular_tags = Tag.get_popular_tag_names() # When no tags have been added to the site yet, the multiselect will appear blank.
-
 # Forms
 class SignupForm(CustomModelForm):
     password_confirmation = forms.CharField(max_length=User._meta.get_field('password').max_length, label='', widget=forms.PasswordInput(attrs={"placeholder":"Confirm password"}))
@@ -78,6 +74,10 @@ class LoginForm(CustomModelForm):
 
 class FromDeviceForm(CustomModelForm):
     file = MetadataRestrictedFileField()
+    # This checkbox is shown after a file is flagged as a duplicate of an existing upload.
+    allow_duplicate = forms.BooleanField(required=False, label="Upload it anyway")
+    # JavaScript fills in a random key before submitting the file, then polls the processing_progress page with it while the file is processed.
+    progress_key = forms.RegexField(regex=r'^\w*$', max_length=32, required=False, widget=forms.HiddenInput)
     def __init__(self, *args, **kwargs):
         super(FromDeviceForm,self).__init__(*args, **kwargs)
         self.fields['file'].required = True
@@ -112,7 +112,8 @@ def validate_tags(string):
 class UploadPage1(EditUploadForm):
     upload_type = forms.ChoiceField(required=False, choices=(('adoption', 'Up for adoption'), ('lost', 'Lost'), ('found','Found'), ('pets','Pets')), initial='pets', widget=forms.RadioSelect() )
     tags = forms.CharField(required=False, label='Tag list', validators=[validate_tags], initial='#')
-    popular_tags = MultipleChoiceField(required=False, label='Browse popular tags', choices=popular_tags)
+    # The choices are set when the form is created. When no tags have been added to the site yet, the multiselect will appear blank.
+    popular_tags = MultipleChoiceField(required=False, label='Browse popular tags', choices=())
     class Meta(EditUploadForm.Meta):
         fields = ('title', 'description', 'upload_type', 'tags', 'popular_tags', 'is_publicly_listed', 'uploader_has_disabled_comments')
     def __init__(self, *args, **kwargs):
@@ -120,6 +121,7 @@ class UploadPage1(EditUploadForm):
         if self.request != None:
             self.CONTACT_INFO_ERROR = mark_safe(render(self.request, 'en/public/missing_contact_information_error_message.html').content.decode('utf-8'))
         super(UploadPage1, self).__init__(*args, **kwargs)
+        self.fields['popular_tags'].choices = Tag.get_popular_tag_names()
     def clean(self):
         cleaned_data = super(UploadPage1, self).clean()
         upload_type = self.cleaned_data.get('upload_type')
@@ -0,0 +1,111 @@
+# Description: A bus which tells every worker process, on every host, when a family of cached values has gone stale, so that values cached in a process's own
+# memory can be evicted everywhere instead of only in the process which handled the change. signals.py publishes the name of a namespace when a record it's
+# derived from changes, and the code which caches values subscribes a function to the namespaces it uses, like model_cache.py does. The function is called in
+# the publishing process after the transaction commits, and in every other process when the notification arrives.
+# With the 'postgres' transport, events are sent with PostgreSQL's NOTIFY, which delivers them when the transaction commits, and each process receives them
+# in a background thread which LISTENs on its own connection. The thread is started by the process's first request, so management commands don't start it.
+# If the connection is lost, notifications sent in the meantime are lost too, so after reconnecting, every subscriber is called as if each namespace had been
+# published. With the 'local' transport, which is used while running tests, events only reach the publishing process. The settings are in
+# settings.INVALIDATION_BUS.
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connection, connections, transaction
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# The functions subscribed to each namespace.
+subscribers = {}
+listener_lock = threading.Lock()
+listener_thread = None
+
+# 1. Call callback(namespace, from_this_process) whenever a namespace is published. from_this_process is False for events from other processes, so that a
+# subscriber whose values are in a cache shared between processes can leave them to the process which published the event.
+def subscribe(namespace, callback):
+    subscribers.setdefault(namespace, []).append(callback)
+
+# 2. Tell every process that the values in a namespace are stale. The event is sent when the current transaction commits, so that no process can cache the
+# values again from data which is about to change.
+# Input: namespace. Output: None.
+def publish(namespace):
+    if settings.INVALIDATION_BUS['TRANSPORT'] == 'postgres':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [settings.INVALIDATION_BUS['CHANNEL'], get_process_name() + ' ' + namespace])
+    transaction.on_commit(lambda: dispatch(namespace, True))
+
+# 2.1. Call the subscribers of a namespace. One subscriber's error doesn't keep the others from evicting their values.
+def dispatch(namespace, from_this_process):
+    for callback in subscribers.get(namespace, []):
+        try:
+            callback(namespace, from_this_process)
+        except Exception:
+            logger.exception("The invalidation of " + namespace + " failed.")
+
+# 2.2. Return a name which is different for each process, so that a process can recognize its own events. It's found for each call, because processes which
+# are forked from a parent share the parent's memory.
+def get_process_name():
+    return socket.gethostname() + ':' + str(os.getpid())
+
+# 3. Start the background thread which receives the other processes' events, unless it's running. This is connected to the request_started signal.
+def start_listener(**kwargs):
+    global listener_thread
+    if settings.INVALIDATION_BUS['TRANSPORT'] != 'postgres' or (listener_thread != None and listener_thread.is_alive() and listener_thread.pid == os.getpid()):
+        return
+    with listener_lock:
+        if listener_thread == None or not listener_thread.is_alive() or listener_thread.pid != os.getpid():
+            listener_thread = threading.Thread(target=listen, name='invalidation_bus_listener', daemon=True)
+            listener_thread.pid = os.getpid()
+            listener_thread.start()
+
+request_started.connect(start_listener)
+
+# 3.1. Receive events for as long as the process runs, reconnecting after an error.
+def listen():
+    has_connected = False
+    while True:
+        pg_connection = None
+        try:
+            pg_connection = get_listening_connection()
+            if has_connected:
+                # Events may have been sent while the connection was down.
+                for namespace in list(subscribers.keys()):
+                    dispatch(namespace, False)
+            has_connected = True
+            receive_events(pg_connection)
+        except Exception:
+            logger.exception("The invalidation bus lost its connection. Reconnecting in " + str(settings.INVALIDATION_BUS['RECONNECT_SECONDS']) + " seconds.")
+        finally:
+            if pg_connection != None:
+                try:
+                    pg_connection.close()
+                except Exception:
+                    pass
+        time.sleep(settings.INVALIDATION_BUS['RECONNECT_SECONDS'])
+
+# 3.1.1. Open a psycopg2 connection of its own with the database settings, outside of Django's connection handling, and LISTEN on the channel. It's in
+# autocommit mode, because notifications are only received between transactions.
+def get_listening_connection():
+    database = connections['default']
+    pg_connection = database.get_new_connection(database.get_connection_params())
+    pg_connection.autocommit = True
+    with pg_connection.cursor() as cursor:
+        cursor.execute('LISTEN "' + settings.INVALIDATION_BUS['CHANNEL'] + '"')
+    return pg_connection
+
+# 3.1.2. Wait for notifications and dispatch the events of other processes. select() wakes up at least every POLL_SECONDS, so that a dead connection is noticed
+# by poll() raising an error.
+def receive_events(pg_connection):
+    while True:
+        select.select([pg_connection], [], [], settings.INVALIDATION_BUS['POLL_SECONDS'])
+        pg_connection.poll()
+        while pg_connection.notifies:
+            notification = pg_connection.notifies.pop(0)
+            process_name, separator, namespace = notification.payload.partition(' ')
+            if process_name != get_process_name():
+                dispatch(namespace, False)
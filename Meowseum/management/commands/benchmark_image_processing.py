@@ -0,0 +1,89 @@
+# Description: Measure the peak memory used to shrink a very large still image, with and without the memory budget from hosting_limits_for_Upload. The command
+# generates a PNG and a JPEG of ffmpeg's testsrc2 pattern at the given number of megapixels, then shrinks each one to the largest of the 'max_dimensions' for
+# images, first by decoding it at full size, then with open_image_within_memory_budget(). Each measurement runs in a fresh Python process, so that its peak
+# resident memory only covers that measurement. This command only runs on UNIX, because it uses the resource module.
+# Usage: python manage.py benchmark_image_processing [--megapixels 50]
+
+from django.core.management.base import BaseCommand, CommandError
+from multiprocessing import Process, Queue
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from PIL import Image
+from moviepy.config_defaults import FFMPEG_BINARY
+from Meowseum.models import hosting_limits_for_Upload
+from Meowseum.file_handling.large_images import open_image_within_memory_budget, MemoryBudgetError
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class Command(BaseCommand):
+    help = "Record the peak memory of shrinking a very large image, with and without the memory budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--megapixels', type=int, default=50, help="Resolution of the test images, with a 3:2 aspect ratio.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        if resource == None:
+            raise CommandError("This command requires the resource module, which is only available on UNIX.")
+        # The width and height are even, with a 3:2 aspect ratio like most camera sensors.
+        height = int((options['megapixels'] * 1000000 / 1.5) ** 0.5) // 2 * 2
+        width = height * 3 // 2
+        size = hosting_limits_for_Upload['max_dimensions']['image'][0]
+        memory_budget = hosting_limits_for_Upload['image_memory_budget']
+        self.stdout.write("Shrinking " + str(width) + "x" + str(height) + " images to fit " + str(size[0]) + "x" + str(size[1]) + ", with a budget of " +
+                          str(memory_budget // 1048576) + " MB.")
+        self.stdout.write("Format  Method         Processing time (s)  Peak RSS (MB)  Result")
+        temporary_directory = tempfile.mkdtemp()
+        try:
+            for extension in ('.png', '.jpg'):
+                source_path = create_test_image(temporary_directory, extension, width, height)
+                for method in ('full decode', 'budget'):
+                    queue = Queue()
+                    process = Process(target=measure_processing, args=(source_path, method, size, memory_budget, queue))
+                    process.start()
+                    elapsed_time, peak_rss, result = queue.get()
+                    process.join()
+                    self.stdout.write(format(extension[1:].upper(), '6s') + '  ' + format(method, '13s') + format(elapsed_time, '21.1f') + format(peak_rss, '15.1f') +
+                                      '  ' + result)
+                os.remove(source_path)
+        finally:
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+
+# 1. Generate a test image with ffmpeg's testsrc2 pattern, which has gradients and sharp edges, so that it compresses like a drawing rather than a flat color.
+# Input: directory, extension, width, height. Output: The path to the image.
+def create_test_image(directory, extension, width, height):
+    destination_path = os.path.join(directory, 'test' + extension)
+    command = [FFMPEG_BINARY, '-nostdin', '-y', '-f', 'lavfi', '-i', 'testsrc2=size=' + str(width) + 'x' + str(height), '-frames:v', '1']
+    if extension == '.jpg':
+        command = command + ['-q:v', '2']
+    try:
+        subprocess.check_output(command + [destination_path], stderr=subprocess.STDOUT, universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        raise CommandError(e.output)
+    return destination_path
+
+# 2. This function runs in its own process. Shrink the image to fit the size, the way process_image() in stage2_processing.py would.
+# Output via the queue: processing time in seconds, the peak RSS of this process in MB, and a result string.
+def measure_processing(source_path, method, size, memory_budget, queue):
+    # The test images are larger than Pillow's decompression bomb threshold, which only warns. Uploads this large are rejected by the 'max_pixels' key instead.
+    Image.MAX_IMAGE_PIXELS = None
+    start_time = time.time()
+    try:
+        if method == 'full decode':
+            image = Image.open(source_path)
+            image.load()
+        else:
+            image = open_image_within_memory_budget(source_path, size, memory_budget)
+        image.thumbnail(size)
+        result = 'OK, ' + str(image.size[0]) + 'x' + str(image.size[1])
+    except MemoryBudgetError:
+        result = 'Exceeded image_memory_budget'
+    elapsed_time = time.time() - start_time
+    # On Linux, ru_maxrss is in kilobytes.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((elapsed_time, peak_rss, result))
@@ -0,0 +1,79 @@
+# Description: Measure the peak memory used to process videos of increasing length, to check that it stays flat as the duration grows. For each duration, the command
+# generates a test video with ffmpeg's testsrc and sine sources, then resizes and re-encodes it the way stage 2 processing would, with the limits from
+# hosting_limits_for_Upload. Each measurement runs in a fresh Python process, so that the peak resident memory of its children, the ffmpeg processes, only
+# covers that measurement. This command only runs on UNIX, because it uses the resource module.
+# Usage: python manage.py benchmark_video_processing [--durations 10 60 300 600] [--size 1280x720]
+
+from django.core.management.base import BaseCommand, CommandError
+from multiprocessing import Process, Queue
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from moviepy.config_defaults import FFMPEG_BINARY
+from Meowseum.models import hosting_limits_for_Upload
+from Meowseum.file_handling.stage2_processing import write_videofile, get_output_bitrate, ProcessingLimitError
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class Command(BaseCommand):
+    help = "Record the peak memory of video processing against the length of the video."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--durations', type=int, nargs='+', default=[10, 60, 300, 600], help="Lengths of the test videos in seconds.")
+        parser.add_argument('--size', default='1280x720', help="Dimensions of the test videos, in the form WIDTHxHEIGHT.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        if resource == None:
+            raise CommandError("This command requires the resource module, which is only available on UNIX.")
+        temporary_directory = tempfile.mkdtemp()
+        self.stdout.write("Duration (s)  Processing time (s)  Peak ffmpeg RSS (MB)  Peak Python RSS (MB)  Result")
+        try:
+            for duration in options['durations']:
+                source_path = create_test_video(temporary_directory, duration, options['size'])
+                queue = Queue()
+                process = Process(target=measure_processing, args=(source_path, duration, options['size'], queue))
+                process.start()
+                elapsed_time, peak_ffmpeg_rss, peak_python_rss, result = queue.get()
+                process.join()
+                self.stdout.write(format(duration, '12d') + format(elapsed_time, '21.1f') + format(peak_ffmpeg_rss, '22.1f') + format(peak_python_rss, '22.1f') + '  ' + result)
+                os.remove(source_path)
+        finally:
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+
+# 1. Generate a test video with a moving test pattern and a tone, so that it has an audio track like most uploads.
+# Input: directory, duration in seconds, size string. Output: The path to the video.
+def create_test_video(directory, duration, size):
+    destination_path = os.path.join(directory, 'test_' + str(duration) + '.mp4')
+    command = [FFMPEG_BINARY, '-nostdin', '-y',
+               '-f', 'lavfi', '-i', 'testsrc=duration=' + str(duration) + ':size=' + size + ':rate=30',
+               '-f', 'lavfi', '-i', 'sine=duration=' + str(duration),
+               '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '4M', '-c:a', 'aac', '-shortest', destination_path]
+    try:
+        subprocess.check_output(command, stderr=subprocess.STDOUT, universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        raise CommandError(e.output)
+    return destination_path
+
+# 2. This function runs in its own process. Resize the video to half its dimensions, which re-encodes it at a bitrate from the Power of 0.75 formula.
+# Output via the queue: processing time in seconds, the peak RSS of ffmpeg and of this process in MB, and a result string.
+def measure_processing(source_path, duration, size, queue):
+    width, height = [int(dimension) for dimension in size.split('x')]
+    metadata = {'file_size': os.path.getsize(source_path), 'duration': duration, 'width': width, 'height': height, 'fps': 30}
+    new_dimensions = (width // 2, height // 2)
+    output_bitrate = get_output_bitrate(metadata, hosting_limits_for_Upload, new_dimensions)[0]
+    result = 'OK'
+    start_time = time.time()
+    try:
+        write_videofile(source_path, os.path.splitext(source_path)[0] + '_resized.mp4', output_bitrate, metadata, hosting_limits_for_Upload, new_dimensions)
+    except ProcessingLimitError:
+        result = 'Exceeded process_limits'
+    elapsed_time = time.time() - start_time
+    # On Linux, ru_maxrss is in kilobytes. For RUSAGE_CHILDREN, it is the peak of the largest child process that has ended.
+    peak_ffmpeg_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    peak_python_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((elapsed_time, peak_ffmpeg_rss, peak_python_rss, result))
@@ -0,0 +1,113 @@
+# Description: Test the media storage backend chosen by the MEDIA_STORAGE setting by saving, reading, serving, moving, and deleting files under a scratch name.
+# To test the 's3' backend without Amazon S3, start a local S3-compatible server, like "minio server /tmp/minio" or "moto_server s3 -p 9000", set ENDPOINT_URL
+# to 'http://localhost:9000', and run this command with --create-bucket. The large file is bigger than MULTIPART_THRESHOLD, so that the multipart upload,
+# download, and copy are tested as well.
+# Usage: python manage.py check_media_storage [--create-bucket] [--size MB]
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import shutil
+import tempfile
+import time
+from urllib.request import urlopen
+from Meowseum.file_handling.media_storage import get_media_storage, S3MediaStorage
+from Meowseum.file_handling.file_utility_functions import id_generator
+from Meowseum.file_handling.perceptual_hash import get_file_hash
+
+class Command(BaseCommand):
+    help = "Check that the media storage backend can save, serve, move, and delete files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--create-bucket', action='store_true', help="Create the bucket first if it doesn't exist, such as on a fresh local test server.")
+        parser.add_argument('--size', type=int, default=0, help="Size of the large file in MB. Defaults to twice the multipart threshold.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        media_storage = get_media_storage()
+        if options['create_bucket'] and isinstance(media_storage, S3MediaStorage):
+            create_bucket(media_storage)
+        if options['size'] > 0:
+            large_file_size = options['size'] * 1048576
+        else:
+            large_file_size = settings.MEDIA_STORAGE['MULTIPART_THRESHOLD'] * 2
+        self.stdout.write("Testing the '" + settings.MEDIA_STORAGE['BACKEND'] + "' media storage backend.")
+        temporary_directory = tempfile.mkdtemp()
+        scratch_name = 'storage_check/' + id_generator()
+        try:
+            self.check_small_file(media_storage, temporary_directory, scratch_name)
+            self.check_large_file(media_storage, temporary_directory, scratch_name, large_file_size)
+            self.check_directory(media_storage, temporary_directory, scratch_name)
+        finally:
+            media_storage.delete_directory(scratch_name)
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+        self.stdout.write("All checks passed.")
+
+    # 1. Save a small file, then read it back, fetch it from its URL, and delete it.
+    def check_small_file(self, media_storage, temporary_directory, scratch_name):
+        content = b'Meowseum media storage check'
+        local_path = write_file(os.path.join(temporary_directory, 'small.txt'), content)
+        name = scratch_name + '/small.txt'
+        media_storage.save_file(local_path, name)
+        require(media_storage.exists(name), "The saved file doesn't exist.")
+        require(not os.path.exists(local_path), "The local copy wasn't removed after saving.")
+        require(media_storage.read(name) == content, "The file's contents changed.")
+        url = media_storage.url(name)
+        if url.startswith('http'):
+            require(urlopen(url).read() == content, "The file's URL didn't return its contents.")
+            self.stdout.write("Fetched the file from its URL: " + url.split('?')[0])
+        else:
+            self.stdout.write("The file's URL is " + url + ", which the development server or web server serves from MEDIA_ROOT.")
+        media_storage.delete(name)
+        require(not media_storage.exists(name), "The deleted file still exists.")
+        self.stdout.write("Small file: OK")
+
+    # 2. Save, download, and move a file large enough to be transferred in parts.
+    def check_large_file(self, media_storage, temporary_directory, scratch_name, size):
+        local_path = os.path.join(temporary_directory, 'large.bin')
+        with open(local_path, 'wb') as outfile:
+            for i in range(0, size, 1048576):
+                outfile.write(os.urandom(min(1048576, size - i)))
+        original_hash = get_file_hash(local_path)
+        name = scratch_name + '/large.bin'
+        start_time = time.time()
+        media_storage.save_file(local_path, name)
+        self.stdout.write("Saved " + str(size // 1048576) + " MB in " + format(time.time() - start_time, '.2f') + " seconds.")
+        new_name = scratch_name + '/moved/large.bin'
+        media_storage.move(name, new_name)
+        require(not media_storage.exists(name) and media_storage.exists(new_name), "The file wasn't moved.")
+        download_path = os.path.join(temporary_directory, 'downloaded.bin')
+        media_storage.download(new_name, download_path)
+        require(get_file_hash(download_path) == original_hash, "The downloaded file doesn't match the original.")
+        self.stdout.write("Large file: OK")
+
+    # 3. Save a directory of files, like an HLS ladder, then move it.
+    def check_directory(self, media_storage, temporary_directory, scratch_name):
+        local_directory = os.path.join(temporary_directory, 'ladder')
+        os.makedirs(local_directory)
+        write_file(os.path.join(local_directory, 'master.m3u8'), b'#EXTM3U\n')
+        write_file(os.path.join(local_directory, '240p_000.ts'), b'segment')
+        name = scratch_name + '/ladder'
+        media_storage.save_directory(local_directory, name)
+        new_name = scratch_name + '/renamed_ladder'
+        media_storage.move_directory(name, new_name)
+        require(media_storage.exists(new_name + '/master.m3u8') and media_storage.exists(new_name + '/240p_000.ts'), "The directory wasn't moved.")
+        require(not media_storage.exists(name + '/master.m3u8'), "The directory's old files still exist.")
+        media_storage.delete_directory(new_name)
+        require(not media_storage.exists(new_name + '/240p_000.ts'), "The deleted directory's files still exist.")
+        self.stdout.write("Directory: OK")
+
+# 4. Create the bucket if the server doesn't have it yet.
+def create_bucket(media_storage):
+    existing_bucket_names = [bucket['Name'] for bucket in media_storage.client.list_buckets()['Buckets']]
+    if media_storage.bucket_name not in existing_bucket_names:
+        media_storage.client.create_bucket(Bucket=media_storage.bucket_name)
+
+def require(condition, error_message):
+    if not condition:
+        raise CommandError(error_message)
+
+def write_file(path, content):
+    with open(path, 'wb') as outfile:
+        outfile.write(content)
+    return path
@@ -0,0 +1,86 @@
+# Description: Check that PostgreSQL uses an index for each of the site's most frequent lookups, so that a change to a model or a query which loses an index is
+# noticed before the tables grow large enough for it to matter. The command seeds the tables with a realistic volume of records, updates the planner's
+# statistics with ANALYZE, and runs EXPLAIN on each query. A query passes if its plan uses an index scan and doesn't scan the whole table. Everything runs in a
+# transaction which is rolled back at the end, so the seeded records are never committed, but the seeded tables are locked until it finishes, so run this on a
+# development or staging database after "python manage.py migrate".
+# Usage: python manage.py check_query_plans [--uploads 50000] [--users 2000] [--likes 200000] [--tags 5000]
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+import datetime
+from Meowseum.models import Upload, Metadata, Tag, Like
+
+SEED_PREFIX = 'plan_check_'
+INDEX_SCAN_TYPES = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+class Command(BaseCommand):
+    help = "Seed the database in a rolled back transaction and check that the frequent lookups use indexes, according to EXPLAIN."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=50000, help="Number of uploads and metadata records to seed.")
+        parser.add_argument('--users', type=int, default=2000, help="Number of users to seed.")
+        parser.add_argument('--likes', type=int, default=200000, help="Number of likes to seed, spread across the past year.")
+        parser.add_argument('--tags', type=int, default=5000, help="Number of tags to seed.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            self.stdout.write("Seeding the tables...")
+            users, uploads = seed_tables(options)
+            for description, queryset in get_hot_queries(users, uploads):
+                plan = explain(queryset)
+                if uses_index(plan):
+                    self.stdout.write("PASS  " + description + ": " + plan[0].strip())
+                else:
+                    self.stdout.write("FAIL  " + description + ":\n" + '\n'.join(plan))
+                    failures = failures + [description]
+            transaction.set_rollback(True)
+        if len(failures) > 0:
+            raise CommandError("These lookups don't use an index: " + ', '.join(failures) + ".")
+        self.stdout.write("All lookups use an index.")
+
+# 1. Seed the tables and update their statistics. The likes are spread evenly across the past year, so that a week's likes are a small fraction of them.
+# Input: options. Output: The seeded users and uploads.
+def seed_tables(options):
+    users = User.objects.bulk_create([User(username=SEED_PREFIX + str(i)) for i in range(options['users'])], batch_size=5000)
+    uploads = Upload.objects.bulk_create([Upload(relative_url=SEED_PREFIX + str(i), uploader=users[i % len(users)], is_publicly_listed=(i % 10 != 0))
+                                          for i in range(options['uploads'])], batch_size=5000)
+    Metadata.objects.bulk_create([Metadata(upload=upload, file_name=SEED_PREFIX + str(upload.id), mime_type='image/jpeg') for upload in uploads], batch_size=5000)
+    Tag.objects.bulk_create([Tag(name=SEED_PREFIX + str(i)) for i in range(options['tags'])], batch_size=5000)
+    # Each like is a different pair of an upload and a liker.
+    number_of_likes = min(options['likes'], len(uploads) * len(users))
+    likes = Like.objects.bulk_create([Like(upload=uploads[i % len(uploads)], liker=users[i // len(uploads)]) for i in range(number_of_likes)], batch_size=5000)
+    with connection.cursor() as cursor:
+        if len(likes) > 0:
+            # datetime_liked is set to the current time when a like is created, so spread the seeded likes out afterward.
+            cursor.execute("UPDATE " + connection.ops.quote_name(Like._meta.db_table) + " SET datetime_liked = NOW() - (id % 365) * INTERVAL '1 day' WHERE id >= %s",
+                           [likes[0].id])
+        for model in (User, Upload, Metadata, Tag, Like):
+            cursor.execute("ANALYZE " + connection.ops.quote_name(model._meta.db_table))
+    return users, uploads
+
+# 2. Return a (description, queryset) tuple for each lookup to check, in the same form as the views which make it.
+def get_hot_queries(users, uploads):
+    upload = uploads[len(uploads) // 2]
+    return [("Upload by relative URL (slide_page, like, add_tag, add_comment, delete_upload)", Upload.objects.filter(relative_url=upload.relative_url)),
+            ("Metadata by file name, ignoring case (file_name_will_be_unique)", Metadata.objects.filter(file_name__iexact=(SEED_PREFIX + str(upload.id)).upper())),
+            ("Tag by name (upload_page1, add_tag, gallery)", Tag.objects.filter(name=SEED_PREFIX + '1')),
+            ("Most popular tags (upload_page1)", Tag.objects.filter(upload_count__gt=0).order_by('-upload_count')[:20]),
+            ("Like by upload and liker (slide_page, like)", Like.objects.filter(upload=upload, liker=users[0])),
+            ("Likes from the past week (sort_by_trending)", Like.objects.filter(datetime_liked__gte=timezone.now() - datetime.timedelta(7))),
+            ("Newest public uploads (galleries)", Upload.objects.filter(is_publicly_listed=True).order_by('-id')[:25])]
+
+# 3. Return the lines of the query plan for a queryset.
+def explain(queryset):
+    sql, parameters = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN " + sql, parameters)
+        return [row[0] for row in cursor.fetchall()]
+
+# 3.1. Return True if the plan reads through an index and doesn't scan a whole table.
+def uses_index(plan):
+    plan_text = '\n'.join(plan)
+    return any([scan_type in plan_text for scan_type in INDEX_SCAN_TYPES]) and 'Seq Scan' not in plan_text
@@ -0,0 +1,18 @@
+# Description: Set each upload's stored comment_count to the number of comments it has. Run this once after "python manage.py migrate" adds the field, and
+# again if the counts are ever changed outside of the site, such as by deleting comments directly in the database.
+# Usage: python manage.py count_comments
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+from Meowseum.models import Upload
+
+class Command(BaseCommand):
+    help = "Recount the comments of each upload."
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        number_updated = 0
+        for upload in Upload.objects.annotate(number_of_comments=Count('comments')).exclude(comment_count=F('number_of_comments')).only('id'):
+            Upload.objects.filter(id=upload.id).update(comment_count=upload.number_of_comments)
+            number_updated += 1
+        self.stdout.write("Corrected the comment count of " + str(number_updated) + " uploads.")
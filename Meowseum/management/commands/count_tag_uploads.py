@@ -0,0 +1,18 @@
+# Description: Set each tag's stored upload_count to the number of uploads it has, which ranks the popular tags. Run this once after
+# "python manage.py migrate" adds the field, and again if the counts are ever changed outside of the site, such as by deleting uploads directly in the database.
+# Usage: python manage.py count_tag_uploads
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+from Meowseum.models import Tag
+
+class Command(BaseCommand):
+    help = "Recount the uploads of each tag."
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        number_updated = 0
+        for tag in Tag.objects.annotate(number_of_uploads=Count('uploads')).exclude(upload_count=F('number_of_uploads')).only('id'):
+            Tag.objects.filter(id=tag.id).update(upload_count=tag.number_of_uploads)
+            number_updated += 1
+        self.stdout.write("Corrected the upload count of " + str(number_updated) + " tags.")
@@ -0,0 +1,48 @@
+# Description: Compute the perceptual hashes of existing uploads, so that new uploads can be compared against them for near duplicates. The content hashes of
+# existing uploads can't be filled in, because they are hashes of the files as they were uploaded, before processing, and the originals weren't kept.
+# Web server processes that were already running only add hashes of newer uploads to their BK-trees, so restart them after running this command.
+# Usage: python manage.py create_perceptual_hashes [--all]
+
+from django.core.management.base import BaseCommand
+import os
+import shutil
+import tempfile
+from Meowseum.models import Metadata
+from Meowseum.file_handling.media_storage import get_media_storage
+from Meowseum.file_handling.perceptual_hash import get_perceptual_hash
+
+class Command(BaseCommand):
+    help = "Compute the perceptual hashes of existing uploads for duplicate detection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recompute the hashes of every upload, not only those without one.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        metadata_records = Metadata.objects.filter(upload__isnull=False).select_related('upload').order_by('id')
+        if not options['all']:
+            metadata_records = metadata_records.filter(perceptual_hash__isnull=True)
+        media_storage = get_media_storage()
+        temporary_directory = tempfile.mkdtemp()
+        number_hashed, number_failed = 0, 0
+        try:
+            for metadata_record in metadata_records.iterator():
+                local_path = os.path.join(temporary_directory, 'upload' + metadata_record.extension)
+                try:
+                    media_storage.download(metadata_record.upload.file.name, local_path)
+                    # Animated GIFs and videos have a duration, and their hashes are computed from sampled frames.
+                    if metadata_record.duration != None:
+                        motion_type = 'video'
+                    else:
+                        motion_type = 'image'
+                    metadata_record.perceptual_hash = get_perceptual_hash(local_path, {'motion_type': motion_type, 'duration': metadata_record.duration})
+                except (IOError, OSError, ValueError) as e:
+                    self.stderr.write("Metadata #" + str(metadata_record.id) + ": " + str(e))
+                    number_failed += 1
+                    continue
+                metadata_record.save(update_fields=['perceptual_hash'])
+                number_hashed += 1
+                os.remove(local_path)
+        finally:
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+        self.stdout.write("Hashed " + str(number_hashed) + " uploads. " + str(number_failed) + " uploads failed.")
@@ -0,0 +1,84 @@
+# Description: Create the WebP and AVIF renditions of existing uploads. Run this after uploading has been enabled with the 'renditions' hosting limit, after a new
+# format has been added to it, or after installing a Pillow build that can encode another format. The still images are converted in parallel by a pool of
+# worker processes, and the main process records the result on each Metadata record, so the templates only offer a rendition after it exists in media storage.
+# Each worker downloads the still image from media storage to a temporary directory, converts it, and moves the renditions into media storage.
+# Usage: python manage.py create_renditions [--processes N] [--all]
+
+from django.core.management.base import BaseCommand
+from django import db
+from multiprocessing import Pool, cpu_count
+import os
+import shutil
+import tempfile
+from Meowseum.models import Upload, Metadata, hosting_limits_for_Upload
+from Meowseum.file_handling.stage2_processing import get_supported_renditions, save_renditions
+from Meowseum.file_handling.media_storage import get_media_storage
+from Meowseum.file_handling.file_utility_functions import move_renditions
+
+class Command(BaseCommand):
+    help = "Create the WebP/AVIF renditions of the images, thumbnails, and posters of existing uploads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=cpu_count(), help="Number of worker processes. Defaults to the number of CPUs.")
+        parser.add_argument('--all', action='store_true', help="Recreate the renditions of every upload, such as after changing the rendition quality.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        renditions = get_supported_renditions(hosting_limits_for_Upload['renditions'])
+        rendition_types = [rendition[0] for rendition in renditions]
+        if len(renditions) == 0:
+            self.stdout.write("The installed Pillow build can't encode any of the rendition formats.")
+            return
+        tasks = [(metadata_record.id, get_source_names(metadata_record), renditions) for metadata_record in get_metadata_records(rendition_types, options['all'])]
+        # Close the database connection before the worker processes are forked, so that they don't share the main process's socket.
+        db.connections.close_all()
+        number_created, number_failed = 0, 0
+        with Pool(options['processes']) as pool:
+            for metadata_id, error_message in pool.imap_unordered(create_renditions_for_record, tasks):
+                if error_message == '':
+                    Metadata.objects.filter(id=metadata_id).update(rendition_types=rendition_types)
+                    number_created += 1
+                else:
+                    self.stderr.write("Metadata #" + str(metadata_id) + ": " + error_message)
+                    number_failed += 1
+        self.stdout.write("Created renditions for " + str(number_created) + " uploads. " + str(number_failed) + " uploads failed.")
+
+# 1. Retrieve the Metadata records of uploads which are missing at least one of the supported renditions.
+# Input: rendition_types, a list of MIME types. include_all, a Boolean for whether to retrieve every record. Output: queryset
+def get_metadata_records(rendition_types, include_all):
+    metadata_records = Metadata.objects.all()
+    if not include_all:
+        metadata_records = metadata_records.exclude(rendition_types__contains=rendition_types)
+    return metadata_records.order_by('id')
+
+# 2. Return the names in media storage of the still images associated with an upload: the image and its thumbnail, or the video's poster and the poster's thumbnail.
+# The workers skip names that don't exist, like the thumbnail of an image narrower than the thumbnail width.
+def get_source_names(metadata_record):
+    upload_directory = Upload.UPLOAD_TO
+    thumbnail_directory = hosting_limits_for_Upload['thumbnail'][2]
+    poster_directory = hosting_limits_for_Upload['poster_directory']
+    if metadata_record.mime_type.startswith('image'):
+        full_file_name = metadata_record.file_name + metadata_record.extension
+        return [upload_directory + '/' + full_file_name, upload_directory + '/' + thumbnail_directory + '/' + full_file_name]
+    else:
+        poster_file_name = metadata_record.file_name + '.jpg'
+        return [upload_directory + '/' + poster_directory + '/' + poster_file_name, upload_directory + '/' + poster_directory + '/' + thumbnail_directory + '/' + poster_file_name]
+
+# 3. This function runs within a worker process. It doesn't use the database, so that the workers can run without their own connections.
+# Input: task, a (metadata_id, source_names, renditions) tuple. Output: metadata_id and an error message, which is an empty string when the renditions were saved.
+def create_renditions_for_record(task):
+    metadata_id, source_names, renditions = task
+    media_storage = get_media_storage()
+    temporary_directory = tempfile.mkdtemp()
+    try:
+        for source_name in source_names:
+            if media_storage.exists(source_name):
+                local_path = os.path.join(temporary_directory, source_name.split('/')[-1])
+                media_storage.download(source_name, local_path)
+                save_renditions(local_path, renditions)
+                move_renditions(local_path, source_name)
+    except (IOError, OSError, ValueError) as e:
+        return metadata_id, str(e)
+    finally:
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+    return metadata_id, ''
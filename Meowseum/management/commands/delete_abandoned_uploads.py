@@ -0,0 +1,16 @@
+# Description: Delete the resumable uploads which haven't received a chunk within validation_specifications_for_Upload['resumable_upload_expiry'], along with
+# their partly received staging files. Schedule this command to run daily, such as with cron.
+# Usage: python manage.py delete_abandoned_uploads
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from Meowseum.models import validation_specifications_for_Upload
+from Meowseum.file_handling.resumable_uploads import delete_abandoned_uploads
+
+class Command(BaseCommand):
+    help = "Delete resumable uploads which have been abandoned partway through."
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        number_deleted, bytes_deleted = delete_abandoned_uploads(validation_specifications_for_Upload['resumable_upload_expiry'])
+        self.stdout.write("Deleted " + str(number_deleted) + " abandoned uploads, reclaiming " + filesizeformat(bytes_deleted) + ".")
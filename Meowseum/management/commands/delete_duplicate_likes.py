@@ -0,0 +1,43 @@
+# Description: Delete the extra likes of a user who liked the same upload more than once, keeping the earliest, so that the unique constraint on Like's upload and
+# liker can be added to a database from before it. Run this before "python manage.py migrate" adds the constraint. The like counts are counted from the Like
+# rows whenever they're shown, so the only stored values to update are the version stamps of the pages which show the affected uploads and users. The rows are
+# deleted directly, so that the command works before the rest of the migration has been applied, and the version stamps are bumped if their table exists.
+# Usage: python manage.py delete_duplicate_likes [--dry-run]
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from Meowseum.models import Like, VersionStamp
+from Meowseum.common_view_functions import bump_version_stamps
+
+class Command(BaseCommand):
+    help = "Delete the repeated likes of the same upload by the same user, keeping the earliest."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Count the likes which would be deleted without changing anything.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        duplicate_pairs = Like.objects.values('upload_id', 'liker_id').annotate(number_of_likes=Count('id')).filter(number_of_likes__gt=1)
+        duplicate_ids = []
+        for pair in duplicate_pairs:
+            like_ids = list(Like.objects.filter(upload_id=pair['upload_id'], liker_id=pair['liker_id']).order_by('datetime_liked', 'id').values_list('id', flat=True))
+            duplicate_ids = duplicate_ids + like_ids[1:]
+        if options['dry_run']:
+            self.stdout.write("Would delete " + str(len(duplicate_ids)) + " duplicate likes.")
+            return
+        if len(duplicate_ids) > 0:
+            delete_likes(duplicate_ids)
+        self.stdout.write("Deleted " + str(len(duplicate_ids)) + " duplicate likes.")
+
+# 1. Delete likes without sending the post_delete signal, then bump the version stamps which the signal would have.
+# Input: like_ids, a list of Like IDs. Output: None.
+@transaction.atomic
+def delete_likes(like_ids):
+    likes = Like.objects.filter(id__in=like_ids)
+    upload_urls = set(likes.values_list('upload__relative_url', flat=True))
+    liker_ids = set(likes.values_list('liker_id', flat=True))
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM "' + Like._meta.db_table + '" WHERE id = ANY(%s)', [like_ids])
+    if VersionStamp._meta.db_table in connection.introspection.table_names():
+        bump_version_stamps(['galleries'] + ['upload:' + relative_url for relative_url in upload_urls] + ['user:' + str(liker_id) for liker_id in liker_ids])
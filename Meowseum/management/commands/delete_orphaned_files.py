@@ -0,0 +1,126 @@
+# Description: Delete the files which processing left behind and no record refers to, so that failed uploads don't slowly fill the disk. Schedule this command to
+# run daily, such as with cron. It reconciles three directories against the database:
+# 1. stage1_processing, where files are copied while they're validated. A copy is left behind when the web server is stopped partway through validation. The only
+# files kept are the staging files of resumable uploads, and resumable uploads which have been abandoned are deleted first.
+# 2. stage2_processing, where files are processed. A file and the thumbnails, posters, HLS ladders, and previews made from it are kept while a TemporaryUpload
+# record refers to it. The records of failed uploads are kept for the administrator to examine, unless --delete-failed-uploads is used.
+# 3. The upload directory in media storage, including its thumbnails, posters, renditions, HLS ladders, previews, and EXIF metadata files, which are kept while an
+# Upload record refers to the file they were made from.
+# A file is only deleted if it's older than the grace period, so that a file which is still being processed, or which has been moved into place just before its
+# record is saved, isn't mistaken for an orphan. The files are listed before the records are read for the same reason. Deletions are made in batches, with a
+# pause between them, to spread the load on the disk or the S3 API.
+# Usage: python manage.py delete_orphaned_files [--grace-hours 24] [--batch-size 500] [--pause 1] [--delete-failed-uploads] [--dry-run]
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+import os
+import time
+from Meowseum.models import TemporaryUpload, ResumableUpload, Upload, validation_specifications_for_Upload, hosting_limits_for_Upload
+from Meowseum.file_handling.media_storage import get_media_storage, LocalMediaStorage
+from Meowseum.file_handling.resumable_uploads import delete_abandoned_uploads
+
+STAGE1_DIRECTORY = 'stage1_processing'
+
+class Command(BaseCommand):
+    help = "Delete processing leftovers and stored files which no record refers to."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24, help="Only delete files last modified more than this many hours ago.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Number of files deleted at a time.")
+        parser.add_argument('--pause', type=float, default=1, help="Seconds to wait between batches.")
+        parser.add_argument('--delete-failed-uploads', action='store_true',
+                            help="Also delete the TemporaryUpload records of failed uploads older than the grace period, so that their files are deleted.")
+        parser.add_argument('--dry-run', action='store_true', help="List what would be deleted without deleting anything.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        cutoff_time = time.time() - options['grace_hours'] * 3600
+        local_storage = LocalMediaStorage(settings.MEDIA_PATH, settings.MEDIA_URL)
+        if not options['dry_run']:
+            number_deleted, bytes_deleted = delete_abandoned_uploads(validation_specifications_for_Upload['resumable_upload_expiry'])
+            self.stdout.write("Abandoned resumable uploads: deleted " + str(number_deleted) + ", reclaiming " + filesizeformat(bytes_deleted) + ".")
+            if options['delete_failed_uploads']:
+                self.stdout.write("Failed uploads: deleted " + str(delete_failed_uploads(local_storage, cutoff_time)) + " TemporaryUpload records.")
+        total_bytes = 0
+        for directory, storage, get_referenced_stems in ((STAGE1_DIRECTORY, local_storage, get_stage1_referenced_stems),
+                                                          (TemporaryUpload.UPLOAD_TO, local_storage, get_stage2_referenced_stems),
+                                                          (Upload.UPLOAD_TO, get_media_storage(), get_upload_referenced_stems)):
+            orphans = get_orphans(storage, directory, get_referenced_stems, cutoff_time)
+            if options['dry_run']:
+                for name, size in orphans:
+                    self.stdout.write(name + " (" + filesizeformat(size) + ")")
+            else:
+                delete_in_batches(storage, [name for name, size in orphans], options['batch_size'], options['pause'])
+            bytes_deleted = sum([size for name, size in orphans])
+            total_bytes = total_bytes + bytes_deleted
+            self.stdout.write(directory + ": " + ("found " if options['dry_run'] else "deleted ") + str(len(orphans)) + " orphaned files, " +
+                              filesizeformat(bytes_deleted) + ".")
+        self.stdout.write(("Would reclaim " if options['dry_run'] else "Reclaimed ") + filesizeformat(total_bytes) + " in total.")
+
+# 1. Return the files within a directory which are older than the cutoff time and aren't referred to by a record.
+# Input: storage, directory, get_referenced_stems, a function which returns the set of stems referred to by records, and cutoff_time, a UNIX timestamp.
+# Output: A list of (name, size) tuples.
+def get_orphans(storage, directory, get_referenced_stems, cutoff_time):
+    old_files = [(name, size) for name, size, modified_time in storage.list_files(directory) if modified_time < cutoff_time]
+    referenced_stems = get_referenced_stems()
+    return [(name, size) for name, size in old_files if get_stem(name[len(directory) + 1:]) not in referenced_stems]
+
+# 1.1. Return the part of a name which a file shares with the file it was made from: the name relative to its derivative directory, without the extension. For
+# example, 'posters/thumbnails/cat.jpg', 'thumbnails/cat.webp', and 'hls/cat/240p_000.ts' all have the stem 'cat'.
+# Input: relative_name, a name relative to the upload or processing directory. Output: The stem.
+def get_stem(relative_name):
+    hls_directory = hosting_limits_for_Upload['hls_ladder'][2]
+    if relative_name.startswith(hls_directory + '/'):
+        # The files of an HLS ladder are in a directory named after the file.
+        return relative_name[len(hls_directory) + 1:].rpartition('/')[0]
+    for directory in get_derivative_directories():
+        if relative_name.startswith(directory + '/'):
+            relative_name = relative_name[len(directory) + 1:]
+            break
+    return os.path.splitext(relative_name)[0]
+
+# 1.1.1. Return the directories of the files made from an upload, with subdirectories before the directories that contain them. The metadata directory holds the
+# EXIF data of uploads from before it was stored in the database.
+def get_derivative_directories():
+    thumbnail_directory = hosting_limits_for_Upload['thumbnail'][2]
+    poster_directory = hosting_limits_for_Upload['poster_directory']
+    return [poster_directory + '/' + thumbnail_directory, poster_directory, thumbnail_directory, hosting_limits_for_Upload['hover_preview'][2], 'metadata']
+
+# 1.2. Return the stems of the files in the stage 1 processing directory which records refer to, which are the staging files of resumable uploads.
+def get_stage1_referenced_stems():
+    resumable_directory = ResumableUpload.UPLOAD_TO[len(STAGE1_DIRECTORY) + 1:]
+    return set([resumable_directory + '/' + upload_key for upload_key in ResumableUpload.objects.values_list('upload_key', flat=True)])
+
+# 1.3. Return the stems of the files which TemporaryUpload records refer to.
+def get_stage2_referenced_stems():
+    return get_file_field_stems(TemporaryUpload.objects.values_list('file', flat=True), TemporaryUpload.UPLOAD_TO)
+
+# 1.4. Return the stems of the files which Upload records refer to.
+def get_upload_referenced_stems():
+    return get_file_field_stems(Upload.objects.values_list('file', flat=True), Upload.UPLOAD_TO)
+
+# 1.4.1. Input: The values of a file field, which are names in media storage, and the directory which the field's upload_to is. Output: A set of stems.
+def get_file_field_stems(names, directory):
+    return set([os.path.splitext(name[len(directory) + 1:])[0] for name in names if name])
+
+# 2. Delete the TemporaryUpload records of failed uploads whose files were last modified before the cutoff time, or whose files are missing. A file is still
+# modified while it's processed, so the record of a file being processed is never deleted.
+# Input: local_storage, cutoff_time. Output: The number of records deleted.
+def delete_failed_uploads(local_storage, cutoff_time):
+    number_deleted = 0
+    for temporary_upload in TemporaryUpload.objects.all():
+        if temporary_upload.file:
+            path = local_storage.path(temporary_upload.file.name)
+            if os.path.exists(path) and os.path.getmtime(path) >= cutoff_time:
+                continue
+        temporary_upload.delete()
+        number_deleted = number_deleted + 1
+    return number_deleted
+
+# 3. Delete files in batches, pausing between batches.
+def delete_in_batches(storage, names, batch_size, pause):
+    for i in range(0, len(names), batch_size):
+        if i > 0:
+            time.sleep(pause)
+        storage.delete_files(names[i:i+batch_size])
@@ -0,0 +1,47 @@
+# Description: Older versions of the site stored each JPEG's raw EXIF data in a separate .dat file in the uploads/metadata directory. This command parses
+# those files into the Metadata records' exif_data field, so the EXIF data can be queried, then deletes the files that were imported.
+# Usage: python manage.py import_exif_data [--keep-files]
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import os
+from Meowseum.models import Upload, Metadata
+from Meowseum.file_handling.get_metadata import get_exif_data, get_serializable_exif_data
+
+class Command(BaseCommand):
+    help = "Move the EXIF data of older uploads from .dat files into the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-files', action='store_true', help="Leave the .dat files in place after importing them.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        exif_directory_path = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO, 'metadata')
+        if not os.path.isdir(exif_directory_path):
+            self.stdout.write("There isn't a directory of EXIF data files to import.")
+            return
+        number_imported, number_failed = 0, 0
+        for full_file_name in sorted(os.listdir(exif_directory_path)):
+            file_name, extension = os.path.splitext(full_file_name)
+            if extension != '.dat':
+                continue
+            exif_file_path = os.path.join(exif_directory_path, full_file_name)
+            try:
+                metadata_record = Metadata.objects.get(file_name=file_name, upload__isnull=False)
+                metadata_record.exif_data = read_exif_data_file(exif_file_path)
+            except (Metadata.DoesNotExist, Metadata.MultipleObjectsReturned, IOError, SyntaxError, ValueError, KeyError) as e:
+                self.stderr.write(full_file_name + ": " + str(e))
+                number_failed += 1
+                continue
+            metadata_record.save(update_fields=['exif_data'])
+            if not options['keep_files']:
+                os.remove(exif_file_path)
+            number_imported += 1
+        self.stdout.write("Imported the EXIF data of " + str(number_imported) + " uploads. " + str(number_failed) + " files couldn't be imported.")
+
+# 1. Input: exif_file_path, the path to a file containing raw EXIF data. Output: A dictionary of EXIF data which can be stored in a JSONField.
+def read_exif_data_file(exif_file_path):
+    with open(exif_file_path, 'rb') as infile:
+        raw_exif_data = infile.read()
+    exif_data = get_exif_data(raw_exif_data, {})[0]
+    return get_serializable_exif_data(exif_data)
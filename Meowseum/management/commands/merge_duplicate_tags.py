@@ -0,0 +1,56 @@
+# Description: Merge the tags whose names differ only by case, or which have exactly the same name, so that the unique constraint on Tag.name can be added to a
+# database from before it. The views look tags up by their lowercase names, so the tag kept for each name is the oldest one, renamed to lowercase. The uploads
+# and subscribers of the others are moved to it, and then the others are deleted. Run this before "python manage.py migrate" adds the constraint. It only reads
+# and writes the tag names, their upload counts, and the rows of the Tag.uploads and subscribed tags relations, so it works before the rest of the migration has
+# been applied too.
+# Usage: python manage.py merge_duplicate_tags [--dry-run]
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Min
+from django.db.models.functions import Lower
+from Meowseum.models import Tag, UserProfile
+
+class Command(BaseCommand):
+    help = "Merge tags whose names are the same apart from case."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List the tags which would be merged without changing anything.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        duplicate_names = Tag.objects.annotate(lowercase_name=Lower('name')).values('lowercase_name').annotate(number_of_tags=Count('id')) \
+                                     .filter(number_of_tags__gt=1).values_list('lowercase_name', flat=True)
+        number_merged = 0
+        for lowercase_name in duplicate_names:
+            tag_ids = list(Tag.objects.filter(name__iexact=lowercase_name).order_by('id').values_list('id', flat=True))
+            if options['dry_run']:
+                self.stdout.write("Would merge " + str(len(tag_ids) - 1) + " tags into #" + lowercase_name + ".")
+            else:
+                merge_tags(tag_ids[0], tag_ids[1:], lowercase_name)
+            number_merged = number_merged + len(tag_ids) - 1
+        self.stdout.write(("Would merge " if options['dry_run'] else "Merged ") + str(number_merged) + " duplicate tags.")
+
+# 1. Move the uploads and subscribers of duplicate tags to the tag being kept, and delete the duplicates. The rows of the relations are changed directly, so that
+# no m2m_changed signals are sent. Before the rows are moved, the ones which would repeat an upload or subscriber are deleted: those the kept tag already has, and
+# all but the first of those which several duplicates share. Because no signals are sent, the kept tag's upload_count is recounted afterward.
+# Input: kept_tag_id, duplicate_tag_ids, a list of IDs, name, the kept tag's new name. Output: None.
+@transaction.atomic
+def merge_tags(kept_tag_id, duplicate_tag_ids, name):
+    for through_model, other_column in ((Tag.uploads.through, 'upload_id'), (UserProfile.subscribed_tags.through, 'userprofile_id')):
+        duplicate_rows = through_model.objects.filter(tag_id__in=duplicate_tag_ids)
+        kept_tag_rows = through_model.objects.filter(tag_id=kept_tag_id)
+        duplicate_rows.filter(**{other_column + '__in': kept_tag_rows.values(other_column)}).delete()
+        first_row_ids = list(duplicate_rows.values(other_column).annotate(first_id=Min('id')).values_list('first_id', flat=True))
+        duplicate_rows.exclude(id__in=first_row_ids).delete()
+        duplicate_rows.update(tag_id=kept_tag_id)
+    Tag.objects.filter(id__in=duplicate_tag_ids).only('id').delete()
+    Tag.objects.filter(id=kept_tag_id).update(name=name)
+    if has_upload_count_column():
+        Tag.objects.filter(id=kept_tag_id).update(upload_count=Tag.uploads.through.objects.filter(tag_id=kept_tag_id).count())
+
+# 1.1. Return whether the Tag table has the upload_count column yet. Before the migration adds it, "python manage.py count_tag_uploads" fills it in afterward.
+def has_upload_count_column():
+    with connection.cursor() as cursor:
+        columns = connection.introspection.get_table_description(cursor, Tag._meta.db_table)
+    return 'upload_count' in [column.name for column in columns]
@@ -0,0 +1,274 @@
+# Description: Regenerate the thumbnails, posters, hover previews, renditions, or HLS ladders of existing uploads from the processed files in media storage. Run this after changing
+# the keys of hosting_limits_for_Upload which they are made with, like the thumbnail width, 'jpeg_quality', 'preset', 'hover_preview', 'renditions', or 'hls_ladder'.
+# When the HLS ladder is turned off in 'hls_ladder', regenerating the hls type deletes the existing ladders instead.
+# The video files among them are written by one ffmpeg process per upload, like during stage 2 processing.
+# The command is meant to run beside live traffic:
+# 1. The uploads are processed by a pool of worker processes, which run at the lowest CPU priority. On Linux, the I/O priority follows the CPU priority.
+# Before starting each upload, a worker waits while the load average is above --max-load, and after each upload, it sleeps long enough to keep the pool's
+# downloads and saves under --io-rate MB per second.
+# 2. Each worker makes the new files in a temporary directory, then saves them to media storage, which replaces each old file atomically, so a half-written file
+# is never served. The HLS playlists are saved after their segments, so a playlist never lists a segment that hasn't been saved.
+# 3. The ID of the last finished Metadata record is written to a checkpoint file after each upload. If the command is stopped, running it again with the same
+# derivative types continues after that record.
+# Usage: python manage.py rederive_media {thumbnails,posters,previews,renditions,hls} [...] [--processes N] [--max-load L] [--io-rate MB] [--checkpoint PATH] [--restart]
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django import db
+from multiprocessing import Pool, cpu_count
+import json
+import os
+import shutil
+import tempfile
+import time
+from Meowseum.models import Upload, Metadata, hosting_limits_for_Upload
+from Meowseum.file_handling.stage2_processing import get_supported_renditions, needs_thumbnail, needs_hover_preview, save_image_thumbnail, save_video_derivatives, \
+                                                    save_renditions, save_hls_ladder
+from Meowseum.file_handling.media_storage import get_media_storage
+from Meowseum.file_handling.file_utility_functions import move_file, move_renditions
+
+DERIVATIVE_TYPES = ('thumbnails', 'posters', 'previews', 'renditions', 'hls')
+# The niceness of the worker processes and the ffmpeg processes they start. 19 is the lowest priority.
+WORKER_NICENESS = 19
+
+# The throttling limits of a worker process, set by initialize_worker().
+max_load = 0
+io_rate = 0
+
+class Command(BaseCommand):
+    help = "Regenerate the thumbnails, posters, hover previews, renditions, or HLS ladders of existing uploads after changing hosting_limits_for_Upload."
+
+    def add_arguments(self, parser):
+        parser.add_argument('derivative_types', nargs='+', choices=DERIVATIVE_TYPES, help="The types of files to regenerate.")
+        parser.add_argument('--processes', type=int, default=max(1, cpu_count() // 2),
+                            help="Number of worker processes. Defaults to half the number of CPUs, leaving the rest for the web server.")
+        parser.add_argument('--max-load', type=float, default=float(cpu_count()),
+                            help="Workers wait before starting an upload while the 1-minute load average is above this. Defaults to the number of CPUs. 0 disables it.")
+        parser.add_argument('--io-rate', type=float, default=10, help="Maximum MB per second downloaded from and saved to media storage by all the workers. 0 disables it.")
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'rederive_media_checkpoint.json'), help="Path to the checkpoint file.")
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start from the first upload.")
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        derivative_types = sorted(set(options['derivative_types']))
+        last_id = 0
+        if not options['restart']:
+            last_id = read_checkpoint(options['checkpoint'], derivative_types)
+            if last_id > 0:
+                self.stdout.write("Continuing after Metadata #" + str(last_id) + ".")
+        renditions = get_supported_renditions(hosting_limits_for_Upload['renditions'])
+        tasks = [(metadata_record.id, get_metadata_dictionary(metadata_record), get_derivative_names(metadata_record), derivative_types, renditions)
+                 for metadata_record in Metadata.objects.filter(id__gt=last_id, upload__isnull=False).order_by('id')]
+        self.stdout.write("Regenerating " + ', '.join(derivative_types) + " for " + str(len(tasks)) + " uploads.")
+        # Close the database connection before the worker processes are forked, so that they don't share the main process's socket.
+        db.connections.close_all()
+        number_rederived, number_failed = 0, 0
+        initial_arguments = (options['max_load'], options['io_rate'] * 1048576 / options['processes'])
+        with Pool(options['processes'], initializer=initialize_worker, initargs=initial_arguments) as pool:
+            # imap() returns the results in the order of the tasks, so every record up to the checkpoint has been finished, even though the workers finish out of order.
+            for metadata_id, updated_fields, error_message in pool.imap(rederive_record, tasks):
+                if error_message == '':
+                    if len(updated_fields) > 0:
+                        Metadata.objects.filter(id=metadata_id).update(**updated_fields)
+                    number_rederived += 1
+                else:
+                    self.stderr.write("Metadata #" + str(metadata_id) + ": " + error_message)
+                    number_failed += 1
+                write_checkpoint(options['checkpoint'], derivative_types, metadata_id)
+        self.stdout.write("Regenerated the files of " + str(number_rederived) + " uploads. " + str(number_failed) + " uploads failed.")
+
+# 1. Return the ID of the last finished Metadata record from the checkpoint file, or 0 if there isn't a checkpoint for the same derivative types.
+def read_checkpoint(checkpoint_path, derivative_types):
+    try:
+        with open(checkpoint_path) as infile:
+            checkpoint = json.load(infile)
+    except (IOError, ValueError):
+        return 0
+    if checkpoint.get('derivative_types') != derivative_types:
+        return 0
+    return checkpoint['last_id']
+
+# 2. Write the checkpoint to a temporary file, then rename it, so that stopping the command while it writes doesn't leave a corrupt checkpoint.
+def write_checkpoint(checkpoint_path, derivative_types, last_id):
+    with open(checkpoint_path + '.partial', 'w') as outfile:
+        json.dump({'derivative_types': derivative_types, 'last_id': last_id}, outfile)
+    os.replace(checkpoint_path + '.partial', checkpoint_path)
+
+# 3. Return the fields of a Metadata record used by the stage 2 processing functions, in the format of the metadata dictionary. After processing, a video is
+# always saved as a video format, so the motion type can be told from the MIME type.
+def get_metadata_dictionary(metadata_record):
+    metadata = {'mime_type': metadata_record.mime_type, 'width': metadata_record.width, 'height': metadata_record.height, 'file_size': metadata_record.file_size,
+                'duration': metadata_record.duration, 'fps': metadata_record.fps, 'has_audio': metadata_record.has_audio}
+    if metadata_record.mime_type.startswith('video'):
+        metadata['motion_type'] = 'video'
+    else:
+        metadata['motion_type'] = 'image'
+    return metadata
+
+# 4. Return the names in media storage of the upload's file and the files derived from it.
+def get_derivative_names(metadata_record):
+    upload_directory = Upload.UPLOAD_TO
+    thumbnail_directory = hosting_limits_for_Upload['thumbnail'][2]
+    poster_directory = hosting_limits_for_Upload['poster_directory']
+    full_file_name = metadata_record.file_name + metadata_record.extension
+    poster_file_name = metadata_record.file_name + '.jpg'
+    return {'file': upload_directory + '/' + full_file_name,
+            'thumbnail': upload_directory + '/' + thumbnail_directory + '/' + full_file_name,
+            'poster': upload_directory + '/' + poster_directory + '/' + poster_file_name,
+            'poster_thumbnail': upload_directory + '/' + poster_directory + '/' + thumbnail_directory + '/' + poster_file_name,
+            'hls': upload_directory + '/' + hosting_limits_for_Upload['hls_ladder'][2] + '/' + metadata_record.file_name,
+            'hover_preview': upload_directory + '/' + hosting_limits_for_Upload['hover_preview'][2] + '/' + metadata_record.file_name + '.mp4'}
+
+# 5. Lower the priority of a worker process and record its throttling limits. The ffmpeg processes started by the worker inherit its priority.
+def initialize_worker(worker_max_load, worker_io_rate):
+    global max_load, io_rate
+    max_load = worker_max_load
+    io_rate = worker_io_rate
+    if hasattr(os, 'nice'):
+        os.nice(WORKER_NICENESS)
+
+# 6. This function runs within a worker process. It doesn't use the database, so that the workers can run without their own connections.
+# Input: task, a (metadata_id, metadata dictionary, derivative names dictionary, derivative_types, renditions) tuple.
+# Output: metadata_id, a dictionary of Metadata fields to update, and an error message, which is an empty string when the files were saved.
+def rederive_record(task):
+    metadata_id, metadata, names, derivative_types, renditions = task
+    wait_for_load_to_drop()
+    start_time = time.time()
+    temporary_directory = tempfile.mkdtemp()
+    local_copies = LocalCopies(temporary_directory)
+    updated_fields = {}
+    try:
+        if metadata['motion_type'] == 'video':
+            paths = get_video_derivative_paths(metadata, names, derivative_types, local_copies)
+            if len(paths) > 0:
+                save_video_derivatives(local_copies.get_path(names['file']), paths, metadata, hosting_limits_for_Upload)
+            if 'previews' in derivative_types:
+                updated_fields['has_hover_preview'] = 'hover_preview' in paths
+        elif 'thumbnails' in derivative_types and needs_thumbnail(metadata, hosting_limits_for_Upload):
+            save_image_thumbnail(local_copies.get_path(names['file']), local_copies.get_new_path(names['thumbnail']), metadata, hosting_limits_for_Upload)
+        if 'renditions' in derivative_types:
+            if metadata['motion_type'] == 'video':
+                still_image_names = [names['poster'], names['poster_thumbnail']]
+            else:
+                still_image_names = [names['file'], names['thumbnail']]
+            for still_image_name in still_image_names:
+                still_image_path = local_copies.get_path(still_image_name)
+                if still_image_path != None:
+                    save_renditions(still_image_path, renditions)
+                    local_copies.bytes_transferred += get_renditions_size(still_image_path)
+                    local_copies.rendition_names = local_copies.rendition_names + [still_image_name]
+            updated_fields['rendition_types'] = [rendition[0] for rendition in renditions]
+        hls_directory = None
+        if 'hls' in derivative_types and metadata['mime_type'] == 'video/mp4':
+            if hosting_limits_for_Upload['hls_ladder'][3]:
+                hls_directory = os.path.join(temporary_directory, 'hls')
+                metadata = save_hls_ladder(local_copies.get_path(names['file']), hls_directory, metadata, hosting_limits_for_Upload)
+                updated_fields['hls_rungs'] = metadata['hls_rungs']
+            else:
+                # The ladder has been turned off. The field is cleared along with the files, so that the templates stop listing the master playlist.
+                updated_fields['hls_rungs'] = []
+        local_copies.save_to_media_storage()
+        if hls_directory != None:
+            local_copies.bytes_transferred += replace_stored_directory(hls_directory, names['hls'])
+        elif 'hls_rungs' in updated_fields:
+            get_media_storage().delete_directory(names['hls'])
+    except (IOError, OSError, ValueError) as e:
+        return metadata_id, {}, str(e)
+    finally:
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+    wait_for_io_budget(start_time, local_copies.bytes_transferred)
+    return metadata_id, updated_fields, ''
+
+# 6.1. Return the local paths for the video files to regenerate, in the format used by save_video_derivatives(). The poster of the thumbnail is regenerated with
+# either the thumbnails or the posters.
+def get_video_derivative_paths(metadata, names, derivative_types, local_copies):
+    paths = {}
+    has_thumbnail = needs_thumbnail(metadata, hosting_limits_for_Upload)
+    if 'thumbnails' in derivative_types and has_thumbnail:
+        paths['thumbnail'] = local_copies.get_new_path(names['thumbnail'])
+    if 'posters' in derivative_types:
+        paths['poster'] = local_copies.get_new_path(names['poster'])
+    if ('thumbnails' in derivative_types or 'posters' in derivative_types) and has_thumbnail:
+        paths['poster_thumbnail'] = local_copies.get_new_path(names['poster_thumbnail'])
+    if 'previews' in derivative_types and needs_hover_preview(metadata, hosting_limits_for_Upload):
+        paths['hover_preview'] = local_copies.get_new_path(names['hover_preview'])
+    return paths
+
+# 6.2. Sleep while the load average is above the limit, such as while the site is busy.
+def wait_for_load_to_drop():
+    # os.getloadavg() isn't available on Windows.
+    if max_load <= 0 or not hasattr(os, 'getloadavg'):
+        return
+    while os.getloadavg()[0] > max_load:
+        time.sleep(5)
+
+# 6.3. Sleep until enough time has passed since the start of the task for the bytes transferred to be within the worker's share of the I/O rate.
+def wait_for_io_budget(start_time, bytes_transferred):
+    if io_rate <= 0:
+        return
+    remaining_time = bytes_transferred / io_rate - (time.time() - start_time)
+    if remaining_time > 0:
+        time.sleep(remaining_time)
+
+# 6.4. Return the total size of the renditions saved alongside a file.
+def get_renditions_size(source_path):
+    extless_source_path = os.path.splitext(source_path)[0]
+    size = 0
+    for extension in settings.RENDITION_TYPES_AND_PREFERRED_EXTENSIONS.values():
+        if os.path.exists(extless_source_path + extension):
+            size += os.path.getsize(extless_source_path + extension)
+    return size
+
+# 6.5. Save the files of a local HLS ladder to a stored directory, replacing its files. The segments are saved first, then the rungs' playlists, then the master
+# playlist, so that each playlist only lists files which have already been saved. Afterward, stored files that the new ladder doesn't have, like the segments of a
+# rung that was removed from 'hls_ladder', are deleted.
+# Input: local_directory, name of the directory in media storage. Output: The number of bytes saved.
+def replace_stored_directory(local_directory, name):
+    media_storage = get_media_storage()
+    file_names = sorted(os.listdir(local_directory), key=lambda file_name: (file_name.endswith('.m3u8'), file_name == 'master.m3u8'))
+    bytes_saved = 0
+    for file_name in file_names:
+        bytes_saved += os.path.getsize(os.path.join(local_directory, file_name))
+        media_storage.save_file(os.path.join(local_directory, file_name), name + '/' + file_name)
+    new_names = [name + '/' + file_name for file_name in file_names]
+    for stored_name in media_storage.list_directory(name):
+        if stored_name not in new_names:
+            media_storage.delete(stored_name)
+    return bytes_saved
+
+# 7. The local copies of an upload's files within a worker's temporary directory. Each file's path mirrors its name in media storage. A file is downloaded the first
+# time it's needed, and a new file is recorded so that it can be saved to media storage after all of the upload's files have been made.
+class LocalCopies(object):
+    def __init__(self, temporary_directory):
+        self.temporary_directory = temporary_directory
+        self.new_names = []
+        self.rendition_names = []
+        self.bytes_transferred = 0
+    def get_local_path(self, name):
+        return os.path.join(self.temporary_directory, *name.split('/'))
+    # Return the local path of a file, downloading it first if it hasn't been made or downloaded yet. Return None if it doesn't exist in media storage,
+    # like the thumbnail of an image narrower than the thumbnail width.
+    def get_path(self, name):
+        local_path = self.get_local_path(name)
+        if not os.path.exists(local_path):
+            media_storage = get_media_storage()
+            if not media_storage.exists(name):
+                return None
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            media_storage.download(name, local_path)
+            self.bytes_transferred += os.path.getsize(local_path)
+        return local_path
+    # Return the local path for a new file, replacing any downloaded copy.
+    def get_new_path(self, name):
+        local_path = self.get_local_path(name)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        if name not in self.new_names:
+            self.new_names = self.new_names + [name]
+        return local_path
+    # Save the new files and the renditions to media storage. The renditions are saved before the files they were made from.
+    def save_to_media_storage(self):
+        for name in self.rendition_names:
+            move_renditions(self.get_local_path(name), name)
+        for name in self.new_names:
+            self.bytes_transferred += os.path.getsize(self.get_local_path(name))
+            move_file(self.get_local_path(name), name)
@@ -0,0 +1,17 @@
+# Description: Uploads from before the category was stored in the Upload table have the default category, 'pets'. This command sets the category of each upload
+# which has an Adoption, Lost, or Found record. It only needs to be run once, after "python manage.py migrate" adds the column.
+# Usage: python manage.py set_upload_categories
+
+from django.core.management.base import BaseCommand
+from Meowseum.models import Upload, Adoption, Lost, Found
+
+class Command(BaseCommand):
+    help = "Set the stored category of uploads which have an Adoption, Lost, or Found record."
+
+    # 0. Main function.
+    def handle(self, *args, **options):
+        for model in (Adoption, Lost, Found):
+            category = model._meta.model_name
+            upload_ids = model.objects.filter(upload__isnull=False).values('upload_id')
+            number_updated = Upload.objects.filter(id__in=upload_ids).exclude(category=category).update(category=category)
+            self.stdout.write(category + ": set the category of " + str(number_updated) + " uploads.")
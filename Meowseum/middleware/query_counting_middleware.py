@@ -0,0 +1,150 @@
+# Description: This file contains middleware for counting the database queries of each request, so that queries in loops are noticed before they slow down the
+# production server. Each query is reduced to its shape, the SQL with its values replaced by ?, and a shape which runs at least N_PLUS_ONE_THRESHOLD times
+# in one request is an N+1 pattern, like looking up each comment's author separately. A view can declare the most queries it should need with the @query_budget
+# decorator. The totals for each view are kept in memory and added to its ViewQueryStatistics record every FLUSH_INTERVAL seconds, so that counting doesn't add
+# a write to every request. Only SAMPLE_RATE of the requests are counted, unless budgets are enforced. The settings are in settings.QUERY_COUNTING.
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.backends.utils import CursorWrapper
+from django.db.models import F
+from django.db.models.functions import Greatest
+from collections import Counter
+import logging
+import random
+import re
+import threading
+import time
+from Meowseum.models import ViewQueryStatistics
+
+logger = logging.getLogger(__name__)
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+# Declare the most queries a view should make. Decorators which use functools.wraps, like login_required, keep the budget when they're applied on top of it.
+def query_budget(number_of_queries):
+    def decorator(view_function):
+        view_function.query_budget = number_of_queries
+        return view_function
+    return decorator
+
+# A cursor which counts each SQL statement it runs, before the parameters are filled in. Unlike Django's debug cursor, it doesn't time the queries or format
+# them with their parameters, so counting costs about as much as adding to a dictionary.
+class CountingCursorWrapper(CursorWrapper):
+    def execute(self, sql, params=None):
+        self.db.query_counting_statements[sql] += 1
+        return super(CountingCursorWrapper, self).execute(sql, params)
+    def executemany(self, sql, param_list):
+        self.db.query_counting_statements[sql] += 1
+        return super(CountingCursorWrapper, self).executemany(sql, param_list)
+
+class QueryCountingMiddleware(object):
+    # 1. Start counting the queries of the request, including those of the other middleware, for SAMPLE_RATE of the requests, or all of them while budgets are
+    # enforced. When Django already records the queries because DEBUG is True, they're counted from its log. Otherwise, the connection's cursors are wrapped
+    # with CountingCursorWrapper.
+    def process_request(self, request):
+        # The counting of a request which raised an exception before process_response() or process_exception() could stop it is stopped here.
+        stop_counting()
+        if not settings.QUERY_COUNTING['ENABLED']:
+            return
+        if not settings.QUERY_COUNTING['ENFORCE_BUDGETS'] and random.random() >= settings.QUERY_COUNTING['SAMPLE_RATE']:
+            return
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.queries_logged:
+            connection.queries_log.clear()
+            request.query_counting_mode = 'log'
+        else:
+            connection.query_counting_statements = Counter()
+            connection.make_cursor = lambda cursor: CountingCursorWrapper(cursor, connection)
+            request.query_counting_mode = 'cursor'
+    # 2. Find the name of the view which handles the request and its budget.
+    def process_view(self, request, view_function, view_args, view_kwargs):
+        if hasattr(request, 'query_counting_mode'):
+            request.query_counting_view = (request.resolver_match.view_name, getattr(view_function, 'query_budget', None))
+        return None
+    # 3. Stop counting when the view raises an exception, because Django doesn't call process_response() afterward.
+    def process_exception(self, request, exception):
+        stop_counting()
+        return None
+    # 4. Count the queries, warn about N+1 patterns, and enforce the budget.
+    def process_response(self, request, response):
+        if not hasattr(request, 'query_counting_mode'):
+            return response
+        connection = connections[DEFAULT_DB_ALIAS]
+        if request.query_counting_mode == 'log':
+            statement_counts = Counter([query['sql'] for query in connection.queries_log])
+        else:
+            statement_counts = getattr(connection, 'query_counting_statements', Counter())
+        stop_counting()
+        if not hasattr(request, 'query_counting_view'):
+            # No view was found for the URL.
+            return response
+        view_name, budget = request.query_counting_view
+        # Each distinct statement is reduced to its shape once, rather than once for each time it ran.
+        shape_counts = Counter()
+        for sql, count in statement_counts.items():
+            shape_counts[get_query_shape(sql)] += count
+        number_of_queries = sum(shape_counts.values())
+        repeated_shapes = [(shape, count) for shape, count in shape_counts.most_common() if count >= settings.QUERY_COUNTING['N_PLUS_ONE_THRESHOLD']]
+        if len(repeated_shapes) > 0 and settings.QUERY_COUNTING['WARN_N_PLUS_ONE']:
+            for shape, count in repeated_shapes:
+                logger.warning("Possible N+1 queries in " + view_name + " (" + request.path + "): " + str(count) + " queries of the form " + shape)
+        is_over_budget = budget != None and number_of_queries > budget
+        record_view_queries(view_name, number_of_queries, is_over_budget, repeated_shapes)
+        if is_over_budget and settings.QUERY_COUNTING['ENFORCE_BUDGETS']:
+            raise QueryBudgetExceeded(view_name + " made " + str(number_of_queries) + " queries, which is over its budget of " + str(budget) + ".")
+        return response
+
+# 4.1. Stop wrapping the cursors of this thread's connection, so that the requests which aren't sampled run their queries without it. The instance's
+# make_cursor() is removed, which restores the class's.
+def stop_counting():
+    connection = connections[DEFAULT_DB_ALIAS]
+    if 'make_cursor' in connection.__dict__:
+        del connection.make_cursor
+
+# 5. Return the shape of a query: its SQL with the quoted strings and numbers replaced with ?, and lists of values after IN shortened to one ?, so that the same
+# query with different values has the same shape. The statements counted by CountingCursorWrapper have %s placeholders instead of values, which become ? too.
+def get_query_shape(sql):
+    shape = re.sub(r"'(?:[^']|'')*'", '?', sql.replace('%s', '?'))
+    shape = re.sub(r'\b\d+(?:\.\d+)?\b', '?', shape)
+    return re.sub(r'IN \((?:\?, )*\?\)', 'IN (?)', shape)
+
+# The totals which haven't been saved yet, by view name. Each web server process has its own, so the lock only guards against its own threads.
+pending_statistics = {}
+statistics_lock = threading.Lock()
+last_flush_time = time.time()
+
+# 6. Add a request to the totals for its view, and save the totals if enough time has passed since they were last saved.
+def record_view_queries(view_name, number_of_queries, is_over_budget, repeated_shapes):
+    global last_flush_time
+    with statistics_lock:
+        totals = pending_statistics.setdefault(view_name, {'request_count': 0, 'query_count': 0, 'max_query_count': 0, 'over_budget_count': 0,
+                                                           'n_plus_one_count': 0, 'last_n_plus_one_query': ''})
+        totals['request_count'] = totals['request_count'] + 1
+        totals['query_count'] = totals['query_count'] + number_of_queries
+        totals['max_query_count'] = max(totals['max_query_count'], number_of_queries)
+        if is_over_budget:
+            totals['over_budget_count'] = totals['over_budget_count'] + 1
+        if len(repeated_shapes) > 0:
+            totals['n_plus_one_count'] = totals['n_plus_one_count'] + 1
+            totals['last_n_plus_one_query'] = repeated_shapes[0][0]
+        if time.time() - last_flush_time < settings.QUERY_COUNTING['FLUSH_INTERVAL']:
+            return
+        statistics_to_save = dict(pending_statistics)
+        pending_statistics.clear()
+        last_flush_time = time.time()
+    save_view_statistics(statistics_to_save)
+
+# 6.1. Add the pending totals to each view's record. The updates use F() expressions, so that the totals of several processes add up correctly.
+def save_view_statistics(statistics_to_save):
+    for view_name, totals in statistics_to_save.items():
+        ViewQueryStatistics.objects.get_or_create(view_name=view_name)
+        fields = {'request_count': F('request_count') + totals['request_count'],
+                  'query_count': F('query_count') + totals['query_count'],
+                  'max_query_count': Greatest(F('max_query_count'), totals['max_query_count']),
+                  'over_budget_count': F('over_budget_count') + totals['over_budget_count'],
+                  'n_plus_one_count': F('n_plus_one_count') + totals['n_plus_one_count']}
+        if totals['last_n_plus_one_query'] != '':
+            fields['last_n_plus_one_query'] = totals['last_n_plus_one_query']
+        ViewQueryStatistics.objects.filter(view_name=view_name).update(**fields)
@@ -0,0 +1,123 @@
+# Description: A cache for values derived from the database which are read far more often than they change, like the popular tag names and follower counts.
+# Each value belongs to a namespace, a family of keys which go stale together, and is cached under its namespace's current version. The version of a namespace
+# is bumped when a record it's derived from is saved, deleted, or added to a relation, which invalidates every key in the family at once without having
+# to find them: the old keys are never read again and expire on their own. The hits and misses of each namespace are counted in memory and added to the cache
+# every STATISTICS_FLUSH_INTERVAL seconds, and the site statistics page shows them. The settings are in settings.MODEL_CACHE.
+# signals.py publishes the namespace on invalidation_bus.py, which bumps the version in every worker process. With the local memory cache, each process has its
+# own copy of the values and versions, so each process bumps its own. With a cache shared between processes, like memcached, the process which published the
+# event bumps the shared version for all of them.
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+import threading
+import time
+from Meowseum import invalidation_bus
+
+# The namespaces, listed for the site statistics page.
+# popular_tags: The choices of the popular tags field. Refreshed periodically, and changes when a tag is deleted.
+# tag_subscribers: The number of subscribers of each tag. Changes when a user subscribes or unsubscribes.
+# followers: The number of followers of each user. Changes when a user follows or unfollows.
+# contact_information: Whether each user has contact information or a shelter account on file. Changes when a UserContact or Shelter record is saved or deleted.
+NAMESPACES = ('popular_tags', 'tag_subscribers', 'followers', 'contact_information')
+
+# A value which can't have been stored, for telling a miss apart from a cached None or False.
+MISSING = object()
+
+def get_cache():
+    return caches[settings.MODEL_CACHE['CACHE']]
+
+# 0. Main function. Return the value cached under a key in a namespace. On a miss, compute it by calling compute_value() and cache it.
+# Input: namespace, key, a string unique within the namespace, compute_value, a function with no arguments, and optionally timeout, the number of seconds to
+# keep the value if it's sooner than settings.MODEL_CACHE['TIMEOUT']. Output: The value.
+def get_or_set(namespace, key, compute_value, timeout=None):
+    cache = get_cache()
+    versioned_key = 'model_cache:' + namespace + ':' + str(get_version(namespace)) + ':' + key
+    value = cache.get(versioned_key, MISSING)
+    if value is not MISSING:
+        record_lookup(namespace, 'hits')
+        return value
+    record_lookup(namespace, 'misses')
+    value = compute_value()
+    if timeout == None or timeout > settings.MODEL_CACHE['TIMEOUT']:
+        timeout = settings.MODEL_CACHE['TIMEOUT']
+    cache.set(versioned_key, value, timeout)
+    return value
+
+# 1. Return the current version of a namespace. A version which isn't in the cache, because it has never been bumped or because the cache evicted it, starts
+# from the current time in milliseconds, so that it can't go back to a version whose keys are still cached.
+def get_version(namespace):
+    cache = get_cache()
+    version_key = 'model_cache:version:' + namespace
+    version = cache.get(version_key)
+    if version == None:
+        # If another process adds a version first, use that one.
+        cache.add(version_key, int(time.time() * 1000), None)
+        version = cache.get(version_key, 0)
+    return version
+
+# 2. Invalidate every key in a namespace by incrementing its version.
+# Input: namespace. Output: None.
+def bump_version(namespace):
+    cache = get_cache()
+    version_key = 'model_cache:version:' + namespace
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        # The namespace doesn't have a version yet, so none of its keys can be cached under one.
+        get_version(namespace)
+
+# 2.1. Bump the version of a namespace when it's published on the invalidation bus.
+def invalidate(namespace, from_this_process):
+    if from_this_process or isinstance(get_cache(), LocMemCache):
+        bump_version(namespace)
+
+for namespace in NAMESPACES:
+    invalidation_bus.subscribe(namespace, invalidate)
+
+# The hits and misses which haven't been added to the cache yet, by namespace. Each web server process has its own, so the lock only guards against its own threads.
+pending_statistics = {}
+statistics_lock = threading.Lock()
+last_flush_time = time.time()
+
+# 3. Count a hit or miss, and add the counts to the cache if enough time has passed since they were last added.
+# Input: namespace, outcome, which is 'hits' or 'misses'. Output: None.
+def record_lookup(namespace, outcome):
+    with statistics_lock:
+        counts = pending_statistics.setdefault(namespace, {'hits': 0, 'misses': 0})
+        counts[outcome] = counts[outcome] + 1
+        if time.time() - last_flush_time < settings.MODEL_CACHE['STATISTICS_FLUSH_INTERVAL']:
+            return
+    flush_statistics()
+
+# 3.1. Add the pending counts to the totals in the cache. incr() is atomic in memcached, so that the counts of several processes add up correctly.
+def flush_statistics():
+    global last_flush_time
+    with statistics_lock:
+        statistics_to_save = dict(pending_statistics)
+        pending_statistics.clear()
+        last_flush_time = time.time()
+    cache = get_cache()
+    for namespace, counts in statistics_to_save.items():
+        for outcome, count in counts.items():
+            if count == 0:
+                continue
+            statistics_key = 'model_cache:statistics:' + namespace + ':' + outcome
+            try:
+                cache.incr(statistics_key, count)
+            except ValueError:
+                if not cache.add(statistics_key, count, None):
+                    cache.incr(statistics_key, count)
+
+# 4. Return the hits, misses, and hit rate of each namespace, including the counts of this process which haven't been added to the cache yet.
+# Output: A list of dictionaries with the keys namespace, hits, misses, and hit_rate, the percentage of lookups which were hits, or None if there weren't any.
+def get_statistics():
+    flush_statistics()
+    cache = get_cache()
+    statistics = []
+    for namespace in NAMESPACES:
+        hits = cache.get('model_cache:statistics:' + namespace + ':hits', 0)
+        misses = cache.get('model_cache:statistics:' + namespace + ':misses', 0)
+        hit_rate = round(100 * hits / (hits + misses), 1) if hits + misses > 0 else None
+        statistics.append({'namespace': namespace, 'hits': hits, 'misses': misses, 'hit_rate': hit_rate})
+    return statistics
@@ -2,22 +2,24 @@
 # Class attributes correspond to the header row of a spreadsheet, and object attributes correspond to the record rows.
 # When I want to store all of a model's information related to a certain topic, I store everything related to the topic in another model and use a one-to-one-relationship.
 # Every Upload has a Metadata record. This organization is like nesting a JSON object or dictionary in another.
-# Summary of models for Ctrl+F navigation: Page, ExceptionRecord, TemporaryUpload, Upload, Metadata, Tag, Like, Comment, UserProfile, AbuseReport, Feedback, UserContact, Shelter,
+# Summary of models for Ctrl+F navigation: Page, ExceptionRecord, ViewQueryStatistics, VersionStamp, TemporaryUpload, ProcessingProgress, ResumableUpload, Upload, Metadata, Tag, Like, Comment, UserProfile, AbuseReport, Feedback, UserContact, Shelter,
 #                                          Adoption, Lost, Found
 
 from django.db import models
+import os
 from django import forms
 from Meowseum.custom_form_fields_and_widgets import MultipleChoiceField
 from django.contrib.auth.models import User
-from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.contrib.postgres.indexes import GinIndex
 from django import forms
 from hitcount.models import HitCountMixin
 from Meowseum.file_handling.MetadataRestrictedFileField import MetadataRestrictedFileField
 from Meowseum.file_handling.CustomStorage import CustomStorage
-from django.db.models import Count
 from django.conf import settings
 from django.core.validators import RegexValidator, MinValueValidator
 from django.utils.safestring import mark_safe
+from Meowseum import model_cache
 
 YES_OR_NO_CHOICES = ((True, 'Yes'), (False, 'No'))
 SEX_CHOICES = (('male', 'Male'), ('female', 'Female'))
@@ -107,6 +109,19 @@ class ChoiceArrayField(ArrayField):
         # Skip our parent's formfield implementation completely as we don't care for it.
         # pylint:disable=bad-super-call
         return super(ArrayField, self).formfield(**defaults)
+
+# Custom indexes.
+class UpperIndex(models.Index):
+    # An index of UPPER() of each field. On PostgreSQL, Django compares UPPER() of both sides for case-insensitive lookups like file_name__iexact, so an ordinary
+    # index of the field can't be used for them. Django 1.11 doesn't support indexes of expressions, so the columns are wrapped in the SQL which creates the index.
+    suffix = 'upr'
+    def get_sql_create_template_values(self, model, schema_editor, using):
+        parameters = super(UpperIndex, self).get_sql_create_template_values(model, schema_editor, using)
+        columns = []
+        for field_name, order in self.fields_orders:
+            columns = columns + [('UPPER(' + schema_editor.quote_name(model._meta.get_field(field_name).column) + ') ' + order).strip()]
+        parameters['columns'] = ', '.join(columns)
+        return parameters
     
 class Page(models.Model):
     # This model is used with django-hitcount to keep track of page views across the site. The first field is the DRY name of the page in urls.py.
@@ -137,9 +152,21 @@ validation_specifications_for_Upload = {
     'file_type': ('image', 'video'),
     'max_size': {'image': 10485760, 'video': 104857600}, # 10MB, 100MB
     'max_fps': 60,
-    # I chose this setting because the production server had difficulty processing a 17 second, 720p, 7MB video without running out of its 512MB memory.
-    ## 'max_duration': 10
-    'max_duration': 6000 # For development purposes
+    # The production server used to have a 10 second limit, because it had difficulty processing a 17 second, 720p, 7MB video without running out of its 512MB memory
+    # while MoviePy passed the frames through numpy. Videos are now encoded by ffmpeg directly, in processes with the limits from hosting_limits_for_Upload['process_limits'],
+    # and memory use no longer grows with the duration. Run "python manage.py benchmark_video_processing" on the server before raising this further.
+    ## 'max_duration': 600
+    'max_duration': 6000, # For development purposes
+    # Before a file is processed, it is compared to existing uploads. A file whose perceptual hash differs from an upload's by at most this many of its 64 bits,
+    # like a re-encoded or resized copy, is flagged as a near duplicate, and the uploader is offered a link to the existing upload.
+    'duplicate_distance': 6,
+    # A decompression bomb is a small file which decodes into a huge number of pixels, like a 10 KB PNG of a single color at 100000x100000. Images with more pixels
+    # than this are rejected from their headers, before they are decoded. 100 megapixels is about twice the resolution of the largest camera sensors.
+    'max_pixels': 100000000,
+    # The batch upload form accepts at most this many files per request. Any further files are skipped and listed as such in the response.
+    'max_batch_files': 20,
+    # A resumable upload which hasn't received a chunk for this many seconds is considered abandoned, and its staging file is deleted.
+    'resumable_upload_expiry': 86400
 }
 hosting_limits_for_Upload = {
     # When I looked up ext:png on Imgur, all of the images were <1 MB and used PNG correctly. The image should be designed with a computer and have a
@@ -148,20 +175,72 @@ hosting_limits_for_Upload = {
     # file contains transparency and/or lossless animation. Nearly all of the .gif uses on Imgur were for videos, so I decided against allowing .gifs
     # without any transparency.
     'conversion': (('image', 'image/jpeg'), ('image/png', 'image/png', 1048576), ('video', 'video/mp4')),
+    # JPEGs and PNGs are saved with the fewest bytes whose SSIM against the processed image is at least 'target_ssim'. JPEGs use the lowest quality from
+    # 'min_jpeg_quality' to 'jpeg_quality' which meets it. The savings are recorded in each Metadata record, and the total is on the site statistics page.
     'jpeg_quality': 95,
+    'min_jpeg_quality': 60,
+    'target_ssim': 0.99,
     'max_dimensions': {'image': ((1920,1200),(1080,1920)), 'video': ((1920,1200),(1080,1920))},
     'power_formula_coordinate': (4000000, 1080),
     'high_fps_multiplier': 1.5,
     'reencode_multiplier': 0.75,
     'preset': 'slow',
+    # Each ffmpeg process is limited to 384MB of address space and 15 minutes of CPU time, leaving room on the 512MB production server for the web server itself.
+    'process_limits': (402653184, 900),
+    'ffmpeg_threads': 2,
+    # The files of a batch upload are processed by this many threads at once. Each one may run an ffmpeg process, so raise this only with the memory to spare.
+    'batch_workers': 2,
+    # A still image that would decode larger than this many bytes, along with its resized copy, is shrunk while it's decoded instead of afterward. This keeps a 50
+    # megapixel PNG from using about 280MB of memory. See file_handling/large_images.py and "python manage.py benchmark_image_processing".
+    'image_memory_budget': 134217728,
     # I've tried to make the site as DRY as possible, in that the preceding keys' values can be changed without changing the rest of the site. The
     # site is hard-coded with the assumption that an image or video has a thumbnail if its width is >=600 pixels and that there is a posters directory,
-    # although the names of the directories are free to change.
+    # although the names of the directories are free to change. After changing the thumbnail, poster, rendition, or HLS settings, regenerate the files of existing
+    # uploads with "python manage.py rederive_media thumbnails posters renditions hls", listing only the types that changed.
     'thumbnail': ('width', 600, 'thumbnails'),
     'poster_directory': 'posters',
-    'exif_directory': 'metadata'
+    # WebP is about a third smaller than JPEG at the same visual quality, and AVIF is smaller still. Each (MIME type, quality) tuple is listed from most to
+    # least preferred. A format is skipped when the server's Pillow build can't encode it, which is usually the case for AVIF.
+    'renditions': (('image/avif', 60), ('image/webp', 80)),
+    # Mobile viewers on slow connections shouldn't have to download the full-quality MP4, so videos are also saved as an HTTP Live Streaming ladder: a tuple of
+    # the heights for the lower-resolution rungs, the segment duration in seconds, the directory, and whether new videos get a ladder. The original resolution is
+    # always the top rung. Turning the ladder off keeps the directory, so that the ladders of existing videos are still renamed and deleted along with them, and
+    # "python manage.py rederive_media hls" removes them.
+    'hls_ladder': ((240, 480, 720), 4, 'hls', True),
+    # On mouseover, a gallery tile plays a short, silent preview of a long video instead of loading the whole thumbnail video: a tuple of the number of clips
+    # sampled evenly across the video, the length of each clip in seconds, and the directory. Only videos more than twice as long as the preview have one.
+    'hover_preview': (6, 1, 'previews')
 }
 
+class ViewQueryStatistics(models.Model):
+    # This model is used with QueryCountingMiddleware. It holds the running totals of the database queries made by the requests to a view.
+    view_name = models.CharField(max_length=255, verbose_name="view name", unique=True)
+    request_count = models.BigIntegerField(verbose_name="request count", default=0)
+    query_count = models.BigIntegerField(verbose_name="query count", default=0)
+    max_query_count = models.IntegerField(verbose_name="most queries in one request", default=0)
+    over_budget_count = models.BigIntegerField(verbose_name="requests over budget", default=0)
+    # The requests which ran the same query with different values many times, and the shape of the most repeated query of the latest one.
+    n_plus_one_count = models.BigIntegerField(verbose_name="requests with N+1 queries", default=0)
+    last_n_plus_one_query = models.TextField(max_length=10000, verbose_name="latest N+1 query", default="", blank=True)
+    def get_average_query_count(self):
+        if self.request_count > 0:
+            return round(self.query_count / self.request_count, 1)
+    def __str__(self):
+        return self.view_name
+    class Meta:
+        verbose_name = "view query statistics"
+        verbose_name_plural = "view query statistics"
+
+class VersionStamp(models.Model):
+    # A counter which is incremented whenever the records shown by a group of pages change, so that the ETag of a page can be made from a few counters instead of
+    # the records themselves. The names are 'galleries' for every gallery, 'upload:' followed by a relative URL for a slide page, and 'user:' followed by a user ID
+    # for what a logged-in user sees of their own relationships, like their likes and the users they follow and mute. 'uploads' only counts the times an upload
+    # has been saved or deleted, which makes the anonymous page cache's pages stale.
+    name = models.CharField(max_length=300, verbose_name="name", unique=True)
+    version = models.BigIntegerField(verbose_name="version", default=0)
+    def __str__(self):
+        return self.name + " v" + str(self.version)
+
 class TemporaryUpload(models.Model):
     UPLOAD_TO = "stage2_processing"
     # This model supports the processing stage which occurs after a file is validated. Exceptions are almost unavoidable during this stage, usually due to issues
@@ -172,8 +251,56 @@ class TemporaryUpload(models.Model):
     def __str__(self):
         return self.file.name.split('/')[1]
 
+class ProcessingProgress(models.Model):
+    # While a TemporaryUpload's file is processed, this record holds how far along the current stage is, so that the upload modal can poll for it. The browser picks
+    # a random progress key before submitting the file, because the TemporaryUpload doesn't exist until the file has been received. The record is deleted along with
+    # the TemporaryUpload after processing.
+    temporary_upload = models.OneToOneField(TemporaryUpload, related_name="progress", on_delete=models.CASCADE)
+    uploader = models.ForeignKey(User, verbose_name="uploader", related_name="processing_progress", on_delete=models.CASCADE)
+    progress_key = models.CharField(max_length=32, verbose_name="progress key", db_index=True)
+    stage = models.CharField(max_length=255, verbose_name="stage", default="", blank=True)
+    # The fraction of the stage which is complete, from 0 to 1.
+    fraction = models.FloatField(verbose_name="fraction", default=0)
+    stage_started = models.DateTimeField(verbose_name="stage started", null=True, blank=True)
+    def get_seconds_remaining(self, now):
+        # Estimate the time left in the stage from its rate so far. The estimate isn't returned until enough of the stage is done for the rate to be meaningful.
+        if self.stage_started == None or self.fraction < 0.02:
+            return None
+        elapsed_seconds = (now - self.stage_started).total_seconds()
+        return int(elapsed_seconds * (1 - self.fraction) / self.fraction)
+    def __str__(self):
+        return self.progress_key
+    class Meta:
+        verbose_name_plural = "processing progress records"
+
+class ResumableUpload(models.Model):
+    UPLOAD_TO = "stage1_processing/resumable"
+    # A file which is being sent in chunks with the resumable upload protocol, so that a dropped connection only costs the current chunk. The chunks are written
+    # to a staging file named after the upload key, and offset is the number of bytes received so far. When the last chunk arrives, the staging file is validated
+    # and processed like a file sent to from_device. A record which hasn't received a chunk in 'resumable_upload_expiry' seconds is deleted along with its staging
+    # file by "python manage.py delete_abandoned_uploads".
+    uploader = models.ForeignKey(User, verbose_name="uploader", related_name="resumable_uploads", on_delete=models.CASCADE)
+    upload_key = models.CharField(max_length=32, verbose_name="upload key", unique=True)
+    original_name = models.CharField(max_length=255, verbose_name="original name")
+    length = models.BigIntegerField(verbose_name="length")
+    offset = models.BigIntegerField(verbose_name="offset", default=0)
+    # The MIME type detected from the first chunk, or a blank string until it can be told.
+    mime_type = models.CharField(max_length=100, verbose_name="MIME type", default="", blank=True)
+    # The from_device form's fields, sent when the upload is created.
+    progress_key = models.CharField(max_length=32, verbose_name="progress key", default="", blank=True)
+    allow_duplicate = models.BooleanField(verbose_name="allow duplicate", default=False, blank=True)
+    last_modified = models.DateTimeField(verbose_name="last modified", auto_now=True)
+    def get_staging_path(self):
+        return os.path.join(settings.MEDIA_PATH, self.UPLOAD_TO, self.upload_key)
+    def __str__(self):
+        return self.original_name
+
 class Upload(models.Model):
     UPLOAD_TO = "uploads"
+    CATEGORY_CHOICES = (('pets', 'Pets'),
+    ('adoption', 'Adoption'),
+    ('lost', 'Lost'),
+    ('found', 'Found'))
     
     file = MetadataRestrictedFileField(upload_to=UPLOAD_TO, validation_specifications = validation_specifications_for_Upload, \
                                        storage=CustomStorage(), max_length = 182, verbose_name="file", null=True, blank=True)
@@ -182,32 +309,39 @@ class Upload(models.Model):
     title = models.CharField(max_length=255, verbose_name="title", default="", blank=True)
     # This field is a version of the title with all the spaces replaced by underscores, and possibly including an underscore and seven-character ID from the file name.
     # It was necessary to add this field so that the file could be renamed if the URL existed, because I don't yet know how to query against a function of a field.
-    relative_url = models.CharField(max_length=255, verbose_name="relative URL", default="", blank=True)
+    # Every slide page and the pages for liking, tagging, commenting on, and deleting an upload look it up by this field.
+    relative_url = models.CharField(max_length=255, verbose_name="relative URL", default="", blank=True, db_index=True)
     description = models.TextField(max_length=10000, verbose_name="description", default="", blank=True)
     source = models.URLField(max_length=250, blank=True, default="")
     is_publicly_listed = models.BooleanField(verbose_name="public?", default=False, blank=True)
     uploader_has_disabled_comments = models.BooleanField(verbose_name="disable comments", default=False, blank=True)
+    # The category is the name of the reverse relation to the upload's Adoption, Lost, or Found record, or 'pets' if it has none. It's stored so that finding it
+    # doesn't take a query against each category's table. The adoption_upload, lost_upload, and found_upload views set it when they add the record, and it's set
+    # back to 'pets' when the record is deleted. A gallery of one category can load the records along with the uploads with select_related(category).
+    category = models.CharField(max_length=8, verbose_name="category", choices=CATEGORY_CHOICES, default="pets", blank=True)
+    # The merged fields which the slide page shows for the upload's Adoption, Lost, or Found record, as formatted by pet_display_data.py. They're updated when
+    # the record, its bonded pets, or the uploader's address change.
+    pet_display_data = JSONField(verbose_name="pet display data", null=True, blank=True)
+    # The number of comments on the upload, kept by signals.py, so that the slide page doesn't have to count them.
+    comment_count = models.PositiveIntegerField(verbose_name="comment count", default=0)
     # Related, relationship-setting models: Comment via upload, Tag via uploads, UserProfile via likes
     def get_category(self):
-        try:
-            self.adoption
-            return "adoption"
-        except Adoption.DoesNotExist:
-            try:
-                self.lost
-                return "lost"
-            except Lost.DoesNotExist:
-                try:
-                    self.found
-                    return "found"
-                except Found.DoesNotExist:
-                    return "pets"
+        return self.category
+    def get_pet_information(self):
+        # Return the Adoption, Lost, or Found record, or None for an upload in the Pets category. Only the table of the upload's category is queried.
+        if self.category == 'pets':
+            return None
+        return getattr(self, self.category)
     def __str__(self):
         if self.title:
             return self.title
         else:
             # Prevent an error from occurring in the admin site when an administrator tries to look at a record without a title.
             return "Upload #" + str(self.id)
+    class Meta:
+        # Galleries list the public uploads from newest to oldest, so these indexes return a page of them, or of one category's, without sorting.
+        indexes = [models.Index(fields=['is_publicly_listed', '-id']),
+                   models.Index(fields=['category', 'is_publicly_listed', '-id'])]
 
 class Metadata(models.Model):
     upload = models.OneToOneField(Upload)
@@ -224,6 +358,24 @@ class Metadata(models.Model):
     fps = models.FloatField(verbose_name="fps", null=True, blank=True)
     has_audio = models.BooleanField(verbose_name="has audio", default=False, blank=True)
     original_exif_orientation = models.IntegerField(verbose_name="original EXIF orientation", null=True, blank=True)
+    # The EXIF data of a JPEG, with tag names as keys, such as {'Model': 'Canon EOS 60D', 'GPSInfo': {...}}. It is removed from the file itself for privacy.
+    exif_data = JSONField(verbose_name="EXIF data", null=True, blank=True)
+    # The SHA-256 hash of the file as it was uploaded, before processing, and the perceptual hash of its image or sampled video frames, for detecting duplicates.
+    content_hash = models.CharField(max_length=64, verbose_name="content hash", default="", blank=True, db_index=True)
+    perceptual_hash = models.BigIntegerField(verbose_name="perceptual hash", null=True, blank=True)
+    # The existing upload that this upload was flagged as duplicating, if the uploader chose to upload it anyway.
+    duplicate_of = models.ForeignKey('Upload', verbose_name="duplicate of", related_name="duplicates", on_delete=models.SET_NULL, null=True, blank=True)
+    # The MIME types of the renditions saved alongside the file, its thumbnail, and its posters, in order of preference. The templates only offer a browser the
+    # renditions listed here, so uploads from before a format was enabled keep working until the create_renditions command has been run.
+    rendition_types = ArrayField(models.CharField(max_length=255), verbose_name="rendition types", default=list, blank=True)
+    # The heights of the rungs of the video's HLS ladder, from lowest to highest. The list is empty if the video doesn't have one.
+    hls_rungs = ArrayField(models.IntegerField(), verbose_name="HLS rungs", default=list, blank=True)
+    # The size the image would have had if it had been saved without optimizing its encoding, and the JPEG quality which was chosen. These are null for videos,
+    # for PNGs which weren't saved again, and for uploads from before the encoding was optimized.
+    unoptimized_file_size = models.IntegerField(verbose_name="unoptimized file size", null=True, blank=True)
+    jpeg_quality = models.IntegerField(verbose_name="JPEG quality", null=True, blank=True)
+    # Whether the video has a hover preview for gallery tiles, saved as an .mp4 with the same name as the file in the 'hover_preview' directory.
+    has_hover_preview = models.BooleanField(verbose_name="has hover preview", default=False, blank=True)
     def get_geometric_mean(self):
         # If the image or video were a square with the same area, this would be the length of each side. This metric is good for comparing area in a human-readable way.
         return (self.width * self.height) ** (1/2)
@@ -231,6 +383,10 @@ class Metadata(models.Model):
         # Return bits per second.
         if self.duration != None:
             return int(self.file_size * 8 / self.duration)
+    def get_bytes_saved(self):
+        # Return the number of bytes saved by optimizing the encoding.
+        if self.unoptimized_file_size != None:
+            return self.unoptimized_file_size - self.file_size
     def __str__(self):
         if self.upload != None and self.upload.relative_url != '':
             return self.upload.relative_url
@@ -239,42 +395,52 @@ class Metadata(models.Model):
     class Meta:
         verbose_name = "metadata record"
         verbose_name_plural = "metadata records"
+        # Allow querying uploads by EXIF values, like exif_data__Make='Canon', without scanning the table. File names are checked for uniqueness with
+        # file_name__iexact. The index isn't unique, because uploads of the same file share its name with content-addressed storage.
+        indexes = [GinIndex(fields=['exif_data']), UpperIndex(fields=['file_name'])]
 
 class Tag(models.Model):
     # Tags have their own model in order to be able to sort tags by the number of uploads that are associated with them.
     # Values that have a finite number of choices, like cat breed, do not need their own model because the sorting can be done via a Python function.
-    name = models.CharField(max_length=255, verbose_name="name", default="")
+    # Tags are looked up with Tag.objects.get(name=...), so there can only be one record for each name. Run "python manage.py merge_duplicate_tags" before adding
+    # the unique constraint to a database which may have duplicates.
+    name = models.CharField(max_length=255, verbose_name="name", default="", unique=True)
     uploads = models.ManyToManyField(Upload, related_name="tags")
+    # The number of uploads with the tag, which signals.py keeps up to date, so that the most popular tags are found with an index instead of counting each tag's
+    # uploads. Run "python manage.py count_tag_uploads" to fill it in for existing tags.
+    upload_count = models.PositiveIntegerField(verbose_name="number of uploads", default=0, db_index=True)
     # Other relationship-setting models: UserProfile via subscribers
     def __str__(self):
         return self.name
     # Retrieve up to 20 of the most popular tag names from the database. The output will use the data structure required for a form field's choices argument:
-    # a tuple of (value, label) tuples. Each label will be the same as its value. The main upload page uses this.
+    # a tuple of (value, label) tuples. Each label will be the same as its value. The main upload page uses this. The ranking changes with every tag added to an
+    # upload, so rather than being invalidated by each change, it's cached for settings.MODEL_CACHE['POPULAR_TAGS_REFRESH_SECONDS']. See model_cache.py.
     def get_popular_tag_names():
-        # Retrieve the number of tags to return.
         try:
-            number_of_tags = Tag.objects.count()
-            if number_of_tags > 20:
-                number_of_tags = 20
-
-            tags = Tag.objects.annotate(number_of_uploads=Count('uploads')).order_by("-number_of_uploads")[0:number_of_tags]
-            popular_tags = tuple()
-            for x in range(number_of_tags):
-                popular_tags = popular_tags + ((tags[x].name, tags[x].name),)
-            return popular_tags
+            return model_cache.get_or_set('popular_tags', 'names', Tag.find_popular_tag_names, settings.MODEL_CACHE['POPULAR_TAGS_REFRESH_SECONDS'])
         except:
             # This exception handles the scenario that the database has been deleted and there is no Tag table to query
             # during migration. Return an empty tuple, the same as when the table exists and there aren't any tags.
             return tuple()
+    def find_popular_tag_names():
+        tag_names = Tag.objects.filter(upload_count__gt=0).order_by("-upload_count").values_list('name', flat=True)[0:20]
+        return tuple([(tag_name, tag_name) for tag_name in tag_names])
+    def get_subscriber_count(self):
+        return model_cache.get_or_set('tag_subscribers', str(self.id), self.subscribers.count)
 
 class Like(models.Model):
     # It is necessary to create a record for each like in order to keep track of when each like was made, rather than having it as a profile field.
     # First, this allows the Likes gallery can be sorted by recency, and second, the recency of Likes as votes can be used during ranking algorithms, especially on the front page.
     upload = models.ForeignKey(Upload, verbose_name="upload", related_name="likes")
     liker = models.ForeignKey(User, verbose_name="liker", related_name="likes")
-    datetime_liked = models.DateTimeField(verbose_name="date and time of like", auto_now_add=True)
+    # Trending galleries count the likes from the past week.
+    datetime_liked = models.DateTimeField(verbose_name="date and time of like", auto_now_add=True, db_index=True)
     def __str__(self):
         return self.liker.username + " liked " + self.upload.title
+    class Meta:
+        # A user can like an upload once. The unique index also serves the lookup of whether a user has liked an upload. Run "python manage.py
+        # delete_duplicate_likes" before adding the constraint to a database which may have duplicates.
+        unique_together = ('upload', 'liker')
 
 class Comment(models.Model):
     upload = models.ForeignKey(Upload, verbose_name="upload", related_name="comments", null=True)
@@ -283,6 +449,9 @@ class Comment(models.Model):
     text = models.TextField(max_length=10000, verbose_name="text", default="")
     def __str__(self):
         return self.text
+    class Meta:
+        # The slide page loads an upload's comments in chunks, starting after the ID of the last comment loaded, so this index returns each chunk without sorting.
+        indexes = [models.Index(fields=['upload', 'id'])]
 
 class UserProfile(models.Model):
     # 1. This section is for authentication information.
@@ -297,25 +466,18 @@ class UserProfile(models.Model):
     subscribed_tags = models.ManyToManyField(Tag, verbose_name="subscribed tags", related_name="subscribers", blank=True)
     # Other relationship-setting models: Upload via uploader, Comment via commenter
     # For Meowseum, UserContactInfo ("user_contact_info") via account, Shelter via account
+    # Whether the user has a shelter account and the number of followers are cached until they change. See model_cache.py.
     def is_shelter(self):
-        try:
-            self.user_auth.shelter
-            return True
-        except Shelter.DoesNotExist:
-            return False
+        return model_cache.get_or_set('contact_information', 'shelter:' + str(self.user_auth_id),
+                                      lambda: Shelter.objects.filter(account_id=self.user_auth_id).exists())
     def has_contact_information(self):
         # This method is used by the upload_page1.py view, for detecting whether the user needs to be warned, and it is used by the UploadPage1 form for validation.
         # Determine whether the user has contact information on file, either via a UserContact (regular user) or Shelter account record. Only users with account
         # information can upload to the Adoption, Lost, and Found sections.
-        try:
-           Shelter.objects.get(account = self.user_auth)
-           return True
-        except Shelter.DoesNotExist:
-            try:
-                UserContact.objects.get(account = self.user_auth)
-                return True
-            except UserContact.DoesNotExist:
-                return False
+        return model_cache.get_or_set('contact_information', 'contact:' + str(self.user_auth_id),
+                                      lambda: self.is_shelter() or UserContact.objects.filter(account_id=self.user_auth_id).exists())
+    def get_follower_count(self):
+        return model_cache.get_or_set('followers', str(self.pk), self.followers.count)
     def __str__(self):
         return self.user_auth.username
     class Meta:
@@ -0,0 +1,419 @@
+# Description: For displaying an Adoption, Lost, or Found record, the output will be more human-readable when the values of form fields on the same topic are merged.
+# For example, on the form, it made sense to ask for the overall coat color, coat pattern, and nose color separately, in order to get as much information as possible.
+# For the output, the reader doesn't need to see all the labels, so their values are merged beside one "Color:" label.
+# As well, there are Boolean fields that shouldn't be shown if the user has entered in the affirmative and then filled out a follow-up question.
+# If the user has said the cat has a collar and then described the collar, the user doesn't explicitly need to be told that the cat has a collar.
+# The merged fields are computed when the pet's record or the uploader's address changes, and stored in the upload's pet_display_data field, so the slide page
+# reads them along with the upload and doesn't format anything. signals.py calls update_pet_display_data() for each change.
+
+from Meowseum.models import Upload, UserContact
+from Meowseum.common_view_functions import bump_version_stamps
+from django.template.defaultfilters import capfirst
+from Meowseum.templatetags.my_filters import humanize_list, format_currency
+from django.utils.safestring import mark_safe
+from django.utils.html import conditional_escape
+
+# 0. Main function. Compute the display data of an Adoption, Lost, or Found record and store it in its upload's pet_display_data field. The values are
+# HTML-escaped, except for the links in 'Bonded with', which are already HTML, so that they can be marked safe when they're read back. Fields without a value
+# are left out, because the template skips them anyway.
+# Input: record, an Adoption, Lost, or Found record. Output: display_data, the dictionary which was stored.
+def update_pet_display_data(record):
+    upload = record.upload
+    category = record._meta.model_name
+    # The formatting functions take the upload, so attach the record to it. This also keeps them from querying it again.
+    setattr(upload, category, record)
+    if category == 'adoption':
+        merged_fields, boolean_answers = format_adoption_record_for_display(upload)
+    elif category == 'lost':
+        merged_fields, boolean_answers = format_lost_record_for_display(upload)
+    else:
+        merged_fields, boolean_answers = format_found_record_for_display(upload)
+    display_data = {'merged_fields': [[label, str(conditional_escape(value))] for label, value in merged_fields if value != '' and value != None],
+                    'boolean_answers': None,
+                    'date': None}
+    if boolean_answers != None:
+        display_data['boolean_answers'] = [str(conditional_escape(answer)) for answer in boolean_answers]
+    if category != 'adoption' and record.date != None:
+        display_data['date'] = record.date.isoformat()
+    Upload.objects.filter(id=upload.id).update(pet_display_data=display_data)
+    upload.pet_display_data = display_data
+    bump_version_stamps(['upload:' + upload.relative_url])
+    return display_data
+
+# 1. For an Upload record in the Adoption category, merge all the related fields and omit the fields without any relevant information.
+# Input: An Upload record. Output: merged_fields, boolean_answers
+def format_adoption_record_for_display(upload):
+    merged_fields = (('Name', upload.adoption.pet_name),
+                     ('Sex', get_adoption_merged_sex_field(upload.adoption)),
+                     ('City', get_city_merged_field(upload)),
+                     ('Breed', get_merged_breed_field(upload.adoption)),
+                     ('Coat description', get_coat_description_field(upload.adoption)),
+                     ('Disabilities', capfirst(humanize_list(upload.adoption.disabilities, ""))),
+                     ('Prefers a home without', capfirst(humanize_list(upload.adoption.prefers_a_home_without, ""))),
+                     ('Age', get_merged_age_field(upload.adoption)),
+                     ('Weight', get_merged_weight_field(upload.adoption)),
+                     ('Energy level', capfirst(upload.adoption.energy_level)),
+                     ('Bonded with', format_bonded_with_field(upload.adoption.bonded_with.select_related('upload'))),
+                     ('ID', upload.adoption.internal_id),
+                     ('Adoption fee', format_currency(upload.adoption.adoption_fee, exact=False)))
+    boolean_answers = get_adoption_boolean_answers(upload.adoption, merged_fields[1][1])
+    return merged_fields, boolean_answers
+
+# 1.1 For the Adoption record, the Sex label will use merged strings for the sex field and the spay/neuter field.
+# Input: An Adoption record. Output: The string for the merged field.
+def get_adoption_merged_sex_field(record):
+    sex = capfirst(record.sex)
+    if 'spayed or neutered' in record.has_been:
+        if sex == 'Male':
+            sex = sex + ', neutered'
+        else:
+            if sex == 'Female':
+                sex = sex + ', spayed'
+    return sex
+
+# 1.2 The City label will use merged strings for the city, state or province, and ZIP or postal code. These three fields are currently required.
+# Input: An Upload record. Output: The string for the merged field.
+def get_city_merged_field(upload):
+    try:
+        uploader_address = UserContact.objects.select_related('address').get(account=upload.uploader_id).address
+        return uploader_address.city + ", " + uploader_address.state_or_province + " (" + uploader_address.zip_code + ")"
+    except UserContact.DoesNotExist:
+        return ''
+
+# 1.3 The Breed label will use merged strings for the breed field and the hair length field.
+# Input: An Adoption, Lost, or Found record. Output: The string for the merged field.
+def get_merged_breed_field(record):
+    breed = ''
+    if record.subtype1 == '':
+        # Strictly speaking, not all cats for which the breed option is left blank will be a mix, but most shelters write 'Domestic ___ Hair'
+        # for all cats, and the term means the cat is a mix. Even though writing "Mix" at the beginning would be clearer, some cat owners might
+        # take exception to their cat being a mix when they didn't explicitly indicate it. So, I left "Mix, " off the beginning.
+        if record.hair_length == 'short':
+            breed = 'Domestic Short Hair'
+        elif record.hair_length == 'medium':
+            breed = 'Domestic Medium Hair'
+        else:
+            if record.hair_length == 'long':
+                breed = 'Domestic Long Hair'
+    else:
+        breed = record.subtype1
+        if record.hair_length == 'short':
+            breed = breed + " with " + 'short hair'
+        elif record.hair_length == 'medium':
+            breed = breed + " with " + 'medium hair'
+        else:
+            if record.hair_length == 'long':
+                breed = breed + " with " + 'long hair'
+    return breed
+
+# 1.4 The Coat description label will use merged strings for the Pattern field, the Color 1 field, the Color 2 field, the fields related to tortoiseshell (multicolor) cats,
+# and the 'socks' option under "Other physical characteristics".
+# Input: An Adoption, Lost, or Found record. Output: The string for the merged field.
+def get_coat_description_field(record):
+    coat_description = ''
+    if record.pattern == '' and record.color1 != '':
+        coat_description = capfirst(record.color1)
+        if record.color2 != '':
+            # Validate later that the first color field is filled out if the second field is filled out.
+            coat_description = coat_description + " and " + record.color2
+    elif record.pattern == 'solid':
+        # If 'solid' is selected, validate later that the second color field isn't filled out.
+        if record.color1 == '':
+            coat_description = 'Solid'
+        else:
+            coat_description = 'Solid' + record.color1
+    elif record.pattern == 'tuxedo':
+        # If a bicolor pattern is selected, validate later that both color fields are filled out.
+        if record.color1 == '':
+            coat_description = 'Tuxedo'
+        else:
+            if record.color1 == 'black' and record.color2 == 'white':
+                coat_description = 'Black and white tuxedo cat'
+            else:
+                coat_description = capfirst(record.color1) + " and " + record.color2 + " in a tuxedo pattern"
+    elif record.pattern == 'Van':
+        if record.color1 == '' or record.color1 == 'white':
+            coat_description = 'Mostly white except for the head and tail'
+        else:
+            coat_description = capfirst(record.color1) + ' and ' + record.color2 + ', mostly ' + record.color1 + ' except for the head and tail'
+    elif record.pattern == 'other bicolor':
+        if record.color1 == '':
+            coat_description = 'Bicolor'
+        else:
+            coat_description = capfirst(record.color1)
+            if record.color2 != '':
+                coat_description = coat_description + " and " + record.color2
+    elif record.pattern == 'tabby stripes':
+        if record.color1 == '' and record.color2 == '':
+            coat_description = 'Tabby'
+        else:
+            coat_description = capfirst(record.color1)
+            if record.color2 != '':
+                coat_description = coat_description + ' and ' + record.color2 + 'tabby'
+            else:
+                coat_description = coat_description + ' tabby'
+    elif record.pattern == 'spotted':
+        if record.color1 == '' and record.color2 == '':
+            coat_description = 'Spotted'
+        else:
+            # This pattern is relatively rare, so it is the only one that places the pattern first in the coat description.
+            if record.color2 == '':
+                coat_description = "Spotted " + record.color1
+            else:
+                coat_description = "Spotted, " + record.color1 + " and " + record.color2
+    elif record.pattern == 'tortoiseshell':
+        if record.is_calico == None:
+            coat_description = 'Tortoiseshell (orange, black, and possibly white)'
+        elif record.is_calico == True:
+            coat_description = 'Calico (orange, black, and white)'
+        elif record.is_calico == False:
+            coat_description = 'Orange and black (tortoiseshell) without any white'
+        if record.has_tabby_stripes == True:
+            coat_description = coat_description + ", with tabby stripes"
+        else:
+            if record.has_tabby_stripes == False:
+                coat_description = coat_description + ", without tabby stripes"
+        if record.is_dilute == True:
+            coat_description = coat_description + ". " + "The color is dilute, or desaturated like watercolors."
+        else:
+            if record.is_dilute == False:
+                coat_description = coat_description + ". " + "The color is intense or saturated."
+    if 'socks' in record.other_physical and record.__class__.__name__ != 'Adoption':
+        # If the cat has white paws, and this is a Lost or Found upload, then mention it in the coat description.
+        # If this is an Adoption upload, then the socks option is only used while searching.
+        # When displaying the record, there isn't a need to be that precise.
+        socks_sentence = capfirst(record.possessive_pronoun()) + " paws are white like socks."
+        if coat_description == '':
+            coat_description = socks_sentence
+        else:
+            if coat_description.endswith("."):
+                coat_description = coat_description + " " + socks_sentence
+            else:
+                coat_description = coat_description + ". " + socks_sentence
+    return coat_description
+
+# 1.5 The 'Age' label will merge the field for the age rating (using four qualitiative terms) with the fields for the numerical age in months or years.
+# Input: An Adoption, Lost, or Found record. Output: The string for the merged field.
+def get_merged_age_field(record):
+    age = ''
+    if record.age_rating != '':
+        age = age + capfirst(record.age_rating)
+        if record.precise_age != None:
+            age = age + ", " + str(int(record.precise_age)) + " " + record.age_units
+            # Later, validate that if the user has filled out the numerical age, that the user has also chosen a unit.
+    else:
+        if record.precise_age != None:
+            age = str(int(record.precise_age)) + " " + record.age_units
+    return age
+
+# 1.6 The 'Weight' label will merge the fields for the weight and its units.
+# Input: An Adoption, Lost, or Found record. Output: The string for the merged field.
+def get_merged_weight_field(record):
+    weight = ''
+    if record.weight != None:
+        weight = str(int(record.weight)) + " " + record.weight_units
+    return weight
+
+# 1.7 Input: A queryset of records for adoptable animals with which this pet has bonded.
+# These are the pet's friends and relatives that would be better off taken to one home together when possible.
+# Output: HTML for links to each profile.
+# If the queryset contains no records, then return an empty string.
+def format_bonded_with_field(queryset):
+    if queryset == 'Meowseum.Adoption.None':
+        return ''
+    else:
+        list_of_links = []
+        for pet in queryset:
+            list_of_links = list_of_links + ['<a class="emphasized" href="../' + pet.upload.relative_url + '">'\
+                            + conditional_escape(pet.pet_name) + '</a>']
+        return mark_safe(humanize_list(list_of_links))
+
+# 1.8 Input: An Adoption record and the merged string corresponding to the label 'Sex'.
+# Output: A tuple of strings related to Boolean fields for which the user didn't answer a follow-up question. If there are no entries, the function returns None.
+def get_adoption_boolean_answers(record, sex):
+    boolean_answers = tuple()
+    if sex == '' and 'spayed or neutered' in record.has_been:
+        boolean_answers = boolean_answers + ('Spayed or neutered',)
+    if 'house trained' in record.has_been:
+        boolean_answers = boolean_answers + ('House trained',)
+    if 'declawed' in record.has_been:
+        boolean_answers = boolean_answers + ('Declawed',)
+    if 'vaccinated' in record.has_been:
+        boolean_answers = boolean_answers + ('Vaccinations up to date',)
+    if 'microchipped' in record.has_been:
+        boolean_answers = boolean_answers + ('Microchipped',)
+    if 'tested and treated for worms, ticks, and fleas' in record.has_been:
+        boolean_answers = boolean_answers + ('Tested and treated for worms, ticks, and fleas',)
+
+    if boolean_answers == tuple():
+        # If the tuple is still empty, then store "None" instead so that the condition for showing the field will be clearer.
+        boolean_answers = None
+    return boolean_answers
+
+# 2. For an Upload record in the Lost category, merge all the related fields and omit the fields without any relevant information.
+# Input: An Upload record. Output: merged_fields, boolean_answers.
+def format_lost_record_for_display(upload):
+    microchip_ID, tattoo_ID = get_microchip_or_tattoo_ID(upload.lost)
+    merged_fields = (('Name', upload.lost.pet_name),
+                     ('Sex', get_lost_merged_sex_field(upload.lost)),
+                     ('City', get_city_merged_field(upload)),
+                     ('Location description', upload.lost.location),
+                     ('Collar', get_collar_merged_field(upload.lost)),
+                     ('Microchip ID', microchip_ID),
+                     ('Tattoo ID', tattoo_ID),
+                     ('Breed', get_merged_breed_field(upload.lost)),
+                     ('Coat description', get_coat_description_field(upload.lost)),
+                     ('Eye color', get_merged_eye_color_field(upload.lost)),
+                     ('Nose color', capfirst(humanize_list(upload.lost.nose_color))),
+                     ('Other special characteristics', get_merged_other_special_characteristics_field(upload.lost)),
+                     ('Disabilities', capfirst(humanize_list(upload.lost.disabilities, ""))),
+                     ('Age', get_merged_age_field(upload.lost)),
+                     ('Weight', get_merged_weight_field(upload.lost)),
+                     ('Reward', format_currency(upload.lost.reward, exact=False)))
+    boolean_answers = get_lost_boolean_answers(upload.lost, merged_fields[4][1], merged_fields[1][1])
+    return merged_fields, boolean_answers
+
+# 2.1 For the Lost record, the Sex label will use merged strings for the sex field, the spay/neuter field, and the spay/neuter tattoo field.
+# Input: A Lost record. Output: The string for the merged field.
+def get_lost_merged_sex_field(record):
+    sex = capfirst(record.sex)
+    if 'spayed or neutered' in record.yes_or_no_questions:
+        if sex == 'Male':
+            sex = sex + ', neutered'
+            if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
+                sex = sex + '. Has a neuter tattoo.'
+        else:
+            if sex == 'Female':
+                sex = sex + ', spayed'
+                if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
+                    sex = sex + '. Has a spay tattoo.'
+    return sex
+
+# 2.2 The Collar label will use merged strings for the collar color field and the collar description field.
+# Input: A Lost or Found record. Output: The string for the merged field.
+def get_collar_merged_field(record):
+    collar = ''
+    if 'has a collar' in record.yes_or_no_questions:
+        if record.collar_description != '':
+            if record.collar_color != '':
+                # If the user has filled out both the "Collar color" and "Collar description" fields, then append the collar color to the description.
+                # Use only the "Collar description" field.
+                collar = capfirst(record.collar_color) + ". " + record.collar_description
+            else:
+                collar = record.collar_description
+        else:
+            if record.collar_color != '':
+                # If the user has filled out the "Collar color" field but not the "Collar description" field, then use it instead.
+                collar = capfirst(record.collar_color)
+    return collar
+
+# 2.3 Return the data for the 'Microchip ID' and 'Tattoo ID' labels.
+# Input: A Lost record. Output: A string for the microchip ID and a string for the tattoo ID. The site assumes having a microchip and a serial number tattoo are mutually
+# exclusive for simplicity, because most sites talk about it in terms of the pros and cons of one or the other. So, at least one of the two outputs will always be an empty string.
+def get_microchip_or_tattoo_ID(record):
+    microchip_ID = ''
+    tattoo_ID = ''
+    if record.microchip_or_tattoo_ID != '':
+        if 'microchipped' in record.yes_or_no_questions:
+            microchip_ID = record.microchip_or_tattoo_ID
+        else:
+            tattoo_ID = record.microchip_or_tattoo_ID
+    return microchip_ID, tattoo_ID
+
+# 2.4 The Eye color label will use the merged fields "eye color", "eye color - other", and the heterochromia option under "other physical features".
+# Input: A Lost or Found record. Output: The string for the merged field.
+def get_merged_eye_color_field(record):
+    eye_color = capfirst(record.eye_color)
+    # Later, validate against the user checking a radio button that indicates the cat has eyes of one color, while also checking Heterochromia.
+    if eye_color == '':
+        if record.eye_color_other != '':
+            eye_color = capfirst(record.eye_color_other)
+            # If the cat has heterochromia and the user has filled out this field, then I'm trusting the user has mentioned it.
+        else:
+            if 'heterochromia' in record.other_physical:
+                eye_color = 'Has a different eye color in each eye.'
+    return eye_color
+
+# 2.5 The 'Other special characteristics' label will merge the 'Other special characteristics' field with data concerning whether the user checked "Bobtail" or "Polydactyl".
+# Input: A Lost or Found record. Output: The string for the merged field.
+def get_merged_other_special_characteristics_field(record):
+    other_special_characteristics = record.other_special_markings
+    if other_special_characteristics != '':
+        if 'bobtail' in record.other_physical:
+            "Bobtail. " + other_special_characteristics
+        if 'polydactyl' in record.other_physical:
+            "Polydactyl (more than five toes on at least one paw). " + other_special_characteristics
+    return other_special_characteristics
+
+# 2.6 Input: A Lost record and the merged strings with the labels 'Sex' and 'Collar'.
+# Output: A tuple of strings related to Boolean fields for which the user didn't answer a follow-up question. If there are no entries, the function returns None.
+def get_lost_boolean_answers(record, collar, sex):
+    boolean_answers = tuple()
+    if collar == '' and 'has a collar' in record.yes_or_no_questions:
+        boolean_answers = boolean_answers + ('Has a collar',)
+    if record.microchip_or_tattoo_ID == '':
+        if 'microchipped' in record.yes_or_no_questions:
+            boolean_answers = boolean_answers + ('Microchipped',)
+        if 'has a tattoo of a serial number' in record.yes_or_no_questions:
+            boolean_answers = boolean_answers + ('Has a tattoo of a serial number',)
+    if sex == '' and 'spayed or neutered' in record.yes_or_no_questions:
+        if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
+            boolean_answers = boolean_answers + ('Spayed or neutered, with a spay or neuter tattoo',)
+        else:
+            boolean_answers = boolean_answers + ('Spayed or neutered',)
+    if boolean_answers == tuple():
+        # If the tuple is still empty, then store "None" instead so that the condition for showing the field will be clearer.
+        boolean_answers = None
+
+    return boolean_answers
+
+# 3. For an Upload record in the Found category, merge all the related fields and omit the fields without any relevant information.
+# Input: An Upload record. Output: merged_fields, boolean_answers.
+def format_found_record_for_display(upload):
+    merged_fields = (('Name', upload.found.pet_name),
+                     ('Sex', get_found_merged_sex_field(upload.found)),
+                     ('City', get_city_merged_field(upload)),
+                     ('Location description', upload.found.location),
+                     ('Collar', get_collar_merged_field(upload.found)),
+                     ('Breed', get_merged_breed_field(upload.found)),
+                     ('Coat description', get_coat_description_field(upload.found)),
+                     ('Eye color', get_merged_eye_color_field(upload.found)),
+                     ('Nose color', capfirst(humanize_list(upload.found.nose_color))),
+                     ('Other special characteristics', get_merged_other_special_characteristics_field(upload.found)),
+                     ('Disabilities', capfirst(humanize_list(upload.found.disabilities, ""))),
+                     ('Age', get_merged_age_field(upload.found)),
+                     ('Weight', get_merged_weight_field(upload.found)),
+                     ('ID', upload.found.internal_id))
+    boolean_answers = get_found_boolean_answers(upload.found, merged_fields[4][1], merged_fields[1][1])
+    return merged_fields, boolean_answers
+
+# 3.1 For the Found record, the Sex label will use merged strings for the sex field and the spay/neuter tattoo field.
+# Input: A Found record. Output: The string for the merged field.
+def get_found_merged_sex_field(record):
+    sex = capfirst(record.sex)
+    if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
+        if sex == 'Male':
+            sex = sex + ', neutered'
+        else:
+            if sex == 'Female':
+                sex = sex + ', spayed'
+    return sex
+
+# 3.2 Input: A Found record and the merged strings with the labels 'Sex' and 'Collar'.
+# Output: A tuple of strings related to Boolean fields for which the user didn't answer a follow-up question. If there are no entries, the function returns None.
+def get_found_boolean_answers(record, collar, sex):
+    boolean_answers = tuple()
+    if collar == '' and 'has a collar' in record.yes_or_no_questions:
+        boolean_answers = boolean_answers + ('Has a collar',)
+    if sex == '' and 'spayed or neutered' in record.yes_or_no_questions:
+        if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
+            boolean_answers = boolean_answers + ('Spayed or neutered',)
+    if 'no microchip detected during scan' in record.yes_or_no_questions:
+        boolean_answers = boolean_answers + ('No microchip detected during scan',)
+    if record.is_sighting:
+        boolean_answers = boolean_answers + ("This is a sighting report. The uploader doesn't have the cat right now.",)
+    if boolean_answers == tuple():
+        # If the tuple is still empty, then store "None" instead so that the condition for showing the field will be clearer.
+        boolean_answers = None
+
+    return boolean_answers
@@ -1,11 +1,16 @@
 # Description: This file is for altering the behavior of basic database actions, such as saving a record or deleting one, from the default. 
 
-from Meowseum.models import Upload, Tag, hosting_limits_for_Upload
-from django.db.models.signals import pre_delete
+from Meowseum.models import Upload, Metadata, Tag, Like, Comment, UserProfile, Adoption, Lost, Found, Address, UserContact, Shelter, \
+                            hosting_limits_for_Upload
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_delete, post_delete, post_save, m2m_changed
 from django.dispatch import receiver
+from django.db.models import F
 import os
-from django.conf import settings
-from Meowseum.file_handling.file_utility_functions import remove_file
+from Meowseum.file_handling.file_utility_functions import remove_file, remove_renditions, remove_directory
+from Meowseum.pet_display_data import update_pet_display_data
+from Meowseum.common_view_functions import bump_version_stamps
+from Meowseum import invalidation_bus
 
 # When the last Upload record associated with a Tag record is deleted, delete the Tag record.
 @receiver(pre_delete, sender=Upload)
@@ -18,19 +23,27 @@ def delete_tag_record_with_no_uploads(sender, **kwargs):
 # When an Upload record is deleted, then delete its file. Delete any existing thumbnail or poster files. This is necessary to prevent file naming conflicts with future uploads.
 @receiver(pre_delete, sender=Upload)
 def delete_upload_files(sender, instance, **kwargs):
-    # Retrieve the values needed to assemble the path to the upload to be deleted and the paths to any existing associated files.
-    file_database_value = instance.file.name
-    file_directory, full_file_name = os.path.split(file_database_value)
-    file_name, extension = os.path.splitext(full_file_name)
+    if Upload.objects.filter(file=instance.file.name).exclude(id=instance.id).exists():
+        # With content-addressed storage, uploads of the same file share it. Keep the files until the last upload using them is deleted.
+        return
+    # Retrieve the values needed to assemble the upload's name in media storage and the names of any existing associated files.
+    # The file name is relative to the upload directory, because a content-addressed name includes subdirectories.
+    file_directory = Upload.UPLOAD_TO
+    file_name, extension = os.path.splitext(instance.file.name[len(file_directory) + 1:])
     thumbnail_directory = hosting_limits_for_Upload['thumbnail'][2]
     poster_directory = hosting_limits_for_Upload['poster_directory']
+    hls_directory = hosting_limits_for_Upload['hls_ladder'][2]
+    hover_preview_directory = hosting_limits_for_Upload['hover_preview'][2]
 
-    # Assemble the paths to the upload and any existing associated files.
-    file_path = os.path.join(settings.MEDIA_ROOT, file_directory, file_name) + extension
-    thumbnail_path = os.path.join(settings.MEDIA_ROOT, file_directory, thumbnail_directory, file_name) + extension
-    poster_path = os.path.join(settings.MEDIA_ROOT, file_directory, poster_directory, file_name) + '.jpg'
-    poster_thumbnail_path = os.path.join(settings.MEDIA_ROOT, file_directory, poster_directory, thumbnail_directory, file_name) + '.jpg'
-    exif_file_path = os.path.join(settings.MEDIA_ROOT, file_directory, 'metadata', file_name) + '.dat'
+    # Assemble the names of the upload and any existing associated files.
+    file_path = file_directory + '/' + file_name + extension
+    thumbnail_path = file_directory + '/' + thumbnail_directory + '/' + file_name + extension
+    poster_path = file_directory + '/' + poster_directory + '/' + file_name + '.jpg'
+    poster_thumbnail_path = file_directory + '/' + poster_directory + '/' + thumbnail_directory + '/' + file_name + '.jpg'
+    # Uploads from before EXIF data was stored in the database may still have it in a separate file, until the import_exif_data command has been run.
+    exif_file_path = file_directory + '/metadata/' + file_name + '.dat'
+    hls_path = file_directory + '/' + hls_directory + '/' + file_name
+    hover_preview_path = file_directory + '/' + hover_preview_directory + '/' + file_name + '.mp4'
 
     # Delete the upload file any associated files.
     remove_file(file_path)
@@ -38,3 +51,182 @@ def delete_upload_files(sender, instance, **kwargs):
     remove_file(poster_path)
     remove_file(poster_thumbnail_path)
     remove_file(exif_file_path)
+    remove_renditions(file_path)
+    remove_renditions(thumbnail_path)
+    remove_renditions(poster_path)
+    remove_renditions(poster_thumbnail_path)
+    remove_directory(hls_path)
+    remove_file(hover_preview_path)
+
+# When an Adoption, Lost, or Found record is deleted, move its upload back to the Pets category. The filter on the category leaves alone an upload which has
+# already been given a different category.
+@receiver(post_delete, sender=Adoption)
+@receiver(post_delete, sender=Lost)
+@receiver(post_delete, sender=Found)
+def reset_upload_category(sender, instance, **kwargs):
+    if instance.upload_id != None:
+        Upload.objects.filter(id=instance.upload_id, category=sender._meta.model_name).update(category='pets', pet_display_data=None)
+
+# The slide page shows the display data stored by update_pet_display_data(), so update it whenever something it's made from changes. When an Adoption, Lost,
+# or Found record is saved, update its own display data, and for an Adoption record, that of the pets bonded with it, which link to it by name.
+@receiver(post_save, sender=Adoption)
+@receiver(post_save, sender=Lost)
+@receiver(post_save, sender=Found)
+def update_pet_display_data_of_record(sender, instance, **kwargs):
+    if instance.upload_id != None:
+        update_pet_display_data(instance)
+    if sender == Adoption and instance.id != None:
+        update_pet_display_data_of_records(instance.bonded_with.all())
+
+# The "bonded with" relation is symmetrical, so a change to it also changes the display data of the pets added or removed. The pets are found before a clear,
+# because they can't be found afterward.
+@receiver(m2m_changed, sender=Adoption.bonded_with.through)
+def update_pet_display_data_of_bonded_pets(sender, instance, action, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance.previously_bonded_with_ids = list(instance.bonded_with.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if action == 'post_clear':
+            pk_set = getattr(instance, 'previously_bonded_with_ids', [])
+        if instance.upload_id != None:
+            update_pet_display_data(instance)
+        update_pet_display_data_of_records(Adoption.objects.filter(id__in=pk_set))
+
+# When an Adoption record is deleted, its links disappear from the pets it was bonded with. Deleting the record deletes the relation without an m2m_changed
+# signal, so the pets are found before it's deleted.
+@receiver(pre_delete, sender=Adoption)
+def find_bonded_pets_before_deletion(sender, instance, **kwargs):
+    instance.previously_bonded_with_ids = list(instance.bonded_with.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Adoption)
+def update_pet_display_data_after_deletion(sender, instance, **kwargs):
+    update_pet_display_data_of_records(Adoption.objects.filter(id__in=getattr(instance, 'previously_bonded_with_ids', [])))
+
+# The City field comes from the uploader's address, so update the display data of the uploader's pets when it changes.
+@receiver(post_save, sender=Address)
+def update_pet_display_data_of_address(sender, instance, **kwargs):
+    for user_contact in UserContact.objects.filter(address=instance):
+        update_pet_display_data_of_uploader(user_contact.account_id)
+
+@receiver(post_save, sender=UserContact)
+def update_pet_display_data_of_user_contact(sender, instance, **kwargs):
+    update_pet_display_data_of_uploader(instance.account_id)
+
+# Input: uploader_id, the ID of a User record. Output: None.
+def update_pet_display_data_of_uploader(uploader_id):
+    if uploader_id == None:
+        return
+    for model in (Adoption, Lost, Found):
+        update_pet_display_data_of_records(model.objects.filter(upload__uploader_id=uploader_id))
+
+# Input: records, a queryset of Adoption, Lost, or Found records. Output: None.
+def update_pet_display_data_of_records(records):
+    for record in records.filter(upload__isnull=False).select_related('upload'):
+        update_pet_display_data(record)
+
+# Keep each upload's comment_count up to date. The updates use F() expressions, so that comments saved at the same time are both counted.
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, **kwargs):
+    if created and instance.upload_id != None:
+        Upload.objects.filter(id=instance.upload_id).update(comment_count=F('comment_count') + 1)
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, **kwargs):
+    if instance.upload_id != None:
+        Upload.objects.filter(id=instance.upload_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+
+# Increment the version stamps of the pages which show a record when it changes, so that their ETags change. See Section 4 of common_view_functions.py.
+@receiver(post_save, sender=Upload)
+@receiver(post_delete, sender=Upload)
+def bump_upload_version_stamps(sender, instance, **kwargs):
+    bump_version_stamps(['galleries', 'uploads', 'upload:' + instance.relative_url])
+
+@receiver(post_save, sender=Metadata)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_version_stamps_of_related_upload(sender, instance, **kwargs):
+    bump_version_stamps(['galleries'] + get_upload_version_stamp_names([instance.upload_id]))
+
+# A like changes the order of the trending galleries, the upload's like count, and the liker's Likes gallery and Like button.
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def bump_like_version_stamps(sender, instance, **kwargs):
+    bump_version_stamps(['galleries', 'user:' + str(instance.liker_id)] + get_upload_version_stamp_names([instance.upload_id]))
+
+@receiver(m2m_changed, sender=Tag.uploads.through)
+def bump_tag_version_stamps(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        if reverse:
+            # The tags of an upload were changed.
+            upload_ids = [instance.id]
+        else:
+            upload_ids = pk_set
+        bump_version_stamps(['galleries'] + get_upload_version_stamp_names(upload_ids))
+
+# Following, muting, and subscribing change what the user sees. Following or muting a user also changes what the other user sees of the relationship.
+@receiver(m2m_changed, sender=UserProfile.following.through)
+@receiver(m2m_changed, sender=UserProfile.muting.through)
+@receiver(m2m_changed, sender=UserProfile.subscribed_tags.through)
+def bump_relationship_version_stamps(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # The instance is a Tag when subscribers are added from the tag's side of the relation.
+        user_ids = [instance.pk] if isinstance(instance, UserProfile) else []
+        if model == UserProfile and pk_set != None:
+            user_ids = user_ids + list(pk_set)
+        bump_version_stamps(['user:' + str(user_id) for user_id in user_ids])
+
+@receiver(post_save, sender=User)
+def bump_user_version_stamp(sender, instance, **kwargs):
+    bump_version_stamps(['user:' + str(instance.id)])
+
+# Keep each tag's upload_count up to date. The relation can be changed from either side: the instance is a Tag and pk_set holds Upload IDs, or when reverse is
+# True, the instance is an Upload and pk_set holds Tag IDs. The tags of an upload are found before a clear, because they can't be found afterward.
+@receiver(m2m_changed, sender=Tag.uploads.through)
+def update_tag_upload_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance.previously_tagged_with_ids = list(instance.tags.values_list('id', flat=True))
+    elif action == 'post_clear':
+        if reverse:
+            Tag.objects.filter(id__in=getattr(instance, 'previously_tagged_with_ids', []), upload_count__gt=0).update(upload_count=F('upload_count') - 1)
+        else:
+            Tag.objects.filter(id=instance.id).update(upload_count=0)
+    elif action in ('post_add', 'post_remove') and len(pk_set) > 0:
+        tags = Tag.objects.filter(id__in=pk_set) if reverse else Tag.objects.filter(id=instance.id)
+        if action == 'post_add':
+            tags.update(upload_count=F('upload_count') + (1 if reverse else len(pk_set)))
+        else:
+            tags.filter(upload_count__gt=0).update(upload_count=F('upload_count') - (1 if reverse else len(pk_set)))
+
+# Deleting an upload removes it from its tags without an m2m_changed signal.
+@receiver(pre_delete, sender=Upload)
+def decrement_tag_upload_counts(sender, instance, **kwargs):
+    Tag.objects.filter(uploads=instance, upload_count__gt=0).update(upload_count=F('upload_count') - 1)
+
+# Invalidate the cached values derived from a relation or model when it changes, in every worker process. See model_cache.py and invalidation_bus.py. The
+# ranking of the popular tags is refreshed periodically instead of after each change to their upload counts, but a deleted tag is removed from it at once.
+@receiver(post_delete, sender=Tag)
+def invalidate_popular_tags(sender, **kwargs):
+    invalidation_bus.publish('popular_tags')
+
+@receiver(m2m_changed, sender=UserProfile.subscribed_tags.through)
+def invalidate_tag_subscribers(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidation_bus.publish('tag_subscribers')
+
+@receiver(m2m_changed, sender=UserProfile.following.through)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_followers(sender, **kwargs):
+    # Only the m2m_changed signal has an action, and it's sent both before and after the change.
+    if kwargs.get('action') in (None, 'post_add', 'post_remove', 'post_clear'):
+        invalidation_bus.publish('followers')
+
+@receiver(post_save, sender=UserContact)
+@receiver(post_delete, sender=UserContact)
+@receiver(post_save, sender=Shelter)
+@receiver(post_delete, sender=Shelter)
+def invalidate_contact_information(sender, **kwargs):
+    invalidation_bus.publish('contact_information')
+
+# Input: upload_ids, a collection of Upload IDs. Output: A list of the version stamp names of their slide pages.
+def get_upload_version_stamp_names(upload_ids):
+    relative_urls = Upload.objects.filter(id__in=[upload_id for upload_id in upload_ids if upload_id != None]).values_list('relative_url', flat=True)
+    return ['upload:' + relative_url for relative_url in relative_urls]
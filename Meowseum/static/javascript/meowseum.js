@@ -16,10 +16,68 @@ $(document).ready(function() {
         });
     };
     
+    // 1.1.2.1. Input: A number of seconds. Output: A string like "About 2 minutes left".
+    var formatTimeRemaining = function(seconds) {
+        if (seconds < 60) {
+            return "Less than a minute left";
+        }
+        var minutes = Math.round(seconds / 60);
+        if (minutes == 1) {
+            return "About 1 minute left";
+        }
+        return "About " + minutes + " minutes left";
+    };
+
+    // 1.1.2. Show the stage of processing, the percentage, and the time remaining from the server's response. Before the server has received the file and after it has
+    // finished processing, the stage is empty, so the last message stays up.
+    var showProcessingProgress = function($progress, response) {
+        if (response.stage == "") {
+            return;
+        }
+        var stageText = response.stage + "...";
+        if (response.percent > 0) {
+            stageText += " " + response.percent + "%";
+        }
+        $(".processing-stage", $progress).text(stageText);
+        $(".progress-bar", $progress).css("width", response.percent + "%");
+        if (response.seconds_remaining == null) {
+            $(".processing-time-remaining", $progress).text("");
+        }
+        else {
+            $(".processing-time-remaining", $progress).text(formatTimeRemaining(response.seconds_remaining));
+        }
+    };
+
+    // 1.1.1. Give the form a random progress key, then poll the server once a second for the progress of processing the file. This lets the user see that a long video
+    // is still being processed, instead of uploading it again. Polling stops when the server's response replaces the form in the modal.
+    var pollProcessingProgress = function(form) {
+        var characters = "abcdefghijklmnopqrstuvwxyz0123456789";
+        var progressKey = "";
+        for (var i = 0; i < 32; i++) {
+            progressKey += characters.charAt(Math.floor(Math.random() * characters.length));
+        }
+        $('input[name="progress_key"]', form).val(progressKey);
+        var $progress = $(".processing-progress", form);
+        var url = $progress.data("progress-url").replace("progress_key", progressKey);
+        $progress.removeClass("hidden");
+        var poll = function() {
+            if (!$.contains(document.documentElement, form)) {
+                return;
+            }
+            $.ajax({url: url, dataType: "json", cache: false}).done(function(response) {
+                showProcessingProgress($progress, response);
+            }).always(function() {
+                setTimeout(poll, 1000);
+            });
+        };
+        setTimeout(poll, 1000);
+    };
+
     // 1.1. When the user picks a file and presses OK, submit the form.
     var submitUploadOnFilePick = function() {
         // The modal content is dynamic, so the event is attached to the .modal as the closest static ancestor of the file button.
         $('#upload-menu').on("change", 'input[type="file"]', function() {
+            pollProcessingProgress(this.form);
             // The element needs to be wrapped a jQuery set in order for AJAX to be able to prevent the submit event and do its own handling of form submission.
             $(this.form).submit();
         });
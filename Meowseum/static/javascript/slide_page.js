@@ -69,7 +69,7 @@ $(document).ready(function() {
             viewportWidth = $(window).width();
             viewportHeight = $(window).height();
             if (viewportWidth < viewportHeight) {
-                $("#slide-overflow-mobile > img").css({"width":"auto","height":"100vh"});
+                $("#slide-overflow-mobile img").css({"width":"auto","height":"100vh"});
                 if (settings.layout["nightModeIsOn"]) {
                     $("#landscape-order-switcher a.close").css({"opacity":0.2,"color":"black"});
                     $("#landscape-order-switcher a.close:hover, #landscape-order-switcher a.close:hover, #landscape-order-switcher a.close:active").css({"opacity":0.5,"color":"black"});                  
@@ -77,7 +77,7 @@ $(document).ready(function() {
                 swipeOnSides();
             }
             else {
-                $("#slide-overflow-mobile > img").css({"height":"auto","width":"100vw"});
+                $("#slide-overflow-mobile img").css({"height":"auto","width":"100vw"});
                 // If the image is a panorama, it stops being horizontally scrollable when you zoom in, so the swipe-anywhere interface is now appropriate.
                 // Otherwise, the device should already be using the swipe-anywhere interface.
                 if (isPanorama) {
@@ -109,7 +109,7 @@ $(document).ready(function() {
             viewportWidth = $(window).width();
             viewportHeight = $(window).height();
             if (viewportWidth < viewportHeight) {
-                $("#slide-overflow-mobile > img").css({"width":"100vw","height":"auto"});
+                $("#slide-overflow-mobile img").css({"width":"100vw","height":"auto"});
                 $("#landscape-order-switcher").css({"display":"block","border-bottom":"none"});
                 if (settings.layout["nightModeIsOn"]) {
                     $("#landscape-order-switcher a.close, #landscape-order-switcher a.close:hover, #landscape-order-switcher a.close:hover, #landscape-order-switcher a.close:active").css({"opacity":1,"color":"rgb(240,240,240)"});                    
@@ -117,7 +117,7 @@ $(document).ready(function() {
                 swipeAnywhere();
             }
             else {
-                $("#slide-overflow-mobile > img").css({"height":"100vh","width":"auto"});
+                $("#slide-overflow-mobile img").css({"height":"100vh","width":"auto"});
                 if (isPanorama) {
                     swipeOnSides();
                 }
@@ -126,7 +126,7 @@ $(document).ready(function() {
         };
         // 2.1 Toggle the zooming through some gesture. Currently the gesture is tapping the screen. This should be replaced later, because it would be accidentally triggered when users
         // swipe left or right to navigate between pages.
-        $("#slide-overflow-mobile > img, #slide-overflow-mobile > video").on("click", function() {
+        $("#slide-overflow-mobile img, #slide-overflow-mobile > video").on("click", function() {
             if (zoomedIn) {
                 zoomOut();
             }
@@ -138,7 +138,7 @@ $(document).ready(function() {
         $(window).on("orientationchange",function(e) {
             // The orientation changed from landscape to portrait while the user may have had the image zoomed in.
             if (e.orientation == "portrait") {
-                $("#slide-overflow-mobile > img").css({"width":"100vw","height":"auto"});
+                $("#slide-overflow-mobile img").css({"width":"100vw","height":"auto"});
                 $("#landscape-order-switcher").css({"display":"block","border-bottom":"none"});
                 if (settings.layout["nightModeIsOn"]) {
                     $("#landscape-order-switcher a.close, #landscape-order-switcher a.close:hover, #landscape-order-switcher a.close:hover, #landscape-order-switcher a.close:active").css({"opacity":1,"color":"rgb(240,240,240)"});                    
@@ -147,7 +147,7 @@ $(document).ready(function() {
             }
             // The orientation changed from portrait to landscape while the user may have had the image zoomed in.
             else {
-                $("#slide-overflow-mobile > img").css({"height":"100vh","width":"auto"});
+                $("#slide-overflow-mobile img").css({"height":"100vh","width":"auto"});
                 $("#slide-overflow-mobile").css({"overflow-x":"auto"});
                 $("#landscape-order-switcher").css({"display":"flex","flex-wrap":"wrap"});
                 $("#landscape-order-switcher > img, #landscape-order-switcher > video").css({"order":"1"});
@@ -454,12 +454,41 @@ $(document).ready(function() {
         });
     };
     
+    // 6.5 Load the next chunk of comments when the user clicks "Load more comments". The button holds the ID of the last comment loaded. A comment which the user
+    // posted after the page loaded is already on the page, so it's skipped. The delete buttons of the new comments are set up like the ones loaded with the page.
+    var prepareLoadMoreCommentsButton = function() {
+        $("#comments").on("click", "#load-more-comments button", function() {
+            var $button = $(this);
+            $button.prop("disabled", true);
+            $.get($button.data("ajax-url"), {"after": $button.data("after")}, function(response) {
+                var $newComments = $($.parseHTML(response.HTML_snippet)).filter(".comment").filter(function() {
+                    return $('#posted-comments .comment[data-comment-id="' + $(this).data("comment-id") + '"]').length == 0;
+                });
+                $("#load-more-comments").before($newComments);
+                $newComments.filter(".ajax-form").submit(function(e) {
+                    e.preventDefault();
+                    ajax.post($(this).attr("action"), $(this).serialize(), ajax.manipulateDOM);
+                });
+                if (response.after == null) {
+                    $("#load-more-comments").remove();
+                }
+                else {
+                    $button.data("after", response.after);
+                    $button.prop("disabled", false);
+                }
+            }).fail(function() {
+                $button.prop("disabled", false);
+            });
+        });
+    };
+    
     // 6. Make the buttons do things.
     var prepareButtons = function(viewportWidth) {
         prepareMainSections(viewportWidth);
         prepareTagsSection(viewportWidth);
         prepareLikeButton();
         prepareLinkCopying();
+        prepareLoadMoreCommentsButton();
     };
     
     // 7. This is a CSS layout function. On landscape smartphones and tablets, the pet profile will be presented using two columns with 20px of space between. All other viewports use one column.
@@ -551,8 +580,8 @@ $(document).ready(function() {
             else {
                 var viewportAspectRatio = viewportHeight / viewportWidth;
             }
-            var imageWidth = $("#slide-overflow-mobile > img").width();
-            var imageHeight = $("#slide-overflow-mobile > img").height();
+            var imageWidth = $("#slide-overflow-mobile img").width();
+            var imageHeight = $("#slide-overflow-mobile img").height();
             var imageAspectRatio = imageWidth / imageHeight;
             if (imageAspectRatio > viewportAspectRatio) {
                 // The image is classified as a panorama if its aspect ratio is greater than that of the device in landscape mode.
@@ -578,14 +607,14 @@ $(document).ready(function() {
     else {
         // Obtain information about the slide from the DOM. The script will pass these variables as arguments to functions which determine whether and how to shrink or enlarge the slide.
         // Find the natural dimensions of the slide (in CSS pixels) and determine whether it is an image or video.
-        if ($("#slide-container > img")[0]) {
+        if ($("#slide-container img")[0]) {
             // Wait until the image is loaded so its dimensions can be accessed.
-            $("#slide-container > img").loadImage(function() {
+            $("#slide-container img").loadImage(function() {
                 var slideWidth = this.naturalWidth;
                 var slideHeight = this.naturalHeight;
                 // Process the slide arguments and alter the slide's dimensions as needed.
-                optimizeDesktopSlide(slideWidth, slideHeight, "#slide-container > img");
-                fullMode(slideWidth, slideHeight, "#slide-container > img");
+                optimizeDesktopSlide(slideWidth, slideHeight, "#slide-container img");
+                fullMode(slideWidth, slideHeight, "#slide-container img");
             });
         }
         else {
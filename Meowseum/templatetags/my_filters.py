@@ -3,6 +3,7 @@
 from django import template
 from django.template import Library
 from django.template.defaultfilters import date
+from django.conf import settings
 from django.contrib.humanize.templatetags.humanize import naturaltime, naturalday
 from datetime import timedelta, datetime
 # These are for overriding linebreaks_filter.
@@ -76,6 +77,21 @@ def attribute(structure, value):
         # The data structure is an object.
         return eval("structure."+value)
 
+@register.filter(name='rendition_extension')
+# Return the extension of a rendition's MIME type, such as '.webp' for 'image/webp'. This is used to build the srcset of each <source> within a <picture>.
+def rendition_extension(mime_type):
+    return settings.RENDITION_TYPES_AND_PREFERRED_EXTENSIONS[mime_type]
+
+@register.filter(name='poster_extension')
+# A <video> poster can't have <picture> fallbacks, so choose its format on the server. Return the extension of the most preferred rendition of the poster
+# which the browser accepts, or '.jpg' for the original poster.
+# Input: value, a Metadata record. accepted_image_types, the list of MIME types from the settings_variables context processor.
+def poster_extension(value, accepted_image_types):
+    for mime_type in value.rendition_types:
+        if mime_type in accepted_image_types:
+            return settings.RENDITION_TYPES_AND_PREFERRED_EXTENSIONS[mime_type]
+    return '.jpg'
+
 # I added functions for arithmetic operations in order to be able to calculate the total iteration of a nested for loop, so that it wouldn't go beyond the length of a list.
 # The add filter is the only one that is built-in.
 @register.filter(name='mul')
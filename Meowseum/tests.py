@@ -0,0 +1,200 @@
+# Description: Tests for the site. Run them with "python manage.py test Meowseum" on a PostgreSQL database, which Django creates for the tests and deletes
+# afterward. While the tests run, settings.QUERY_COUNTING['ENFORCE_BUDGETS'] is True, the caches are local memory caches, and invalidation events only reach the
+# test process.
+
+from django.test import TestCase, SimpleTestCase, RequestFactory, override_settings
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.db import connections, DEFAULT_DB_ALIAS
+from io import StringIO
+from unittest import mock, skipIf
+import datetime
+import os
+import tempfile
+from urllib.parse import urlparse, parse_qs
+from Meowseum.models import Upload, Metadata, Tag, Comment, UserProfile, Lost
+from Meowseum.middleware.query_counting_middleware import QueryCountingMiddleware, QueryBudgetExceeded
+from Meowseum.views import slide_page, gallery
+from Meowseum.file_handling.media_storage import S3MediaStorage
+try:
+    # moto stands in for Amazon S3 within the test process. It's optional, and the tests of the 's3' media storage backend are skipped without it. moto 5
+    # replaced mock_s3 with mock_aws.
+    from moto import mock_s3
+except ImportError:
+    try:
+        from moto import mock_aws as mock_s3
+    except ImportError:
+        mock_s3 = None
+
+# 1. The most frequent lookups have to use an index. See management/commands/check_query_plans.py, which these tests run with fewer records than its defaults,
+# but enough that the planner prefers an index for a selective lookup.
+class QueryPlanTests(TestCase):
+    def test_frequent_lookups_use_indexes(self):
+        output = StringIO()
+        try:
+            call_command('check_query_plans', uploads=20000, users=1000, likes=50000, tags=2000, stdout=output)
+        except CommandError as e:
+            self.fail(str(e) + "\n" + output.getvalue())
+
+# 2. Each view with a query budget has to stay within it. QueryCountingMiddleware raises QueryBudgetExceeded from a view which makes more queries than its
+# budget, and the test client raises it again in the test. The full-page cache is turned off, so that each request renders the page.
+@override_settings(QUERY_COUNTING=dict(settings.QUERY_COUNTING, ENFORCE_BUDGETS=True), ANONYMOUS_PAGE_CACHE=dict(settings.ANONYMOUS_PAGE_CACHE, ENABLED=False))
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # An uploader with a typical upload: a few tags, and comments from several users.
+        cls.uploader = create_user('budget_uploader')
+        cls.commenters = [create_user('budget_commenter_' + str(i)) for i in range(5)]
+        cls.uploads = [create_upload(cls.uploader, 'budget_upload_' + str(i)) for i in range(30)]
+        cls.upload = cls.uploads[0]
+        for tag_name in ('tabby', 'kitten', 'sleeping'):
+            Tag.objects.create(name=tag_name).uploads.add(*cls.uploads)
+        for commenter in cls.commenters:
+            Comment.objects.create(upload=cls.upload, commenter=commenter, text="What a cat!")
+
+    # 2.1. The budgeted views are within their budgets, logged out and logged in.
+    def test_slide_page_is_within_budget(self):
+        self.assertEqual(self.client.get(reverse('slide_page', args=[self.upload.relative_url])).status_code, 200)
+        self.client.force_login(self.commenters[0])
+        self.assertEqual(self.client.get(reverse('slide_page', args=[self.upload.relative_url])).status_code, 200)
+
+    def test_galleries_are_within_budget(self):
+        gallery_urls = [reverse('index'), reverse('most_popular'), reverse('new_submissions'), reverse('tag_gallery', args=['tabby']),
+                        reverse('category_gallery', args=['pets'])]
+        for url in gallery_urls:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        self.client.force_login(self.commenters[0])
+        for url in gallery_urls:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    # 2.2. A view which makes more queries than its budget fails.
+    def test_slide_page_over_budget_fails(self):
+        with mock.patch.object(slide_page.page, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('slide_page', args=[self.upload.relative_url]))
+
+    def test_gallery_over_budget_fails(self):
+        with mock.patch.object(gallery.new_submissions, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('new_submissions'))
+
+    # 2.3. The budget is only enforced when ENFORCE_BUDGETS is True, as it is while running tests.
+    def test_budget_is_not_enforced_when_disabled(self):
+        with self.settings(QUERY_COUNTING=dict(settings.QUERY_COUNTING, ENFORCE_BUDGETS=False)):
+            with mock.patch.object(gallery.new_submissions, 'query_budget', 1):
+                self.assertEqual(self.client.get(reverse('new_submissions')).status_code, 200)
+
+    # 2.4. The queries are counted by wrapping the connection's cursors, and the wrapper is removed when the view raises an exception.
+    def test_counting_stops_after_an_exception(self):
+        middleware = QueryCountingMiddleware()
+        request = RequestFactory().get(reverse('new_submissions'))
+        middleware.process_request(request)
+        self.assertIn('make_cursor', connections[DEFAULT_DB_ALIAS].__dict__)
+        middleware.process_exception(request, ValueError())
+        self.assertNotIn('make_cursor', connections[DEFAULT_DB_ALIAS].__dict__)
+
+# 3. The slide page of an upload in the Lost, Found, or Adoption category shows the merged fields of its record, which are stored in pet_display_data.
+@override_settings(ANONYMOUS_PAGE_CACHE=dict(settings.ANONYMOUS_PAGE_CACHE, ENABLED=False))
+class PetDisplayDataTests(TestCase):
+    def setUp(self):
+        self.upload = create_upload(create_user('pet_uploader'), 'lost_cat')
+        Upload.objects.filter(id=self.upload.id).update(category='lost')
+        Lost.objects.create(upload=self.upload, pet_name="Whiskers", sex='male', date=datetime.date(2017, 3, 1), yes_or_no_questions=['spayed or neutered'],
+                            other_physical=[], disabilities=[], public_contact_information=[], nose_color=[])
+
+    # 3.1. Saving the record stores its display data, and the slide page shows it.
+    def test_slide_page_shows_stored_display_data(self):
+        self.assertEqual(Upload.objects.get(id=self.upload.id).pet_display_data['merged_fields'][0], ['Name', 'Whiskers'])
+        response = self.client.get(reverse('slide_page', args=[self.upload.relative_url]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Whiskers')
+        self.assertContains(response, 'Male, neutered')
+        self.assertEqual(response.context['pet_date'], datetime.date(2017, 3, 1))
+
+    # 3.2. An upload from before the display data was stored has it computed when its slide page is viewed.
+    def test_slide_page_computes_missing_display_data(self):
+        Upload.objects.filter(id=self.upload.id).update(pet_display_data=None)
+        response = self.client.get(reverse('slide_page', args=[self.upload.relative_url]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Whiskers')
+        self.assertNotEqual(Upload.objects.get(id=self.upload.id).pet_display_data, None)
+
+# 4. The 's3' media storage backend, against moto's stand-in for S3. The storage has a prefix, so that the tests also check that it's added to each key and
+# removed from each name.
+S3_TEST_OPTIONS = {'BACKEND': 's3', 'BUCKET_NAME': 'meowseum-test', 'PREFIX': 'media/', 'ENDPOINT_URL': None, 'REGION_NAME': 'us-east-1',
+                   'ACCESS_KEY_ID': 'testing', 'SECRET_ACCESS_KEY': 'testing', 'PRESIGNED_URLS': True, 'URL_EXPIRATION': 600, 'PUBLIC_URL': '',
+                   'CACHE_CONTROL': 'max-age=86400', 'MULTIPART_THRESHOLD': 8388608, 'MULTIPART_CHUNKSIZE': 8388608, 'MAX_CONCURRENCY': 4}
+
+@skipIf(mock_s3 == None, "moto isn't installed.")
+class S3MediaStorageTests(SimpleTestCase):
+    def setUp(self):
+        s3_mock = mock_s3()
+        s3_mock.start()
+        self.addCleanup(s3_mock.stop)
+        self.storage = S3MediaStorage(S3_TEST_OPTIONS)
+        self.storage.client.create_bucket(Bucket=S3_TEST_OPTIONS['BUCKET_NAME'])
+
+    # 4.1. save_file() uploads the file with its content type and cache lifetime, and removes the local copy.
+    def test_save_file(self):
+        local_path = create_local_file(b'cat picture')
+        self.storage.save_file(local_path, 'uploads/cat.jpg')
+        self.assertFalse(os.path.exists(local_path))
+        self.assertTrue(self.storage.exists('uploads/cat.jpg'))
+        self.assertEqual(self.storage.read('uploads/cat.jpg'), b'cat picture')
+        head = self.storage.client.head_object(Bucket=S3_TEST_OPTIONS['BUCKET_NAME'], Key='media/uploads/cat.jpg')
+        self.assertEqual(head['ContentType'], 'image/jpeg')
+        self.assertEqual(head['CacheControl'], 'max-age=86400')
+
+    # 4.2. url() returns a link which is signed to expire after URL_EXPIRATION seconds, or the public URL when PRESIGNED_URLS is False.
+    def test_presigned_url(self):
+        url = urlparse(self.storage.url('uploads/cat.jpg'))
+        query = parse_qs(url.query)
+        self.assertTrue(url.path.endswith('/media/uploads/cat.jpg'))
+        self.assertEqual(query['X-Amz-Expires'], ['600'])
+        self.assertIn('X-Amz-Signature', query)
+
+    def test_public_url(self):
+        storage = S3MediaStorage(dict(S3_TEST_OPTIONS, PRESIGNED_URLS=False, PUBLIC_URL='https://media.example.com/'))
+        self.assertEqual(storage.url('uploads/a cat.jpg'), 'https://media.example.com/media/uploads/a%20cat.jpg')
+
+    # 4.3. list_files() returns each file under a directory, across pages of results, and delete_files() deletes them in batches of 1000, the most that
+    # delete_objects accepts.
+    def test_list_and_delete_files_in_batches(self):
+        names = ['uploads/thumbnails/cat' + str(i) + '.jpg' for i in range(1005)]
+        for name in names:
+            self.storage.client.put_object(Bucket=S3_TEST_OPTIONS['BUCKET_NAME'], Key=self.storage.key(name), Body=b'1234')
+        self.storage.client.put_object(Bucket=S3_TEST_OPTIONS['BUCKET_NAME'], Key=self.storage.key('uploads/other.jpg'), Body=b'1234')
+        files = self.storage.list_files('uploads/thumbnails')
+        self.assertEqual(sorted([name for name, size, modified_time in files]), sorted(names))
+        self.assertTrue(all([size == 4 for name, size, modified_time in files]))
+        with mock.patch.object(self.storage.client, 'delete_objects', wraps=self.storage.client.delete_objects) as delete_objects:
+            self.storage.delete_files(names)
+        self.assertEqual(delete_objects.call_count, 2)
+        self.assertEqual(self.storage.list_files('uploads/thumbnails'), [])
+        self.assertTrue(self.storage.exists('uploads/other.jpg'))
+
+# Helper functions.
+
+# Input: username. Output: A User record with a UserProfile, like the signup page creates.
+def create_user(username):
+    user = User.objects.create_user(username, username + '@example.com', 'password')
+    UserProfile.objects.create(user_auth=user)
+    return user
+
+# Input: uploader, a User record, relative_url. Output: A public Upload record of a JPEG image, with its Metadata record. No file is saved.
+def create_upload(uploader, relative_url):
+    upload = Upload.objects.create(file=Upload.UPLOAD_TO + '/' + relative_url + '.jpg', uploader=uploader, title=relative_url, relative_url=relative_url,
+                                   is_publicly_listed=True)
+    Metadata.objects.create(upload=upload, file_name=relative_url, extension='.jpg', original_file_name=relative_url, original_extension='.jpg',
+                            mime_type='image/jpeg', width=640, height=480, file_size=50000)
+    return upload
+
+# Input: content, bytes. Output: The path of a new temporary file with the content.
+def create_local_file(content):
+    file_descriptor, local_path = tempfile.mkstemp()
+    with os.fdopen(file_descriptor, 'wb') as local_file:
+        local_file.write(content)
+    return local_path
@@ -19,6 +19,10 @@ urlpatterns = [
     url(r'^about_us/$', about_us.page, name="about_us"),
     url(r'^advanced_search/$', advanced_search.page, name="advanced_search"),
     url(r'^from_device/$', from_device.page, name="from_device"),
+    url(r'^from_device/batch/$', batch_upload.page, name="batch_upload"),
+    url(r'^from_device/resumable/$', resumable_upload.create, name="resumable_uploads"),
+    url(r'^from_device/resumable/(?P<upload_key>\w+)/$', resumable_upload.page, name="resumable_upload"),
+    url(r'^from_device/progress/(?P<progress_key>\w+)/$', processing_progress.page, name="processing_progress"),
     url(r'^upload_page1/$', upload_page1.page, name="upload_page1"),
     url(r'^user_contact_information/$', user_contact_information.page, name="user_contact_information"),
     url(r'^shelter_contact_information/$', shelter_contact_information.page, name="shelter_contact_information"),
@@ -31,6 +35,7 @@ urlpatterns = [
     url(r'^slide/(?P<relative_url>.+)/like$', like.page, name="like"),
     url(r'^slide/(?P<relative_url>.+)/add_tag$', add_tag.page, name="add_tag"),
     url(r'^slide/(?P<relative_url>.+)/add_comment$', add_comment.page, name="add_comment"),
+    url(r'^slide/(?P<relative_url>.+)/comments$', load_comments.page, name="load_comments"),
     url(r'^delete_comment/(?P<comment_id>.+)/$', delete_comment.page, name="delete_comment"),
     url(r'^user/(?P<username>.+)/follow$', follow.page, name="follow"),
     url(r'^user/(?P<username>.+)/mute$', mute.page, name="mute"),
@@ -49,6 +54,7 @@ urlpatterns = [
     url(r'^new_submissions/$', gallery.new_submissions, name="new_submissions"),
     url(r'^most_popular/$', gallery.most_popular, name="most_popular"),
     url(r'^tag/(?P<tag_name>.+)/$', gallery.tag_gallery, name="tag_gallery"),
+    url(r'^category/(?P<category>pets|adoption|lost|found)/$', gallery.category_gallery, name="category_gallery"),
     url(r'^tag/(?P<tag_name>.+)/subscribe$', subscribe.page, name="subscribe"),
     url(r'^subscribed_tags/$', gallery.subscribed_tags, name="subscribed_tags"),
     url(r'^search/$', search.page, name="search"),
@@ -59,4 +65,10 @@ urlpatterns = [
     url(r'^shelter_search/$', shelter_search.page, name="shelter_search"),
     url(r'^toggle_mobile_play_button/$', toggle_mobile_play_button.page, name="toggle_mobile_play_button"),
     url(r'^toggle_night_mode/$', toggle_night_mode.page, name="toggle_night_mode"),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.MEDIA_STORAGE['BACKEND'] == 's3' and settings.MEDIA_STORAGE['PRESIGNED_URLS']:
+    # Media is kept in a private bucket, so redirect requests for media to presigned URLs.
+    urlpatterns += [url(r'^' + settings.MEDIA_URL.lstrip('/') + r'(?P<name>.+)$', media_file.page, name="media_file")]
+else:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -66,8 +66,8 @@ def get_successful_submission_response(request, comment):
     else:
         new_comment_section_HTML = render(request, 'en/public/slide_page_comment_without_delete_comment_button.html', {'comment': comment})
     new_comment_section_HTML = mark_safe(new_comment_section_HTML.content.decode('utf-8'))
-    comments_from_unmuted_users = get_comments_from_unmuted_users(request, comment.upload)
-    if comments_from_unmuted_users.count() == 1:
+    # comment_count was read before the comment was saved. The other comments are only checked if they could all be from muted users.
+    if comment.upload.comment_count == 0 or not get_comments_from_unmuted_users(request, comment.upload).exclude(id=comment.id).exists():
         new_comment_section_HTML = '<div id="posted-comments">' + new_comment_section_HTML + '</div>'
         response_data[1]['selector'] = '#comments > form'
     else:
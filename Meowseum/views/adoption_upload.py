@@ -2,20 +2,15 @@
 
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
-from Meowseum.common_view_functions import redirect
-from django.core.exceptions import PermissionDenied
-from Meowseum.models import Upload, Adoption
+from Meowseum.common_view_functions import redirect, get_upload_being_submitted
+from Meowseum.models import Adoption
 from Meowseum.forms import AdoptionForm
 
 @login_required
 # 0. Main function.
 def page(request):
-    # Obtain the logged-in user's most recent file submission.
-    try:
-        upload = Upload.objects.filter(uploader=request.user).order_by("-id")[0]
-    except IndexError:
-        # If the user hasn't submitted a file yet, then the user shouldn't be here.
-        raise PermissionDenied
+    # Obtain the logged-in user's most recent file submission, or the upload named in the querystring by the links after a batch upload.
+    upload = get_upload_being_submitted(request)
     # Define the heading that will be used in the form's header.
     heading = "Uploading "+ upload.metadata.original_file_name + upload.metadata.original_extension
     
@@ -24,6 +19,8 @@ def page(request):
         new_adoption_record = main_form.save(commit=False)
         new_adoption_record.upload = upload
         new_adoption_record.save()
+        upload.category = 'adoption'
+        upload.save(update_fields=['category'])
         add_bonded_with_information(new_adoption_record, main_form.cleaned_data["bonded_with_IDs"])
         return redirect('index')
     else:
@@ -0,0 +1,110 @@
+# Description: This form is for uploading many files from your PC or mobile device at once, like a shelter posting photos of each of its adoptable pets. Each file
+# goes through the same validation and processing as a file uploaded with the from_device form. The files are validated one at a time, in the order they were
+# sent, and each valid file is handed to a pool of 'batch_workers' threads to be processed, so that the next file is validated while the previous ones are
+# processed. The response lists the outcome for each file, with links for adding a title and tags to each new upload or listing it for adoption.
+# Files with the same content are found by their content hash, because they're all validated before the first of them is saved as an upload. A repeated file
+# is reported as a duplicate of the first, unless duplicates are allowed. Then it's processed in a later round, after the pool has finished with the first,
+# so that two threads never write the same file, which content-addressed storage would give them the same name for.
+
+from django.shortcuts import render
+from django.db import connection
+from django.utils.datastructures import MultiValueDict
+from concurrent.futures import ThreadPoolExecutor
+from Meowseum.common_view_functions import ajaxWholePageRedirect
+from Meowseum.models import validation_specifications_for_Upload, hosting_limits_for_Upload
+from Meowseum.file_handling.file_validation import get_validated_metadata
+from Meowseum.file_handling.stage2_processing import ProcessingLimitError
+from Meowseum.file_handling.duplicate_index import find_duplicate_upload
+from Meowseum.forms import FromDeviceForm
+from Meowseum.views.from_device import create_temporary_upload_record, create_new_upload_record, create_metadata_record
+from Meowseum.middleware.exception_logging_middleware import ExceptionLoggingMiddleware
+
+# 0. Main function
+def page(request):
+    if request.user.is_authenticated:
+        uploaded_files = request.FILES.getlist('files')
+        max_batch_files = validation_specifications_for_Upload['max_batch_files']
+        results = []
+        # The files to process in each round, as (result, form, metadata) tuples. The nth copy of a file is processed in round n.
+        rounds = [[]]
+        # The results of the files in the batch so far, by content hash.
+        results_by_content_hash = {}
+        # The (result, first_result) pairs of the files which repeat an earlier file of the batch and weren't allowed.
+        batch_duplicates = []
+        with ThreadPoolExecutor(max_workers=hosting_limits_for_Upload['batch_workers']) as executor:
+            futures = []
+            for uploaded_file in uploaded_files[:max_batch_files]:
+                result, form, metadata = validate_batch_file(uploaded_file, request)
+                results = results + [result]
+                if result['status'] != 'processing':
+                    continue
+                earlier_results = results_by_content_hash.setdefault(metadata.get('content_hash', ''), [])
+                if len(earlier_results) > 0 and metadata.get('content_hash', '') != '':
+                    if not form.cleaned_data['allow_duplicate']:
+                        result['status'] = 'duplicate'
+                        result['message'] = "This file is the same as " + earlier_results[0]['name'] + ", earlier in this batch."
+                        batch_duplicates = batch_duplicates + [(result, earlier_results[0])]
+                        continue
+                    if len(rounds) <= len(earlier_results):
+                        rounds = rounds + [[]]
+                    rounds[len(earlier_results)] = rounds[len(earlier_results)] + [(result, form, metadata)]
+                else:
+                    futures = futures + [(result, executor.submit(process_batch_file, form, metadata, request))]
+                earlier_results.append(result)
+            # The first round is processed while the files are validated, and each later round after the one before it has finished.
+            for result, future in futures:
+                result.update(future.result())
+            for later_round in rounds[1:]:
+                futures = [(result, executor.submit(process_batch_file, form, metadata, request)) for result, form, metadata in later_round]
+                for result, future in futures:
+                    result.update(future.result())
+        for result, first_result in batch_duplicates:
+            result['upload'] = first_result['upload']
+        for uploaded_file in uploaded_files[max_batch_files:]:
+            results = results + [{'name': uploaded_file.name, 'status': 'skipped', 'upload': None,
+                                  'message': "Only " + str(max_batch_files) + " files can be uploaded at once."}]
+        return render(request, 'en/public/batch_upload_results.html', {'results': results})
+    else:
+        return ajaxWholePageRedirect(request, 'login')
+
+# 1. Validate one file of the batch with the from_device form, and check whether it was already uploaded.
+# Input: uploaded_file, request.
+# Output: result, a dictionary with the keys 'name', 'status', 'message', and 'upload'. form, the bound FromDeviceForm. metadata, the metadata dictionary.
+def validate_batch_file(uploaded_file, request):
+    result = {'name': uploaded_file.name, 'status': 'processing', 'message': '', 'upload': None}
+    # The progress key is left out, because the upload modal only shows the progress of a single file.
+    form = FromDeviceForm({'allow_duplicate': request.POST.get('allow_duplicate', '')}, MultiValueDict({'file': [uploaded_file]}))
+    metadata, form = get_validated_metadata('file', form, form.files, validation_specifications_for_Upload)
+    if not form.is_valid():
+        result['status'] = 'invalid'
+        result['message'] = ' '.join([' '.join(errors) for errors in form.errors.values()])
+        return result, form, metadata
+    duplicate_upload, is_exact_duplicate = find_duplicate_upload(metadata, validation_specifications_for_Upload['duplicate_distance'], request.user)
+    if duplicate_upload != None and not form.cleaned_data['allow_duplicate']:
+        result['status'] = 'duplicate'
+        result['upload'] = duplicate_upload
+        if is_exact_duplicate:
+            result['message'] = "This file has already been uploaded."
+        else:
+            result['message'] = "A very similar file has already been uploaded."
+        return result, form, metadata
+    metadata['duplicate_of'] = duplicate_upload
+    return result, form, metadata
+
+# 2. This function runs within a worker thread. Process a validated file and create its Upload and Metadata records, the same way as the from_device view.
+# Output: A dictionary with the keys of the result to update.
+def process_batch_file(form, metadata, request):
+    try:
+        temporary_upload, metadata = create_temporary_upload_record(form, metadata, request.user)
+        new_upload, metadata = create_new_upload_record(temporary_upload, metadata, request)
+        create_metadata_record(new_upload, metadata)
+        return {'status': 'uploaded', 'upload': new_upload}
+    except ProcessingLimitError:
+        return {'status': 'too demanding', 'message': "The server wasn't able to process this file within its memory and time limits. Try uploading a shorter or lower resolution version."}
+    except Exception as e:
+        # One file's failure shouldn't lose the rest of the batch, so record the exception the way the middleware would and continue.
+        ExceptionLoggingMiddleware().process_exception(request, e)
+        return {'status': 'error', 'message': "An error occurred while processing this file."}
+    finally:
+        # Each thread opens its own database connection, which Django only closes automatically for the thread handling the request.
+        connection.close()
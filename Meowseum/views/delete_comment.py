@@ -41,7 +41,7 @@ def get_server_response(request, comment_id, upload):
     comments_from_unmuted_users = get_comments_from_unmuted_users(request, upload)
     response_data = [{}]
     
-    if comments_from_unmuted_users.count() > 0:
+    if comments_from_unmuted_users.exists():
         response_data[0]['selector'] = '.comment[action*="/' + comment_id + '/"]'
     else:
         response_data[0]['selector'] = '#posted-comments'    
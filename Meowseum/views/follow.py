@@ -71,7 +71,7 @@ def get_follow_option_in_dropdown_header_response(request_user, uploader_user, u
     response_data = [{}]
     response_data[0]['selector'] = '.header_follow_button'
     if request_user.user_profile in uploader_user.user_profile.followers.all():
-        response_data[0]['HTML_snippet'] = 'Unfollow <div class="default-font inline-block">@' + username + " (" + str(uploader_user.user_profile.followers.count()) + ")</div>"
+        response_data[0]['HTML_snippet'] = 'Unfollow <div class="default-font inline-block">@' + username + " (" + str(uploader_user.user_profile.get_follower_count()) + ")</div>"
     else:
-        response_data[0]['HTML_snippet'] = 'Follow <div class="default-font inline-block">@' + username + " (" + str(uploader_user.user_profile.followers.count()) + ")</div>" 
+        response_data[0]['HTML_snippet'] = 'Follow <div class="default-font inline-block">@' + username + " (" + str(uploader_user.user_profile.get_follower_count()) + ")</div>" 
     return response_data
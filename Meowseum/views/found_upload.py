@@ -25,6 +25,7 @@ def page(request):
         new_found_record.upload = upload
         new_found_record.save()
         upload.description = verify_description_form.cleaned_data['description']
+        upload.category = 'found'
         upload.save()
         return redirect('index')
     else:
@@ -3,48 +3,74 @@
 from django.shortcuts import render
 from django.http import HttpResponseRedirect
 from Meowseum.common_view_functions import ajaxWholePageRedirect
-from Meowseum.models import TemporaryUpload, Upload, validation_specifications_for_Upload, hosting_limits_for_Upload, Metadata
+from Meowseum.models import TemporaryUpload, ProcessingProgress, Upload, validation_specifications_for_Upload, hosting_limits_for_Upload, Metadata
 from Meowseum.file_handling.file_validation import get_validated_metadata
-from Meowseum.file_handling.stage2_processing import process_to_meet_hosting_limits
+from Meowseum.file_handling.stage2_processing import process_to_meet_hosting_limits, ProcessingLimitError
 from Meowseum.forms import FromDeviceForm
 import os
 from django.conf import settings
 from ipware.ip import get_real_ip
-from Meowseum.file_handling.file_utility_functions import move_file, make_unique_with_random_id_suffix_within_character_limit, file_name_and_url_will_be_unique
+from Meowseum.file_handling.file_utility_functions import move_file, move_renditions, move_directory, make_unique_with_random_id_suffix_within_character_limit, file_name_and_url_will_be_unique, url_will_be_unique
+from Meowseum.file_handling.CustomStorage import get_content_addressed_file_name
+from Meowseum.file_handling.duplicate_index import find_duplicate_upload
+from Meowseum.file_handling.progress_reporting import start_reporting
 
 # 0. Main function
 def page(request):
     # This is the outermost if-statement because a user shouldn't be accessing this page via AJAX unless the user is logged in.
     if request.user.is_authenticated:
         form = FromDeviceForm(request.POST or None, request.FILES or None)
-        # If the user has submitted a form, begin validation.
-        metadata, form = get_validated_metadata('file', form, request.FILES, validation_specifications_for_Upload)
-        if form.is_valid():
-            # Begin processing.
-            temporary_upload, metadata = create_temporary_upload_record(form, metadata)
-            new_upload, metadata = create_new_upload_record(temporary_upload, metadata, request)
-            create_metadata_record(new_upload, metadata)
-            # Redirect to the page for adding the title, description, and tags.
-            return ajaxWholePageRedirect(request, 'upload_page1')
-        else:
-            return render(request, 'en/public/upload_modal.html', {'from_device_form' : form})
+        return validate_and_process(request, form, request.FILES)
     else:
         return ajaxWholePageRedirect(request, 'login')
+
+# 0.1. Validate and process the file of a bound form. The resumable_upload view also uses this function once the last chunk of a file has arrived.
+# Input: request, form, request_files, the dictionary containing the file under 'file'. Output: The response.
+def validate_and_process(request, form, request_files):
+    # If the user has submitted a form, begin validation.
+    metadata, form = get_validated_metadata('file', form, request_files, validation_specifications_for_Upload)
+    if form.is_valid():
+        # Before spending time on processing, check whether the file was already uploaded.
+        duplicate_upload, is_exact_duplicate = find_duplicate_upload(metadata, validation_specifications_for_Upload['duplicate_distance'], request.user)
+        if duplicate_upload != None and not form.cleaned_data['allow_duplicate']:
+            context = {'from_device_form': form, 'duplicate_upload': duplicate_upload, 'is_exact_duplicate': is_exact_duplicate}
+            return render(request, 'en/public/upload_modal.html', context)
+        metadata['duplicate_of'] = duplicate_upload
+        # Begin processing.
+        try:
+            temporary_upload, metadata = create_temporary_upload_record(form, metadata, request.user)
+        except ProcessingLimitError:
+            form.add_error('file', "The server wasn't able to process this file within its memory and time limits. Try uploading a shorter or lower resolution version.")
+            return render(request, 'en/public/upload_modal.html', {'from_device_form' : form})
+        new_upload, metadata = create_new_upload_record(temporary_upload, metadata, request)
+        create_metadata_record(new_upload, metadata)
+        # Redirect to the page for adding the title, description, and tags.
+        return ajaxWholePageRedirect(request, 'upload_page1')
+    else:
+        return render(request, 'en/public/upload_modal.html', {'from_device_form' : form})
         
 # 1. Create a temporary upload record. The TemporaryUpload model is used with a separate directory in case an exception occurs, including the server running
 # out of memory. When this happens, the record and associated files can be deleted after the administrator examines what went wrong.
-def create_temporary_upload_record(form, metadata):
+def create_temporary_upload_record(form, metadata, user):
     # If there weren't any validation errors, then begin creating a new TemporaryUpload record.
     temporary_upload = form.save()
+    start_progress_reporting(temporary_upload, form, user)
     # Process the file.
     try:
         temporary_upload.file, metadata = process_to_meet_hosting_limits(temporary_upload.file, metadata, hosting_limits_for_Upload)
         temporary_upload.save()
         metadata = get_updated_file_name(temporary_upload, metadata)
+    except ProcessingLimitError:
+        # The file was too demanding to process within the limits, which isn't a problem for the administrator to examine, so don't keep the record.
+        temporary_upload.file.delete(save=False)
+        temporary_upload.delete()
+        raise
     except Exception as e:
         temporary_upload.save()
         # Add the name of the file to the end of the exception message, so I can use it while investigating what went wrong.
         raise type(e)(str(e) + ". File path: " + temporary_upload.file.path).with_traceback(e.__traceback__)
+    finally:
+        start_reporting(None)
     return temporary_upload, metadata
 
 # 1.1. When a record with a file field is created, Django may remove or replace certain characters as part of its built-in validation.
@@ -57,45 +83,65 @@ def get_updated_file_name(temporary_upload, metadata):
     metadata['file_name'] = file_name
     return metadata
 
-# 2. File processing was successful, so copy the TemporaryUpload record to the table for Upload records and move the associated files.
+# 1.2. If the browser sent a progress key, create the record which the upload modal polls while the file is processed, and report the progress to it.
+def start_progress_reporting(temporary_upload, form, user):
+    if form.cleaned_data['progress_key'] != '':
+        start_reporting(ProcessingProgress.objects.create(temporary_upload=temporary_upload, uploader=user, progress_key=form.cleaned_data['progress_key']))
+
+# 2. File processing was successful, so copy the TemporaryUpload record to the table for Upload records and move the file and its associated files from the local
+# processing directory into media storage.
 def create_new_upload_record(temporary_upload, metadata, request):
     source_directory = os.path.join(settings.MEDIA_PATH, TemporaryUpload.UPLOAD_TO)
-    destination_directory = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO)
+    old_file_name = metadata['file_name']
     old_full_file_name = metadata['file_name'] + metadata['extension']
-    old_exif_file_name = metadata['file_name'] + '.dat'
     old_poster_file_name = metadata['file_name'] + '.jpg'
     source_path = os.path.join(source_directory, old_full_file_name)
     thumbnail_directory_name = hosting_limits_for_Upload['thumbnail'][2]
     poster_directory_name = hosting_limits_for_Upload['poster_directory']
-    # Make sure the file name is unique, in case the file name is already taken, and overwrite the new name into the metadata dictionary.
-    metadata['file_name'] = make_unique_with_random_id_suffix_within_character_limit(metadata['file_name'], 178, file_name_and_url_will_be_unique)
+    hls_directory_name = hosting_limits_for_Upload['hls_ladder'][2]
+    hover_preview_directory_name = hosting_limits_for_Upload['hover_preview'][2]
+    if settings.CONTENT_ADDRESSED_STORAGE:
+        # Name the files after the hash of the processed file. If the same file was uploaded before, the upload shares the stored files, and the copies made
+        # during processing replace them. Only the URL needs to be unique.
+        metadata['file_name'] = get_content_addressed_file_name(source_path)
+        relative_url = make_unique_with_random_id_suffix_within_character_limit(old_file_name, 178, url_will_be_unique).replace(" ","_")
+    else:
+        # Make sure the file name is unique, in case the file name is already taken, and overwrite the new name into the metadata dictionary.
+        metadata['file_name'] = make_unique_with_random_id_suffix_within_character_limit(metadata['file_name'], 178, file_name_and_url_will_be_unique)
+        # Copy the file name with spaces replaced with underscores to the upload's URL.
+        relative_url = metadata['file_name'].replace(" ","_")
     new_full_file_name = metadata['file_name'] + metadata['extension']
-    new_exif_file_name = metadata['file_name'] + '.dat'
     new_poster_file_name = metadata['file_name'] + '.jpg'
-    destination_path = os.path.join(destination_directory, new_full_file_name)
-    # This will be the value associated with the main file in the database, a location relative to the /media/ directory.
-    destination_relative_path = Upload.UPLOAD_TO + '/' + new_full_file_name
+    # This will be the value associated with the main file in the database, a location relative to the /media/ directory. It is also the file's name in media storage.
+    destination_name = Upload.UPLOAD_TO + '/' + new_full_file_name
 
     # Move the file to the long-term upload directory.
-    os.rename(source_path, destination_path)
-    # Copy the file name with spaces replaced with underscores to the upload's URL.
-    new_upload = Upload(file=destination_relative_path, relative_url=metadata['file_name'].replace(" ","_"))
+    move_file(source_path, destination_name)
+    new_upload = Upload(file=destination_name, relative_url=relative_url)
     new_upload = get_user_information(new_upload, request) 
     new_upload.save()
     
     # Move all the upload's associated files, like the thumbnail and the poster image for <video>s, to the main directories.
-    exif_source_path = os.path.join(source_directory, 'metadata', old_exif_file_name)
-    exif_destination_path = os.path.join(destination_directory, 'metadata', new_exif_file_name)
-    move_file(exif_source_path, exif_destination_path)
     thumbnail_source_path = os.path.join(source_directory, thumbnail_directory_name, old_full_file_name)
-    thumbnail_destination_path = os.path.join(destination_directory, thumbnail_directory_name, new_full_file_name)
-    move_file(thumbnail_source_path, thumbnail_destination_path)
+    thumbnail_destination_name = Upload.UPLOAD_TO + '/' + thumbnail_directory_name + '/' + new_full_file_name
+    move_file(thumbnail_source_path, thumbnail_destination_name)
     poster_source_path = os.path.join(source_directory, poster_directory_name, old_poster_file_name)
-    poster_destination_path = os.path.join(destination_directory, poster_directory_name, new_poster_file_name)
-    move_file(poster_source_path, poster_destination_path)
+    poster_destination_name = Upload.UPLOAD_TO + '/' + poster_directory_name + '/' + new_poster_file_name
+    move_file(poster_source_path, poster_destination_name)
     poster_thumbnail_source_path = os.path.join(source_directory, poster_directory_name, thumbnail_directory_name, old_poster_file_name)
-    poster_thumbnail_destination_path = os.path.join(destination_directory, poster_directory_name, thumbnail_directory_name, new_poster_file_name)
-    move_file(poster_thumbnail_source_path, poster_thumbnail_destination_path)
+    poster_thumbnail_destination_name = Upload.UPLOAD_TO + '/' + poster_directory_name + '/' + thumbnail_directory_name + '/' + new_poster_file_name
+    move_file(poster_thumbnail_source_path, poster_thumbnail_destination_name)
+    # Move the WebP and AVIF renditions, which are saved next to the file, thumbnail, and posters with the same name.
+    move_renditions(source_path, destination_name)
+    move_renditions(thumbnail_source_path, thumbnail_destination_name)
+    move_renditions(poster_source_path, poster_destination_name)
+    move_renditions(poster_thumbnail_source_path, poster_thumbnail_destination_name)
+    # The HLS ladder's playlists and segments are kept together in a directory with the same name as the file.
+    hls_source_path = os.path.join(source_directory, hls_directory_name, old_file_name)
+    hls_destination_name = Upload.UPLOAD_TO + '/' + hls_directory_name + '/' + metadata['file_name']
+    move_directory(hls_source_path, hls_destination_name)
+    hover_preview_source_path = os.path.join(source_directory, hover_preview_directory_name, old_file_name + '.mp4')
+    move_file(hover_preview_source_path, Upload.UPLOAD_TO + '/' + hover_preview_directory_name + '/' + metadata['file_name'] + '.mp4')
     temporary_upload.delete()
     return new_upload, metadata
 
@@ -115,7 +161,9 @@ def get_user_information(new_upload, request):
 def create_metadata_record(new_upload, metadata):
     new_record = Metadata(upload=new_upload)
     # This is a list of the keys within the metadata dictionary which correspond to Metadata fields, so their values will be saved to the database.
-    list_of_field_names = ['file_name', 'extension', 'original_file_name', 'original_extension', 'mime_type', 'file_size', 'width', 'height', 'duration', 'fps', 'has_audio', 'original_exif_orientation']
+    list_of_field_names = ['file_name', 'extension', 'original_file_name', 'original_extension', 'mime_type', 'file_size', 'width', 'height', 'duration', 'fps', 'has_audio', 'original_exif_orientation', 'exif_data',
+                          'rendition_types', 'hls_rungs', 'content_hash', 'perceptual_hash', 'duplicate_of', 'unoptimized_file_size', 'jpeg_quality',
+                          'has_hover_preview']
     for field in list_of_field_names:
         if field in metadata:
             # exec() is safe to use here because user input isn't involved in determining the characters within the string sent to the interpreter for execution.
@@ -10,11 +10,21 @@ from django.core.urlresolvers import reverse
 from operator import attrgetter
 from django.db.models import Count
 import datetime
-from Meowseum.common_view_functions import get_public_unmuted_uploads, render_upload_gallery, increment_hit_count, sort_by_popularity, sort_by_trending
+from Meowseum.common_view_functions import get_public_unmuted_uploads, render_upload_gallery, increment_hit_count, sort_by_popularity, sort_by_trending, \
+                                          gallery_conditional_get
 from Meowseum.views.search import get_search_queryset
+from Meowseum.anonymous_page_cache import anonymous_page_cache
+from Meowseum.middleware.query_counting_middleware import query_budget
+
+# The most queries a public gallery should make, for a page of 25 uploads, with some room to spare. Like the slide page's budget, it's a starting point, to be
+# lowered as the galleries' queries are optimized.
+GALLERY_QUERY_BUDGET = 30
 
 # 0. Main function for the front page. If the user is logged out, then this is the same as the highest rated page.
 # If the user is logged in, then this is the same as the followed user page.
+@gallery_conditional_get('index')
+@anonymous_page_cache('index')
+@query_budget(GALLERY_QUERY_BUDGET)
 def front_page(request):
     increment_hit_count(request, "index")
     if request.user.is_authenticated:
@@ -49,6 +59,9 @@ def front_page_most_popular(request):
     return render_upload_gallery(request, upload_queryset, {'no_results_message': "Nothing has been uploaded to the site yet."})
 
 # Main function for the 'most_popular' page, which uses the site's trending algorithm.
+@gallery_conditional_get('most_popular')
+@anonymous_page_cache('most_popular')
+@query_budget(GALLERY_QUERY_BUDGET)
 def most_popular(request):
     increment_hit_count(request, "most_popular")
     upload_queryset = get_public_unmuted_uploads(request.user)
@@ -56,6 +69,9 @@ def most_popular(request):
     return render_upload_gallery(request, upload_queryset, {'no_results_message': "Nothing has been uploaded to the site yet."})
 
 # Main function for the 'new_submissions' page.
+@gallery_conditional_get('new_submissions')
+@anonymous_page_cache('new_submissions')
+@query_budget(GALLERY_QUERY_BUDGET)
 def new_submissions(request):
     increment_hit_count(request, "new_submissions")
     # Retrieve uploads ordered from latest to earliest.
@@ -64,6 +80,9 @@ def new_submissions(request):
     return render_upload_gallery(request, upload_queryset, {'no_results_message': "Nothing has been uploaded to the site yet."})
 
 # Main function for the gallery for each tag. Results are sorted using the site's trending algorithm.
+@gallery_conditional_get('tag_gallery')
+@anonymous_page_cache('tag_gallery')
+@query_budget(GALLERY_QUERY_BUDGET)
 def tag_gallery(request, tag_name):
     increment_hit_count(request, "tag_gallery", [tag_name])
         
@@ -83,12 +102,25 @@ def tag_gallery(request, tag_name):
 
     return render_upload_gallery(request, upload_queryset, {'tag': tag, 'subscribed': subscribed, 'no_results_message': "No uploads currently have this tag."})
 
+# Main function for the gallery of each category, such as the Adoption category. Results are sorted from newest to oldest. The filter uses the category column,
+# and the category's records are loaded in the same query as the uploads.
+@gallery_conditional_get('category_gallery')
+@query_budget(GALLERY_QUERY_BUDGET)
+def category_gallery(request, category):
+    increment_hit_count(request, "category_gallery", [category])
+    upload_queryset = get_public_unmuted_uploads(request.user).filter(category=category)
+    if category != 'pets':
+        upload_queryset = upload_queryset.select_related(category)
+    upload_queryset = list(upload_queryset.order_by("-id"))
+    return render_upload_gallery(request, upload_queryset, {'no_results_message': "Nothing has been uploaded to this category yet."})
+
 @login_required
 def your_uploads(request):
     # Shortcut for the link in the header. This exists because it is currently faster than having request.user stored as a variable in the template on every page.
     return redirect('gallery', request.user.username)
 
 # Main function for the 'gallery' page.
+@gallery_conditional_get('gallery')
 def uploads(request, username):
     increment_hit_count(request, "gallery", [username])
     # Retrieve the queryset of uploads from the owner of the profile. If the viewer isn't the owner of the profile,
@@ -123,6 +155,7 @@ def your_likes(request):
     return redirect('likes', request.user.username)
 
 # Main function for the 'likes' page.
+@gallery_conditional_get('gallery')
 def likes(request, username):
     increment_hit_count(request, "gallery", [username])
     # Begin retrieving the list of like records for the user specified by the URL.
@@ -158,6 +191,7 @@ def likes(request, username):
 
 # Main function for the 'from followed users' page.
 @login_required
+@gallery_conditional_get('followed_users')
 def from_followed_users(request):
     increment_hit_count(request, "followed_users")
     followed_user_profiles = request.user.user_profile.following.all()
@@ -172,6 +206,7 @@ def from_followed_users(request):
 
 # Main function for the 'subscribed_tags' page. Results are sorted using the site's trending algorithm.
 @login_required
+@gallery_conditional_get('subscribed_tags')
 def subscribed_tags(request):
     increment_hit_count(request, "subscribed_tags")
     upload_queryset = get_public_unmuted_uploads(request.user)
@@ -0,0 +1,24 @@
+# Description: Return the next chunk of an upload's comments for the "Load more comments" button on the slide page. The querystring's 'after' is the ID of
+# the last comment which has been loaded.
+
+from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponse, Http404
+import json
+from Meowseum.models import Upload
+from Meowseum.views.slide_page import get_comment_chunk
+
+# 0. Main function. The response is a JSON object with the HTML of the comments, 'HTML_snippet', and the ID to load the next chunk after, 'after', which is
+# null when there are no more comments.
+def page(request, relative_url):
+    upload = get_object_or_404(Upload, relative_url=relative_url)
+    if upload.uploader_has_disabled_comments:
+        raise Http404
+    try:
+        after_id = int(request.GET.get('after', ''))
+    except ValueError:
+        after_id = None
+    comments, next_comments_after = get_comment_chunk(request, upload, after_id)
+    comments_HTML = render(request, 'en/public/slide_page_comments.html', {'comments': comments,
+                                                                           'can_delete_comments': request.user.has_perm('Meowseum.delete_comment')})
+    response_data = {'HTML_snippet': comments_HTML.content.decode('utf-8'), 'after': next_comments_after}
+    return HttpResponse(json.dumps(response_data), content_type="application/json")
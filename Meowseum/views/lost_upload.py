@@ -24,6 +24,7 @@ def page(request):
         new_lost_record.upload = upload
         new_lost_record.save()
         upload.description = verify_description_form.cleaned_data['description']
+        upload.category = 'lost'
         upload.save()
         return redirect('index')
     else:
@@ -0,0 +1,41 @@
+# Description: When media is kept in a private S3 bucket, MEDIA_URL points to this view, which redirects each request to a presigned URL for the file. This lets the
+# templates keep building media URLs from MEDIA_URL, while any web server can hand out links to the shared bucket. HLS playlists are returned by the view itself with
+# each URI replaced, because a player resolves the segments relative to the playlist's URL, and relative URLs wouldn't carry a signature.
+
+from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from urllib.parse import quote
+import posixpath
+from Meowseum.file_handling.media_storage import get_media_storage
+
+# 0. Main function.
+def page(request, name):
+    name = posixpath.normpath(name)
+    if name.startswith('..') or name.startswith('/'):
+        raise Http404
+    media_storage = get_media_storage()
+    if name.endswith('.m3u8'):
+        if not media_storage.exists(name):
+            raise Http404
+        playlist = media_storage.read(name).decode('utf-8')
+        response = HttpResponse(sign_playlist(playlist, name, media_storage), content_type='application/vnd.apple.mpegurl')
+    else:
+        response = HttpResponseRedirect(media_storage.url(name))
+    # Let the browser reuse the response for half the lifetime of the signed URLs, so it doesn't follow a link after it has expired.
+    patch_cache_control(response, private=True, max_age=settings.MEDIA_STORAGE['URL_EXPIRATION'] // 2)
+    return response
+
+# 1. Replace each URI in an HLS playlist. A rung's playlist within the master playlist is sent back through this view, so that its segments are signed too.
+# Input: playlist, a string. name, the playlist's name in media storage. media_storage, the backend. Output: string
+def sign_playlist(playlist, name, media_storage):
+    directory = posixpath.dirname(name)
+    lines = playlist.splitlines()
+    for i in range(len(lines)):
+        if lines[i] != '' and not lines[i].startswith('#'):
+            uri_name = posixpath.normpath(posixpath.join(directory, lines[i]))
+            if uri_name.endswith('.m3u8'):
+                lines[i] = settings.MEDIA_URL + quote(uri_name)
+            else:
+                lines[i] = media_storage.url(uri_name)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,21 @@
+# Description: The upload modal polls this page about once a second while the server processes a file, to show the user the percentage and time remaining for the current
+# stage of processing. The page is a single indexed query, so that polling adds little load. Until the file has been received and validated, and after processing has
+# finished, there isn't a record for the progress key, and the response has an empty stage.
+
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.cache import never_cache
+from Meowseum.models import ProcessingProgress
+import json
+
+# 0. Main function.
+@never_cache
+def page(request, progress_key):
+    response_data = {'stage': '', 'percent': 0, 'seconds_remaining': None}
+    if request.user.is_authenticated:
+        progress_record = ProcessingProgress.objects.filter(progress_key=progress_key, uploader=request.user).order_by('-id').first()
+        if progress_record != None:
+            response_data['stage'] = progress_record.stage
+            response_data['percent'] = int(progress_record.fraction * 100)
+            response_data['seconds_remaining'] = progress_record.get_seconds_remaining(timezone.now())
+    return HttpResponse(json.dumps(response_data), content_type="application/json")
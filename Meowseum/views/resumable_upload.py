@@ -0,0 +1,139 @@
+# Description: These pages receive a file with the resumable upload protocol described in file_handling/resumable_uploads.py, so that a large video sent over
+# a mobile connection doesn't have to start over after the connection drops. A POST to the first page creates an upload and returns its URL in the Location
+# header. The client sends the file to that URL in PATCH requests with the headers Upload-Offset and Content-Type: application/offset+octet-stream, asks for the
+# offset to resume from with a HEAD request, and can cancel the upload with a DELETE request. Like any other form on the site, each request needs the CSRF token,
+# in the X-CSRFToken header. The response to the last chunk is the same as the from_device page's response to a file.
+
+from django.http import HttpResponse, Http404
+from django.db import transaction
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.utils.crypto import get_random_string
+from django.utils.datastructures import MultiValueDict
+from django.views.decorators.cache import never_cache
+from django.template.defaultfilters import filesizeformat
+import os
+import re
+from Meowseum.common_view_functions import ajaxWholePageRedirect
+from Meowseum.models import ResumableUpload, validation_specifications_for_Upload
+from Meowseum.forms import FromDeviceForm
+from Meowseum.views.from_device import validate_and_process
+from Meowseum.file_handling.resumable_uploads import TUS_VERSION, StagedUploadedFile, receive_chunk_file, append_chunk_file, get_first_chunk_mime_type, \
+                                                     parse_upload_metadata, delete_resumable_upload
+
+# The number of bytes which need to have been received before the type is checked. python-magic needs the first few kilobytes to tell most formats apart.
+MIME_DETECTION_SIZE = 4096
+
+# 0. Main function for creating an upload. The Upload-Length header is the size of the file in bytes. The optional Upload-Metadata header holds the file's
+# 'filename' and the from_device form's 'progress_key' and 'allow_duplicate' fields.
+@never_cache
+def create(request):
+    if not request.user.is_authenticated:
+        return ajaxWholePageRedirect(request, 'login')
+    if request.method != 'POST':
+        return get_tus_response(HttpResponse(status=405))
+    try:
+        length = int(request.META.get('HTTP_UPLOAD_LENGTH', ''))
+    except ValueError:
+        return get_tus_response(HttpResponse("Error: The Upload-Length header is required.", status=400))
+    max_size = get_largest_max_size(validation_specifications_for_Upload['max_size'])
+    if length <= 0 or length > max_size:
+        return get_tus_response(HttpResponse("Error: The file is larger than " + filesizeformat(max_size) + ".", status=413))
+    upload_metadata = parse_upload_metadata(request.META.get('HTTP_UPLOAD_METADATA', ''))
+    resumable_upload = ResumableUpload.objects.create(uploader=request.user, upload_key=get_random_string(32), length=length,
+                                                      original_name=os.path.basename(upload_metadata.get('filename', 'upload'))[:255] or 'upload',
+                                                      progress_key=re.sub(r'\W', '', upload_metadata.get('progress_key', ''))[:32],
+                                                      allow_duplicate=upload_metadata.get('allow_duplicate', '') not in ('', 'false'))
+    staging_path = resumable_upload.get_staging_path()
+    os.makedirs(os.path.dirname(staging_path), exist_ok=True)
+    open(staging_path, 'wb').close()
+    response = HttpResponse(status=201)
+    response['Location'] = request.build_absolute_uri(reverse('resumable_upload', args=[resumable_upload.upload_key]))
+    return get_tus_response(response)
+
+# 0. Main function for an existing upload.
+@never_cache
+def page(request, upload_key):
+    if not request.user.is_authenticated:
+        return ajaxWholePageRedirect(request, 'login')
+    try:
+        resumable_upload = ResumableUpload.objects.get(upload_key=upload_key, uploader=request.user)
+    except ResumableUpload.DoesNotExist:
+        raise Http404
+    if request.method == 'HEAD':
+        return get_offset_response(resumable_upload, HttpResponse(status=200))
+    elif request.method == 'PATCH':
+        return receive_chunk(request, resumable_upload)
+    elif request.method == 'DELETE':
+        delete_resumable_upload(resumable_upload)
+        return get_tus_response(HttpResponse(status=204))
+    else:
+        return get_tus_response(HttpResponse(status=405))
+
+# 1. Append the body of a PATCH request to the staging file. The body is read into a part file first, without a transaction, so that a slow client doesn't keep
+# the record locked. Then the record is locked only while the part file is appended and the offset is advanced, so that two requests for the same upload can't
+# both append at the same offset. If another request advanced the offset while the body was being read, the chunk is refused. After the first few kilobytes,
+# the type is checked, and an unsupported file is refused without waiting for the rest of it.
+def receive_chunk(request, resumable_upload):
+    if request.content_type != 'application/offset+octet-stream':
+        return get_tus_response(HttpResponse(status=415))
+    try:
+        offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+    except ValueError:
+        return get_offset_response(resumable_upload, HttpResponse("Error: The Upload-Offset header is required.", status=400))
+    if offset != resumable_upload.offset:
+        # The client's offset is out of date, so it should ask for the offset again with a HEAD request.
+        return get_offset_response(resumable_upload, HttpResponse(status=409))
+    part_path, bytes_received = receive_chunk_file(resumable_upload, request, offset)
+    try:
+        with transaction.atomic():
+            try:
+                resumable_upload = ResumableUpload.objects.select_for_update().get(id=resumable_upload.id)
+            except ResumableUpload.DoesNotExist:
+                # The upload was canceled while the chunk was being received.
+                raise Http404
+            if offset != resumable_upload.offset:
+                return get_offset_response(resumable_upload, HttpResponse(status=409))
+            resumable_upload.offset = resumable_upload.offset + append_chunk_file(resumable_upload, part_path)
+            if resumable_upload.mime_type == '' and (resumable_upload.offset >= MIME_DETECTION_SIZE or resumable_upload.offset == resumable_upload.length):
+                resumable_upload.mime_type = get_first_chunk_mime_type(resumable_upload.get_staging_path())
+                if resumable_upload.mime_type != '' and resumable_upload.mime_type not in settings.MIME_TYPES_AND_PREFERRED_EXTENSIONS:
+                    delete_resumable_upload(resumable_upload)
+                    return get_tus_response(HttpResponse("Error: Unsupported file type.", status=415))
+            resumable_upload.save()
+    finally:
+        # The part file is left over if the chunk was refused or couldn't be appended.
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    if resumable_upload.offset < resumable_upload.length:
+        return get_offset_response(resumable_upload, HttpResponse(status=204))
+    return finish_upload(request, resumable_upload)
+
+# 2. The whole file has been received, so validate and process it like a file sent to the from_device page. If the file is valid, saving the TemporaryUpload moves
+# the staging file into the stage 2 processing directory. Otherwise, the staging file is deleted along with the record.
+def finish_upload(request, resumable_upload):
+    staged_file = StagedUploadedFile(resumable_upload)
+    form = FromDeviceForm({'progress_key': resumable_upload.progress_key, 'allow_duplicate': resumable_upload.allow_duplicate}, MultiValueDict({'file': [staged_file]}))
+    try:
+        response = validate_and_process(request, form, form.files)
+    finally:
+        staged_file.close()
+        delete_resumable_upload(resumable_upload)
+    return get_offset_response(resumable_upload, response)
+
+# 3. Add the headers which every response of the protocol has.
+def get_tus_response(response):
+    response['Tus-Resumable'] = TUS_VERSION
+    return response
+
+# 3.1. Add the headers which tell the client how much of the file has been received.
+def get_offset_response(resumable_upload, response):
+    response['Upload-Offset'] = str(resumable_upload.offset)
+    response['Upload-Length'] = str(resumable_upload.length)
+    return get_tus_response(response)
+
+# 4. Return the largest file size allowed for any type. The limit for the file's own type is checked once the file is complete.
+def get_largest_max_size(max_size):
+    if isinstance(max_size, dict):
+        return max(max_size.values())
+    return max_size
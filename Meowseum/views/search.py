@@ -15,7 +15,7 @@ import datetime
 from django.db.models import Count
 from django.contrib.auth.models import User
 from urllib.parse import quote_plus
-from Meowseum.common_view_functions import increment_hit_count
+from Meowseum.common_view_functions import increment_hit_count, gallery_conditional_get
 
 FORM_DICTIONARY = {'filtering_by_photos':'BooleanField',
                    'filtering_by_gifs':'BooleanField',
@@ -62,6 +62,7 @@ def header_search(request):
         return redirect('search', query = {'all_words':header_search})
 
 # 0. Main function for search queries.
+@gallery_conditional_get('search')
 def page(request):
     increment_hit_count(request, "search")
     form = process_GET_form(request, FORM_DICTIONARY)
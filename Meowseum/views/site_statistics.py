@@ -4,6 +4,8 @@ from hitcount.views import HitCountMixin
 from django.db.models import Sum
 from django.shortcuts import render
 from django.core.exceptions import PermissionDenied
+from Meowseum.models import Metadata, ViewQueryStatistics
+from Meowseum import model_cache
 
 @login_required
 def page(request):
@@ -11,4 +13,15 @@ def page(request):
         # Make the page accessible only to the site administrator.
         raise PermissionDenied
     sitewide_hit_count = HitCount.objects.all().aggregate(sitewide_hit_count=Sum('hits'))['sitewide_hit_count']
-    return render(request, 'en/private/site_statistics.html', {'sitewide_hit_count':sitewide_hit_count})
+    # Report the bytes saved by optimizing the encoding of still images, out of the bytes they would have used otherwise.
+    encoding_totals = Metadata.objects.filter(unoptimized_file_size__isnull=False).aggregate(unoptimized_size=Sum('unoptimized_file_size'), optimized_size=Sum('file_size'))
+    bytes_saved, percent_saved = None, None
+    if encoding_totals['unoptimized_size']:
+        bytes_saved = encoding_totals['unoptimized_size'] - encoding_totals['optimized_size']
+        percent_saved = round(100 * bytes_saved / encoding_totals['unoptimized_size'], 1)
+    # List the database queries of each view, with the views which made the most queries in one request first.
+    view_query_statistics = ViewQueryStatistics.objects.order_by('-max_query_count')
+    # Report how often each family of cached values was found in the cache.
+    model_cache_statistics = model_cache.get_statistics()
+    return render(request, 'en/private/site_statistics.html', {'sitewide_hit_count':sitewide_hit_count, 'bytes_saved':bytes_saved, 'percent_saved':percent_saved,
+                                                              'view_query_statistics':view_query_statistics, 'model_cache_statistics':model_cache_statistics})
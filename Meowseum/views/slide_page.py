@@ -1,23 +1,42 @@
 # Description: This is a page for showing an upload, a file also referred to as a slide, and all the other database information about it.
 
-from Meowseum.models import Upload, Metadata, Comment, Tag, Like, Page, UserContact, hosting_limits_for_Upload
+from Meowseum.models import Upload, Metadata, Comment, Tag, Like, Page, UserProfile, hosting_limits_for_Upload
 from Meowseum.forms import CommentForm, TagForm
 from django.shortcuts import render, get_object_or_404
-from Meowseum.common_view_functions import redirect
+from Meowseum.common_view_functions import redirect, get_slide_page_etag, count_hit_when_not_modified
 from django.utils.http import urlquote_plus
 from django.core.urlresolvers import reverse
-from django.template.defaultfilters import capfirst
-from Meowseum.templatetags.my_filters import humanize_list, format_currency
 from django.utils.safestring import mark_safe
+from django.utils.dateparse import parse_date
+from django.db.models import Exists, OuterRef
 from hitcount.models import HitCount
 from hitcount.views import HitCountMixin
+from django.views.decorators.vary import vary_on_headers
+from django.views.decorators.http import condition
+from django.views.decorators.cache import cache_control
+from Meowseum.middleware.query_counting_middleware import query_budget
+from Meowseum.pet_display_data import update_pet_display_data
+
+# The number of comments shown when the page is loaded and added each time the user clicks "Load more comments".
+COMMENTS_PER_CHUNK = 50
     
 # 0. Main function. Input: request. relative_url refers to a unique code which appears in the URL.
+# The format of the video poster depends on the image types listed in the browser's Accept header.
+# The query budget is the number measured for an upload with a typical number of tags and comments, with some room to spare. It's a starting point, to be
+# lowered as the page's queries are optimized.
+# A request whose If-None-Match header matches the page's ETag is answered with 304 Not Modified without running the view. The page differs for each viewer, so
+# only the browser may keep a copy, and it has to check the ETag before using it. The 304 response still counts as a view.
+@vary_on_headers('Accept')
+@count_hit_when_not_modified('slide_page')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=get_slide_page_etag)
+@query_budget(40)
 def page(request, relative_url):
     # First, retrieve information about the upload, uploader, and viewer of the page.
     upload = get_object_or_404(Upload, relative_url=relative_url)
     # These variables are related to media paths.
     poster_directory = hosting_limits_for_Upload['poster_directory']
+    hls_directory = hosting_limits_for_Upload['hls_ladder'][2]
     upload_directory = Upload.UPLOAD_TO
     uploader = upload.uploader.user_profile
     if request.user.is_authenticated:
@@ -28,7 +47,7 @@ def page(request, relative_url):
     # Next, use these variables to retrieve other information from the database. 
     previous_slide, next_slide = get_surrounding_slide_links(request, upload)
     views = get_unique_views(request, relative_url)
-    comments_from_unmuted_users = get_comments_from_unmuted_users(request, upload)
+    comments, next_comments_after = get_comment_chunk(request, upload)
     user_has_liked_this_upload = check_whether_user_has_liked_this_upload(request, upload)
     # Gather information concerning website moderation.
     can_delete_upload, can_ban_users, can_delete_comments = get_permissions(request, upload, uploader, viewer)
@@ -38,13 +57,15 @@ def page(request, relative_url):
     context = {'relative_url': relative_url,
                'upload': upload,
                'poster_directory': poster_directory,
+               'hls_directory': hls_directory,
                'upload_directory': upload_directory,
                'uploader': uploader,
                'viewer': viewer,
                'previous_slide': previous_slide,
                'next_slide': next_slide,
                'views': views,
-               'comments_from_unmuted_users': comments_from_unmuted_users,
+               'comments': comments,
+               'next_comments_after': next_comments_after,
                'user_has_liked_this_upload': user_has_liked_this_upload,
                'can_delete_upload': can_delete_upload,
                'can_ban_users': can_ban_users,
@@ -114,16 +135,30 @@ def get_unique_views(request, relative_url):
 # 3. Retrieve the set of comments for the upload while excluding comments from muted users.
 def get_comments_from_unmuted_users(request, upload):
     if request.user.is_authenticated:
-        # Because muting is stored on UserProfile and the commenter uses the User object, retrieve an array of User objects.
-        muted_users = []
-        for profile in request.user.user_profile.muting.all():
-            muted_users = muted_users + [profile.user_auth]
-        comments_from_unmuted_users = upload.comments.exclude(commenter__in=muted_users)
+        # A UserProfile's primary key is its user's ID, so a commenter is muted if the viewer's muting relation has a row for the commenter's ID. The database
+        # checks for the row with the relation's unique index, as an anti-join, instead of the list of muted users being loaded first.
+        muting = UserProfile.muting.through.objects.filter(from_userprofile_id=request.user.id, to_userprofile_id=OuterRef('commenter_id'))
+        comments_from_unmuted_users = upload.comments.annotate(commenter_is_muted=Exists(muting)).filter(commenter_is_muted=False)
     else:
         # The user is logged out, so no users are muted.
         comments_from_unmuted_users = upload.comments.all()
     return comments_from_unmuted_users
 
+# 3.1. Retrieve a chunk of the comments from unmuted users, oldest first, starting after the comment with the ID after_id. The position is kept by ID rather than
+# by an offset, so that a chunk is read from the (upload, id) index no matter how far into the comments it is.
+# Input: request, upload, after_id, optional. Output: comments, a list, and next_comments_after, the ID to load the next chunk after, or None for the last chunk.
+def get_comment_chunk(request, upload, after_id=None):
+    if upload.comment_count == 0:
+        return [], None
+    comment_queryset = get_comments_from_unmuted_users(request, upload)
+    if after_id != None:
+        comment_queryset = comment_queryset.filter(id__gt=after_id)
+    # Retrieve one extra comment to find out whether there's another chunk.
+    comments = list(comment_queryset.select_related('commenter').order_by('id')[:COMMENTS_PER_CHUNK + 1])
+    if len(comments) > COMMENTS_PER_CHUNK:
+        return comments[:COMMENTS_PER_CHUNK], comments[COMMENTS_PER_CHUNK - 1].id
+    return comments, None
+
 # 4. Return True if the user has liked this upload. Return False if the user has not liked this upload.
 # Input: request, upload.
 # Output: user_has_liked_this_upload, True or False.
@@ -158,407 +193,28 @@ def get_permissions(request, upload, uploader, viewer):
         can_delete_comments = True
     return can_delete_upload, can_ban_users, can_delete_comments
 
-# 6. For displaying an Adoption, Lost, or Found record, the output will be more human-readable when the values of form fields on the same topic are merged.
-# For example, on the form, it made sense to ask for the overall coat color, coat pattern, and nose color separately, in order to get as much information as possible.
-# For the output, the reader doesn't need to see all the labels, so their values are merged beside one "Color:" label.
-# As well, there are Boolean fields that shouldn't be shown if the user has entered in the affirmative and then filled out a follow-up question.
-# If the user has said the cat has a collar and then described the collar, the user doesn't explicitly need to be told that the cat has a collar.
+# 6. For displaying an Adoption, Lost, or Found record, the values of form fields on the same topic are merged, like the overall coat color, coat pattern, and
+# nose color beside one "Color:" label. The merged fields are computed by pet_display_data.py when the pet's record or the uploader's address changes, and
+# stored in the upload's pet_display_data field, so the slide page reads them along with the upload and doesn't format anything.
 # The program doesn't test for whether the field has data, because I test for this in the template in order to know whether to include the field's HTML.
 
 # Input: upload, an upload record, and template_variables, the dictionary of variables to be used in the template
 # Output: merged_fields, a tuple of labels and corresponding values for each merged field.
 # boolean_answers is a tuple of strings generated by the Boolean fields for which there isn't follow-up data.
+# pet_date is the date the pet was lost or found.
 def get_pet_information_record(upload, context):
-    upload_category = upload.get_category()
-
-    if upload_category == 'pets':
+    if upload.category == 'pets':
         return context
-    elif upload_category == 'adoption':
-        merged_fields, boolean_answers = format_adoption_record_for_display(upload)
-    elif upload_category == 'lost':
-        merged_fields, boolean_answers = format_lost_record_for_display(upload)
+    display_data = upload.pet_display_data
+    if display_data == None:
+        # The upload is from before the display data was stored, so compute it now.
+        display_data = update_pet_display_data(upload.get_pet_information())
+    # The values were escaped when they were stored.
+    context['merged_fields'] = tuple([(label, mark_safe(value)) for label, value in display_data['merged_fields']])
+    if display_data['boolean_answers'] == None:
+        context['boolean_answers'] = None
     else:
-        if upload.found:
-            merged_fields, boolean_answers = format_found_record_for_display(upload)
-        
-    context['merged_fields'] = merged_fields
-    context['boolean_answers'] = boolean_answers
+        context['boolean_answers'] = tuple([mark_safe(answer) for answer in display_data['boolean_answers']])
+    if display_data['date'] != None:
+        context['pet_date'] = parse_date(display_data['date'])
     return context
-
-# 6.1 For an Upload record in the Adoption category, merge all the related fields and omit the fields without any relevant information.
-# Input: An Upload record. Output: merged_fields, boolean_answers
-def format_adoption_record_for_display(upload):
-    merged_fields = (('Name', upload.adoption.pet_name),
-                     ('Sex', get_adoption_merged_sex_field(upload.adoption)),
-                     ('City', get_city_merged_field(upload)),
-                     ('Breed', get_merged_breed_field(upload.adoption)),
-                     ('Coat description', get_coat_description_field(upload.adoption)),
-                     ('Disabilities', capfirst(humanize_list(upload.adoption.disabilities, ""))),
-                     ('Prefers a home without', capfirst(humanize_list(upload.adoption.prefers_a_home_without, ""))),
-                     ('Age', get_merged_age_field(upload.adoption)),
-                     ('Weight', get_merged_weight_field(upload.adoption)),
-                     ('Energy level', capfirst(upload.adoption.energy_level)),
-                     ('Bonded with', format_bonded_with_field(upload.adoption.bonded_with.all())),
-                     ('ID', upload.adoption.internal_id),
-                     ('Adoption fee', format_currency(upload.adoption.adoption_fee, exact=False)))
-    boolean_answers = get_adoption_boolean_answers(upload.adoption, merged_fields[1][1])
-    return merged_fields, boolean_answers
-
-# 6.1.1 For the Adoption record, the Sex label will use merged strings for the sex field and the spay/neuter field.
-# Input: An Adoption record. Output: The string for the merged field.
-def get_adoption_merged_sex_field(record):
-    sex = capfirst(record.sex)
-    if 'spayed or neutered' in record.has_been:
-        if sex == 'Male':
-            sex = sex + ', neutered'
-        else:
-            if sex == 'Female':
-                sex = sex + ', spayed'
-    return sex
-
-# 6.1.2 The City label will use merged strings for the city, state or province, and ZIP or postal code. These three fields are currently required.
-# Input: An Upload record. Output: The string for the merged field.
-def get_city_merged_field(upload):
-    try:
-        uploader_address = UserContact.objects.get(account=upload.uploader).address
-        return uploader_address.city + ", " + uploader_address.state_or_province + " (" + uploader_address.zip_code + ")"
-    except UserContact.DoesNotExist:
-        return ''
-
-# 6.1.3 The Breed label will use merged strings for the breed field and the hair length field.
-# Input: An Adoption, Lost, or Found record. Output: The string for the merged field.
-def get_merged_breed_field(record):
-    breed = ''
-    if record.subtype1 == '':
-        # Strictly speaking, not all cats for which the breed option is left blank will be a mix, but most shelters write 'Domestic ___ Hair'
-        # for all cats, and the term means the cat is a mix. Even though writing "Mix" at the beginning would be clearer, some cat owners might
-        # take exception to their cat being a mix when they didn't explicitly indicate it. So, I left "Mix, " off the beginning.
-        if record.hair_length == 'short':
-            breed = 'Domestic Short Hair'
-        elif record.hair_length == 'medium':
-            breed = 'Domestic Medium Hair'
-        else:
-            if record.hair_length == 'long':
-                breed = 'Domestic Long Hair'
-    else:
-        breed = record.subtype1
-        if record.hair_length == 'short':
-            breed = breed + " with " + 'short hair'
-        elif record.hair_length == 'medium':
-            breed = breed + " with " + 'medium hair'
-        else:
-            if record.hair_length == 'long':
-                breed = breed + " with " + 'long hair'
-    return breed
-
-# 6.1.4 The Coat description label will use merged strings for the Pattern field, the Color 1 field, the Color 2 field, the fields related to tortoiseshell (multicolor) cats,
-# and the 'socks' option under "Other physical characteristics".
-# Input: An Adoption, Lost, or Found record. Output: The string for the merged field.
-def get_coat_description_field(record):
-    coat_description = ''
-    if record.pattern == '' and record.color1 != '':
-        coat_description = capfirst(record.color1)
-        if record.color2 != '':
-            # Validate later that the first color field is filled out if the second field is filled out.
-            coat_description = coat_description + " and " + record.color2
-    elif record.pattern == 'solid':
-        # If 'solid' is selected, validate later that the second color field isn't filled out.
-        if record.color1 == '':
-            coat_description = 'Solid'
-        else:
-            coat_description = 'Solid' + record.color1
-    elif record.pattern == 'tuxedo':
-        # If a bicolor pattern is selected, validate later that both color fields are filled out.
-        if record.color1 == '':
-            coat_description = 'Tuxedo'
-        else:
-            if record.color1 == 'black' and record.color2 == 'white':
-                coat_description = 'Black and white tuxedo cat'
-            else:
-                coat_description = capfirst(record.color1) + " and " + record.color2 + " in a tuxedo pattern"
-    elif record.pattern == 'Van':
-        if record.color1 == '' or record.color1 == 'white':
-            coat_description = 'Mostly white except for the head and tail'
-        else:
-            coat_description = capfirst(record.color1) + ' and ' + record.color2 + ', mostly ' + record.color1 + ' except for the head and tail'
-    elif record.pattern == 'other bicolor':
-        if record.color1 == '':
-            coat_description = 'Bicolor'
-        else:
-            coat_description = capfirst(record.color1)
-            if record.color2 != '':
-                coat_description = coat_description + " and " + record.color2
-    elif record.pattern == 'tabby stripes':
-        if record.color1 == '' and record.color2 == '':
-            coat_description = 'Tabby'
-        else:
-            coat_description = capfirst(record.color1)
-            if record.color2 != '':
-                coat_description = coat_description + ' and ' + record.color2 + 'tabby'
-            else:
-                coat_description = coat_description + ' tabby'
-    elif record.pattern == 'spotted':
-        if record.color1 == '' and record.color2 == '':
-            coat_description = 'Spotted'
-        else:
-            # This pattern is relatively rare, so it is the only one that places the pattern first in the coat description.
-            if record.color2 == '':
-                coat_description = "Spotted " + record.color1
-            else:
-                coat_description = "Spotted, " + record.color1 + " and " + record.color2
-    elif record.pattern == 'tortoiseshell':
-        if record.is_calico == None:
-            coat_description = 'Tortoiseshell (orange, black, and possibly white)'
-        elif record.is_calico == True:
-            coat_description = 'Calico (orange, black, and white)'
-        elif record.is_calico == False:
-            coat_description = 'Orange and black (tortoiseshell) without any white'
-        if record.has_tabby_stripes == True:
-            coat_description = coat_description + ", with tabby stripes"
-        else:
-            if record.has_tabby_stripes == False:
-                coat_description = coat_description + ", without tabby stripes"
-        if record.is_dilute == True:
-            coat_description = coat_description + ". " + "The color is dilute, or desaturated like watercolors."
-        else:
-            if record.is_dilute == False:
-                coat_description = coat_description + ". " + "The color is intense or saturated."
-    if 'socks' in record.other_physical and record.__class__.__name__ != 'Adoption':
-        # If the cat has white paws, and this is a Lost or Found upload, then mention it in the coat description.
-        # If this is an Adoption upload, then the socks option is only used while searching.
-        # When displaying the record, there isn't a need to be that precise.
-        socks_sentence = capfirst(record.possessive_pronoun()) + " paws are white like socks."
-        if coat_description == '':
-            coat_description = socks_sentence
-        else:
-            if coat_description.endswith("."):
-                coat_description = coat_description + " " + socks_sentence
-            else:
-                coat_description = coat_description + ". " + socks_sentence
-    return coat_description
-
-# 6.1.5 The 'Age' label will merge the field for the age rating (using four qualitiative terms) with the fields for the numerical age in months or years.
-# Input: An Adoption, Lost, or Found record. Output: The string for the merged field.
-def get_merged_age_field(record):
-    age = ''
-    if record.age_rating != '':
-        age = age + capfirst(record.age_rating)
-        if record.precise_age != None:
-            age = age + ", " + str(int(record.precise_age)) + " " + record.age_units
-            # Later, validate that if the user has filled out the numerical age, that the user has also chosen a unit.
-    else:
-        if record.precise_age != None:
-            age = str(int(record.precise_age)) + " " + record.age_units
-    return age
-
-# 6.1.6 The 'Weight' label will merge the fields for the weight and its units.
-# Input: An Adoption, Lost, or Found record. Output: The string for the merged field.
-def get_merged_weight_field(record):
-    weight = ''
-    if record.weight != None:
-        weight = str(int(record.weight)) + " " + record.weight_units
-    return weight
-
-# 6.1.7 Input: A queryset of records for adoptable animals with which this pet has bonded.
-# These are the pet's friends and relatives that would be better off taken to one home together when possible.
-# Output: HTML for links to each profile.
-# If the queryset contains no records, then return an empty string.
-def format_bonded_with_field(queryset):
-    if queryset == 'Meowseum.Adoption.None':
-        return ''
-    else:
-        list_of_links = []
-        for pet in queryset:
-            list_of_links = list_of_links + ['<a class="emphasized" href="../' + pet.upload.relative_url + '">'\
-                            + pet.pet_name + '</a>']
-        return mark_safe(humanize_list(list_of_links))
-
-# 6.1.8 Input: An Adoption record and the merged string corresponding to the label 'Sex'.
-# Output: A tuple of strings related to Boolean fields for which the user didn't answer a follow-up question. If there are no entries, the function returns None.
-def get_adoption_boolean_answers(record, sex):
-    boolean_answers = tuple()
-    if sex == '' and 'spayed or neutered' in record.has_been:
-        boolean_answers = boolean_answers + ('Spayed or neutered',)
-    if 'house trained' in record.has_been:
-        boolean_answers = boolean_answers + ('House trained',)
-    if 'declawed' in record.has_been:
-        boolean_answers = boolean_answers + ('Declawed',)
-    if 'vaccinated' in record.has_been:
-        boolean_answers = boolean_answers + ('Vaccinations up to date',)
-    if 'microchipped' in record.has_been:
-        boolean_answers = boolean_answers + ('Microchipped',)
-    if 'tested and treated for worms, ticks, and fleas' in record.has_been:
-        boolean_answers = boolean_answers + ('Tested and treated for worms, ticks, and fleas',)
-
-    if boolean_answers == tuple():
-        # If the tuple is still empty, then store "None" instead so that the condition for showing the field will be clearer.
-        boolean_answers = None
-    return boolean_answers
-
-# 6.2. For an Upload record in the Lost category, merge all the related fields and omit the fields without any relevant information.
-# Input: An Upload record. Output: merged_fields, boolean_answers.
-def format_lost_record_for_display(upload):
-    microchip_ID, tattoo_ID = get_microchip_or_tattoo_ID(upload.lost)
-    merged_fields = (('Name', upload.lost.pet_name),
-                     ('Sex', get_lost_merged_sex_field(upload.lost)),
-                     ('City', get_city_merged_field(upload)),
-                     ('Location description', upload.lost.location),
-                     ('Collar', get_collar_merged_field(upload.lost)),
-                     ('Microchip ID', microchip_ID),
-                     ('Tattoo ID', tattoo_ID),
-                     ('Breed', get_merged_breed_field(upload.lost)),
-                     ('Coat description', get_coat_description_field(upload.lost)),
-                     ('Eye color', get_merged_eye_color_field(upload.lost)),
-                     ('Nose color', capfirst(humanize_list(upload.lost.nose_color))),
-                     ('Other special characteristics', get_merged_other_special_characteristics_field(upload.lost)),
-                     ('Disabilities', capfirst(humanize_list(upload.lost.disabilities, ""))),
-                     ('Age', get_merged_age_field(upload.lost)),
-                     ('Weight', get_merged_weight_field(upload.lost)),
-                     ('Reward', format_currency(upload.lost.reward, exact=False)))
-    boolean_answers = get_lost_boolean_answers(upload.lost, merged_fields[4][1], merged_fields[1][1])
-    return merged_fields, boolean_answers
-
-# 6.2.1 For the Lost record, the Sex label will use merged strings for the sex field, the spay/neuter field, and the spay/neuter tattoo field.
-# Input: A Lost record. Output: The string for the merged field.
-def get_lost_merged_sex_field(record):
-    sex = capfirst(record.sex)
-    if 'spayed or neutered' in record.yes_or_no_questions:
-        if sex == 'Male':
-            sex = sex + ', neutered'
-            if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
-                sex = sex + '. Has a neuter tattoo.'
-        else:
-            if sex == 'Female':
-                sex = sex + ', spayed'
-                if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
-                    sex = sex + '. Has a spay tattoo.'
-    return sex
-
-# 6.2.2 The Collar label will use merged strings for the collar color field and the collar description field.
-# Input: A Lost or Found record. Output: The string for the merged field.
-def get_collar_merged_field(record):
-    collar = ''
-    if 'has a collar' in record.yes_or_no_questions:
-        if record.collar_description != '':
-            if record.collar_color != '':
-                # If the user has filled out both the "Collar color" and "Collar description" fields, then append the collar color to the description.
-                # Use only the "Collar description" field.
-                collar = capfirst(record.collar_color) + ". " + record.collar_description
-            else:
-                collar = record.collar_description
-        else:
-            if record.collar_color != '':
-                # If the user has filled out the "Collar color" field but not the "Collar description" field, then use it instead.
-                collar = capfirst(record.collar_color)
-    return collar
-
-# 6.2.3 Return the data for the 'Microchip ID' and 'Tattoo ID' labels.
-# Input: A Lost record. Output: A string for the microchip ID and a string for the tattoo ID. The site assumes having a microchip and a serial number tattoo are mutually
-# exclusive for simplicity, because most sites talk about it in terms of the pros and cons of one or the other. So, at least one of the two outputs will always be an empty string.
-def get_microchip_or_tattoo_ID(record):
-    microchip_ID = ''
-    tattoo_ID = ''
-    if record.microchip_or_tattoo_ID != '':
-        if 'microchipped' in record.yes_or_no_questions:
-            microchip_ID = record.microchip_or_tattoo_ID
-        else:
-            tattoo_ID = record.microchip_or_tattoo_ID
-    return microchip_ID, tattoo_ID
-
-# 6.2.4 The Eye color label will use the merged fields "eye color", "eye color - other", and the heterochromia option under "other physical features".
-# Input: A Lost or Found record. Output: The string for the merged field.
-def get_merged_eye_color_field(record):
-    eye_color = capfirst(record.eye_color)
-    # Later, validate against the user checking a radio button that indicates the cat has eyes of one color, while also checking Heterochromia.
-    if eye_color == '':
-        if record.eye_color_other != '':
-            eye_color = capfirst(record.eye_color_other)
-            # If the cat has heterochromia and the user has filled out this field, then I'm trusting the user has mentioned it.
-        else:
-            if 'heterochromia' in record.other_physical:
-                eye_color = 'Has a different eye color in each eye.'
-    return eye_color
-
-# 6.2.5 The 'Other special characteristics' label will merge the 'Other special characteristics' field with data concerning whether the user checked "Bobtail" or "Polydactyl".
-# Input: A Lost or Found record. Output: The string for the merged field.
-def get_merged_other_special_characteristics_field(record):
-    other_special_characteristics = record.other_special_markings
-    if other_special_characteristics != '':
-        if 'bobtail' in record.other_physical:
-            "Bobtail. " + other_special_characteristics
-        if 'polydactyl' in record.other_physical:
-            "Polydactyl (more than five toes on at least one paw). " + other_special_characteristics
-    return other_special_characteristics
-
-# 6.2.6 Input: A Lost record and the merged strings with the labels 'Sex' and 'Collar'.
-# Output: A tuple of strings related to Boolean fields for which the user didn't answer a follow-up question. If there are no entries, the function returns None.
-def get_lost_boolean_answers(record, collar, sex):
-    boolean_answers = tuple()
-    if collar == '' and 'has a collar' in record.yes_or_no_questions:
-        boolean_answers = boolean_answers + ('Has a collar',)
-    if record.microchip_or_tattoo_ID == '':
-        if 'microchipped' in record.yes_or_no_questions:
-            boolean_answers = boolean_answers + ('Microchipped',)
-        if 'has a tattoo of a serial number' in record.yes_or_no_questions:
-            boolean_answers = boolean_answers + ('Has a tattoo of a serial number',)
-    if sex == '' and 'spayed or neutered' in record.yes_or_no_questions:
-        if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
-            boolean_answers = boolean_answers + ('Spayed or neutered, with a spay or neuter tattoo',)
-        else:
-            boolean_answers = boolean_answers + ('Spayed or neutered',)
-    if boolean_answers == tuple():
-        # If the tuple is still empty, then store "None" instead so that the condition for showing the field will be clearer.
-        boolean_answers = None
-
-    return boolean_answers
-
-# 6.3. For an Upload record in the Found category, merge all the related fields and omit the fields without any relevant information.
-# Input: An Upload record. Output: merged_fields, boolean_answers.
-def format_found_record_for_display(upload):
-    merged_fields = (('Name', upload.found.pet_name),
-                     ('Sex', get_found_merged_sex_field(upload.found)),
-                     ('City', get_city_merged_field(upload)),
-                     ('Location description', upload.found.location),
-                     ('Collar', get_collar_merged_field(upload.found)),
-                     ('Breed', get_merged_breed_field(upload.found)),
-                     ('Coat description', get_coat_description_field(upload.found)),
-                     ('Eye color', get_merged_eye_color_field(upload.found)),
-                     ('Nose color', capfirst(humanize_list(upload.found.nose_color))),
-                     ('Other special characteristics', get_merged_other_special_characteristics_field(upload.found)),
-                     ('Disabilities', capfirst(humanize_list(upload.found.disabilities, ""))),
-                     ('Age', get_merged_age_field(upload.found)),
-                     ('Weight', get_merged_weight_field(upload.found)),
-                     ('ID', upload.found.internal_id))
-    boolean_answers = get_found_boolean_answers(upload.found, merged_fields[4][1], merged_fields[1][1])
-    return merged_fields, boolean_answers
-
-# 6.3.1 For the Found record, the Sex label will use merged strings for the sex field and the spay/neuter tattoo field.
-# Input: A Found record. Output: The string for the merged field.
-def get_found_merged_sex_field(record):
-    sex = capfirst(record.sex)
-    if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
-        if sex == 'Male':
-            sex = sex + ', neutered'
-        else:
-            if sex == 'Female':
-                sex = sex + ', spayed'
-    return sex
-
-# 6.3.2 Input: A Found record and the merged strings with the labels 'Sex' and 'Collar'.
-# Output: A tuple of strings related to Boolean fields for which the user didn't answer a follow-up question. If there are no entries, the function returns None.
-def get_found_boolean_answers(record, collar, sex):
-    boolean_answers = tuple()
-    if collar == '' and 'has a collar' in record.yes_or_no_questions:
-        boolean_answers = boolean_answers + ('Has a collar',)
-    if sex == '' and 'spayed or neutered' in record.yes_or_no_questions:
-        if 'has a spay or neuter tattoo' in record.yes_or_no_questions:
-            boolean_answers = boolean_answers + ('Spayed or neutered',)
-    if 'no microchip detected during scan' in record.yes_or_no_questions:
-        boolean_answers = boolean_answers + ('No microchip detected during scan',)
-    if record.is_sighting:
-        boolean_answers = booplan_answers + ("This is a sighting report. The uploader doesn't have the cat right now.",)
-    if boolean_answers == tuple():
-        # If the tuple is still empty, then store "None" instead so that the condition for showing the field will be clearer.
-        boolean_answers = None
-
-    return boolean_answers
@@ -7,10 +7,8 @@ from django.core.exceptions import PermissionDenied
 from django.contrib.auth.models import User
 from Meowseum.models import Upload, hosting_limits_for_Upload, Tag, Like, Shelter, UserContact
 from Meowseum.forms import UploadPage1
-import os
-from django.conf import settings
-from Meowseum.file_handling.CustomStorage import get_valid_file_name
-from Meowseum.file_handling.file_utility_functions import make_unique_with_random_id_suffix_within_character_limit, file_name_and_url_will_be_unique, move_file
+from Meowseum.file_handling.CustomStorage import get_valid_file_name, is_content_addressed_file_name
+from Meowseum.file_handling.file_utility_functions import make_unique_with_random_id_suffix_within_character_limit, file_name_and_url_will_be_unique, url_will_be_unique, rename_stored_file, rename_stored_renditions, rename_stored_directory
 
 # 0. Main function.
 @login_required
@@ -39,6 +37,7 @@ def page(request):
                    'heading': 'Uploading ' + upload.metadata.original_file_name + upload.metadata.original_extension,
                    'upload_directory': Upload.UPLOAD_TO,
                    'poster_directory': hosting_limits_for_Upload['poster_directory'],
+                   'hls_directory': hosting_limits_for_Upload['hls_ladder'][2],
                    'has_contact_information': request.user.user_profile.has_contact_information()}
         return render(request, 'en/public/upload_page1.html', context)
 
@@ -92,52 +91,68 @@ def get_tags_from_tag_form(string):
 
 # 2. Rename the upload's file using up to 182 of the first characters of its title. If the file name already exists, then add an underscore and 7-character random ID
 # to the end, replacing characters of the title if it is needed to stay within the limit. This function also accounts for the underscore-using, file name-based URL needing to be unique.
+# Files with content-addressed names aren't renamed. Only the URL is updated.
 def rename_upload_file(upload, poster_directory):
-    # Obtain all the strings that will be used for renaming.
-    upload_directory_name = os.path.split(upload.file.name)[0]
-    upload_directory_path = os.path.join(settings.MEDIA_PATH, upload_directory_name)
+    if is_content_addressed_file_name(upload.metadata.file_name):
+        upload.relative_url = get_new_file_name(upload, url_will_be_unique).replace(" ","_")
+        upload.save()
+        return
+
+    # Obtain all the strings that will be used for renaming. Names in media storage use forward slashes on every OS.
+    upload_directory_name = Upload.UPLOAD_TO
     old_file_name = upload.metadata.file_name
     extension = upload.metadata.extension
     new_file_name = get_new_file_name(upload)
     old_full_file_name = old_file_name + extension
     new_full_file_name = new_file_name + extension
     
-    # Rename the file in the OS.
-    old_absolute_path = os.path.join(upload_directory_path, old_full_file_name)
-    new_absolute_path = os.path.join(upload_directory_path, new_full_file_name)
-    os.rename(old_absolute_path, new_absolute_path)
+    # Rename the file in media storage.
+    old_name = upload_directory_name + '/' + old_full_file_name
+    new_name = upload_directory_name + '/' + new_full_file_name
+    rename_stored_file(old_name, new_name)
+    rename_stored_renditions(old_name, new_name)
     # If the file is for a <video>, then rename its poster.
     if upload.metadata.mime_type.startswith('video'):
-        old_poster_path = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO, poster_directory, old_file_name + '.jpg')
-        new_poster_path = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO, poster_directory, new_file_name + '.jpg')
-        os.rename(old_poster_path, new_poster_path)
+        old_poster_name = upload_directory_name + '/' + poster_directory + '/' + old_file_name + '.jpg'
+        new_poster_name = upload_directory_name + '/' + poster_directory + '/' + new_file_name + '.jpg'
+        rename_stored_file(old_poster_name, new_poster_name)
+        rename_stored_renditions(old_poster_name, new_poster_name)
         
-    # If a thumbnail exists in the OS, then rename the thumbnail.
+    # If a thumbnail exists, then rename the thumbnail.
     if upload.metadata.width > 600:
         thumbnail_directory = hosting_limits_for_Upload['thumbnail'][2]
-        old_thumbnail_path = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO, thumbnail_directory, old_full_file_name)
-        new_thumbnail_path = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO, thumbnail_directory, new_full_file_name)
-        os.rename(old_thumbnail_path, new_thumbnail_path)
+        old_thumbnail_name = upload_directory_name + '/' + thumbnail_directory + '/' + old_full_file_name
+        new_thumbnail_name = upload_directory_name + '/' + thumbnail_directory + '/' + new_full_file_name
+        rename_stored_file(old_thumbnail_name, new_thumbnail_name)
+        rename_stored_renditions(old_thumbnail_name, new_thumbnail_name)
         # If the file is for a <video>, then rename its thumbnail's poster.
         if upload.metadata.mime_type.startswith('video'):
-            old_poster_thumbnail_path = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO, poster_directory, thumbnail_directory, old_file_name + '.jpg')
-            new_poster_thumbnail_path = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO, poster_directory, thumbnail_directory, new_file_name + '.jpg')
-            os.rename(old_poster_thumbnail_path, new_poster_thumbnail_path)
+            old_poster_thumbnail_name = upload_directory_name + '/' + poster_directory + '/' + thumbnail_directory + '/' + old_file_name + '.jpg'
+            new_poster_thumbnail_name = upload_directory_name + '/' + poster_directory + '/' + thumbnail_directory + '/' + new_file_name + '.jpg'
+            rename_stored_file(old_poster_thumbnail_name, new_poster_thumbnail_name)
+            rename_stored_renditions(old_poster_thumbnail_name, new_poster_thumbnail_name)
 
-    old_exif_path = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO, 'metadata', old_file_name + '.dat')
-    new_exif_path = os.path.join(settings.MEDIA_PATH, Upload.UPLOAD_TO, 'metadata', new_file_name + '.dat')
-    move_file(old_exif_path, new_exif_path)
+    # If the video has an HLS ladder, then rename the directory containing its playlists and segments.
+    hls_directory = hosting_limits_for_Upload['hls_ladder'][2]
+    rename_stored_directory(upload_directory_name + '/' + hls_directory + '/' + old_file_name, upload_directory_name + '/' + hls_directory + '/' + new_file_name)
+    # If the video has a hover preview, then rename it.
+    if upload.metadata.has_hover_preview:
+        hover_preview_directory = hosting_limits_for_Upload['hover_preview'][2]
+        rename_stored_file(upload_directory_name + '/' + hover_preview_directory + '/' + old_file_name + '.mp4',
+                           upload_directory_name + '/' + hover_preview_directory + '/' + new_file_name + '.mp4')
+    # Uploads from before EXIF data was stored in the database may still have it in a separate file, until the import_exif_data command has been run. The
+    # command finds the upload by the file's name, so the file is renamed along with the upload.
+    rename_stored_file(upload_directory_name + '/metadata/' + old_file_name + '.dat', upload_directory_name + '/metadata/' + new_file_name + '.dat')
 
     # Rename the file in Django's database.
-    new_relative_path = os.path.join(upload_directory_name, new_file_name + extension).replace('\\','/') # This is the part of the path after /media/.
-    upload.file.name = new_relative_path
+    upload.file.name = new_name # This is the part of the path after /media/.
     upload.relative_url = new_file_name.replace(" ","_")
     upload.save()
     upload.metadata.file_name = new_file_name
     upload.metadata.save()
 
-# 2.1 Return the new name for the file.
-def get_new_file_name(upload):
+# 2.1 Return the new name for the file. Input: upload record. is_unique, the function for checking whether a name is taken. Output: string
+def get_new_file_name(upload, is_unique=file_name_and_url_will_be_unique):
     hypothetical_file_name = upload.title
     # Remove characters that are unsupported in a common operating system or may lead to security vulnerabilities.
     hypothetical_file_name = get_valid_file_name(hypothetical_file_name)
@@ -146,7 +161,7 @@ def get_new_file_name(upload):
         # make_unique_with_random_id_suffix_within_character_limit() returns a random ID if passed an empty string. 
         # Reset the underscore to an empty string, with the effect of disallowing '_' as a file name.
         hypothetical_file_name = ''
-    return make_unique_with_random_id_suffix_within_character_limit(hypothetical_file_name, 178, file_name_and_url_will_be_unique, upload)
+    return make_unique_with_random_id_suffix_within_character_limit(hypothetical_file_name, 178, is_unique, upload)
 
 # 3. After successfully processing the form, redirect to the homepage or the next page of the form if there is one.
 # Input: upload_type, a string for the category. relative_url, a string which will be used when the upload is in the Pets category.
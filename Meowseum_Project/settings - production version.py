@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 """
 
 import os
+import mimetypes
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -140,9 +141,33 @@ MEDIA_PATH = MEDIA_ROOT
 if os.name == 'nt':
     MEDIA_PATH = MEDIA_PATH.replace('/','\\')
 
+# Where uploads and their associated files are kept after processing. 'local' keeps them in MEDIA_ROOT. 's3' keeps them in a bucket, so that several web servers
+# can share them, and the remaining keys describe the bucket. ENDPOINT_URL is None for Amazon S3, or the URL of an S3-compatible server, such as
+# 'http://localhost:9000' for a local MinIO or moto server. When PRESIGNED_URLS is True, the bucket can be private, and requests for MEDIA_URL are redirected
+# to signed links which expire after URL_EXPIRATION seconds. Otherwise, set MEDIA_URL to the bucket's PUBLIC_URL. Files larger than MULTIPART_THRESHOLD bytes
+# are uploaded in parts of MULTIPART_CHUNKSIZE bytes, MAX_CONCURRENCY parts at a time.
+MEDIA_STORAGE = {
+    'BACKEND': 'local',
+    'BUCKET_NAME': 'meowseum-media',
+    'PREFIX': '',
+    'ENDPOINT_URL': None,
+    'REGION_NAME': None,
+    'ACCESS_KEY_ID': None,
+    'SECRET_ACCESS_KEY': None,
+    'PRESIGNED_URLS': True,
+    'URL_EXPIRATION': 3600,
+    'PUBLIC_URL': '',
+    'CACHE_CONTROL': 'max-age=86400',
+    'MULTIPART_THRESHOLD': 8388608,
+    'MULTIPART_CHUNKSIZE': 8388608,
+    'MAX_CONCURRENCY': 4,
+}
+
 # Settings for CustomStorage.
 ALLOW_SPACES = False
 ALLOW_NON_UNICODE_ALPHANUMERIC = True
+# Store new uploads under the hash of their contents, sharded into subdirectories, instead of under their titles. Existing uploads keep working either way.
+CONTENT_ADDRESSED_STORAGE = True
 
 # This block will be used by the custom field MetadataRestrictedFileField for validating files. Additionally, if the file's extension doesn't match
 # that which is preferred for its MIME type, but the file is supported and in the same media category (image or video), then the validation program
@@ -199,7 +224,16 @@ for key in MIME_TYPES_AND_PREFERRED_EXTENSIONS:
         if key.startswith('video'):
             CONVERTIBLE_VIDEO_TYPES = CONVERTIBLE_VIDEO_TYPES + (key,)
 
-JHEAD_PATH = r'/home/raincloud/Environments/Django1.9/django_programs/jhead-3.00/jhead'
+# These are the lighter-weight image formats which stage 2 processing can save alongside each image, thumbnail, and poster, so that browsers which
+# support them download fewer bytes. They aren't accepted as upload formats, so a rendition's extension won't collide with the file it was made from.
+# The 'renditions' key of the hosting limits dictionary determines which of these formats are actually produced and in which order they are preferred.
+RENDITION_TYPES_AND_PREFERRED_EXTENSIONS = {
+    'image/avif': '.avif',
+    'image/webp': '.webp'
+}
+# Register the file types of HLS playlists and segments, because some operating systems don't include them in the registry which the static file views use.
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
 
 # Database
 # https://docs.djangoproject.com/en/1.9/ref/settings/#databases
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import sys
+import mimetypes
 import warnings
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -41,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    # This is first, so that it counts the queries of all the other middleware.
+    'Meowseum.middleware.query_counting_middleware.QueryCountingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -138,9 +142,98 @@ MEDIA_PATH = MEDIA_ROOT
 if os.name == 'nt':
     MEDIA_PATH = MEDIA_PATH.replace('/','\\')
 
+# Where uploads and their associated files are kept after processing. 'local' keeps them in MEDIA_ROOT. 's3' keeps them in a bucket, so that several web servers
+# can share them, and the remaining keys describe the bucket. ENDPOINT_URL is None for Amazon S3, or the URL of an S3-compatible server, such as
+# 'http://localhost:9000' for a local MinIO or moto server. When PRESIGNED_URLS is True, the bucket can be private, and requests for MEDIA_URL are redirected
+# to signed links which expire after URL_EXPIRATION seconds. Otherwise, set MEDIA_URL to the bucket's PUBLIC_URL. Files larger than MULTIPART_THRESHOLD bytes
+# are uploaded in parts of MULTIPART_CHUNKSIZE bytes, MAX_CONCURRENCY parts at a time.
+MEDIA_STORAGE = {
+    'BACKEND': 'local',
+    'BUCKET_NAME': 'meowseum-media',
+    'PREFIX': '',
+    'ENDPOINT_URL': None,
+    'REGION_NAME': None,
+    'ACCESS_KEY_ID': None,
+    'SECRET_ACCESS_KEY': None,
+    'PRESIGNED_URLS': True,
+    'URL_EXPIRATION': 3600,
+    'PUBLIC_URL': '',
+    'CACHE_CONTROL': 'max-age=86400',
+    'MULTIPART_THRESHOLD': 8388608,
+    'MULTIPART_CHUNKSIZE': 8388608,
+    'MAX_CONCURRENCY': 4,
+}
+
+# Settings for QueryCountingMiddleware, which counts each request's database queries and records the totals for each view on the site statistics page.
+# When WARN_N_PLUS_ONE is True, a warning is logged whenever a request runs the same query with different values at least N_PLUS_ONE_THRESHOLD times, which
+# usually means a query in a loop. When ENFORCE_BUDGETS is True, as it is while running tests, a view that runs more queries than the budget declared with
+# @query_budget raises QueryBudgetExceeded. The totals are saved to the database at most once per FLUSH_INTERVAL seconds.
+QUERY_COUNTING = {
+    'ENABLED': True,
+    'WARN_N_PLUS_ONE': DEBUG,
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'ENFORCE_BUDGETS': 'test' in sys.argv,
+    'FLUSH_INTERVAL': 60,
+    # The fraction of requests whose queries are counted, from 0 to 1. Every request is counted while budgets are enforced.
+    'SAMPLE_RATE': 1,
+}
+
+# Settings for the full-page cache of the front page and public galleries for logged-out users, in anonymous_page_cache.py. A page is served from the cache for
+# FRESH_SECONDS after it's rendered. For STALE_SECONDS after that, or after an upload is saved or deleted, it's still served while one worker renders it again,
+# so that the workers don't all render the same page at once. A worker renders it again for at most REGENERATION_LOCK_SECONDS before another may try. When a
+# page isn't cached at all, the other workers wait up to COLD_WAIT_SECONDS for the first one to render it, and then render it themselves. Each waiting request
+# holds a worker thread, so keep it well under a second. CACHE is
+# the name of the cache in CACHES to use. With the default local memory cache, each worker process keeps its own copy of each page, so a cache shared between
+# processes, like memcached, makes better use of it.
+ANONYMOUS_PAGE_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'FRESH_SECONDS': 60,
+    'STALE_SECONDS': 600,
+    'REGENERATION_LOCK_SECONDS': 30,
+    'COLD_WAIT_SECONDS': 0.25,
+}
+
+# Settings for the cache of values derived from the database, in model_cache.py. A value is kept for at most TIMEOUT seconds, which also limits how long a worker
+# process can show a value changed by another process if an invalidation event doesn't reach it. The popular tag names are ranked again every
+# POPULAR_TAGS_REFRESH_SECONDS. CACHE is the name of the cache in CACHES to use.
+MODEL_CACHE = {
+    'CACHE': 'model_cache',
+    'TIMEOUT': 3600,
+    'POPULAR_TAGS_REFRESH_SECONDS': 300,
+    'STATISTICS_FLUSH_INTERVAL': 60,
+}
+
+# Settings for the bus in invalidation_bus.py, which tells every worker process when its cached values are stale. TRANSPORT is 'postgres', which sends events
+# with NOTIFY and LISTENs for them on CHANNEL, or 'local', which only reaches the process that sent the event and is used while running tests. A listening
+# process checks its connection at least every POLL_SECONDS, and waits RECONNECT_SECONDS after losing it before reconnecting.
+INVALIDATION_BUS = {
+    'TRANSPORT': 'local' if 'test' in sys.argv else 'postgres',
+    'CHANNEL': 'meowseum_invalidation',
+    'POLL_SECONDS': 30,
+    'RECONNECT_SECONDS': 5,
+}
+
+# The caches. By default, each worker process has its own local memory caches. When the site runs in more than one process, set SHARED_CACHE_LOCATION to the
+# address of a memcached server, like '127.0.0.1:11211', so that the processes share their cached pages and values and see each other's invalidations. Tests
+# always use local memory caches, so that they don't depend on a running server or on each other's cached values.
+SHARED_CACHE_LOCATION = ''
+if SHARED_CACHE_LOCATION != '' and 'test' not in sys.argv:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache', 'LOCATION': SHARED_CACHE_LOCATION, 'KEY_PREFIX': 'pages'},
+        'model_cache': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache', 'LOCATION': SHARED_CACHE_LOCATION, 'KEY_PREFIX': 'models'},
+    }
+else:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages'},
+        'model_cache': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'models'},
+    }
+
 # Settings for CustomStorage.
 ALLOW_SPACES = False
 ALLOW_NON_UNICODE_ALPHANUMERIC = True
+# Store new uploads under the hash of their contents, sharded into subdirectories, instead of under their titles. Existing uploads keep working either way.
+CONTENT_ADDRESSED_STORAGE = True
 
 # This block will be used by the custom field MetadataRestrictedFileField for validating files.
 # If the file's extension doesn't match that which is preferred for its MIME type, but the file is supported and in the same media category (image or
@@ -197,7 +290,16 @@ for key in MIME_TYPES_AND_PREFERRED_EXTENSIONS:
         if key.startswith('video'):
             CONVERTIBLE_VIDEO_TYPES = CONVERTIBLE_VIDEO_TYPES + (key,)
 
-JHEAD_PATH = r'C:\Program Files (x86)\Python35-32\Lib\site-packages_editable\jhead.exe'
+# These are the lighter-weight image formats which stage 2 processing can save alongside each image, thumbnail, and poster, so that browsers which
+# support them download fewer bytes. They aren't accepted as upload formats, so a rendition's extension won't collide with the file it was made from.
+# The 'renditions' key of the hosting limits dictionary determines which of these formats are actually produced and in which order they are preferred.
+RENDITION_TYPES_AND_PREFERRED_EXTENSIONS = {
+    'image/avif': '.avif',
+    'image/webp': '.webp'
+}
+# Register the file types of HLS playlists and segments, because some operating systems don't include them in the registry which the static file views use.
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
 
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases